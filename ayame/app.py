@@ -24,18 +24,25 @@
 #   SOFTWARE.
 #
 
+import gzip
+import io
 import locale
 import os
 import sys
+import zlib
 
 from . import _compat as five
-from . import (converter, core, http, i18n, local, markup, page, res, route,
-               session, uri, util)
-from .exception import AyameError, _Redirect
+from . import (cache, converter, core, http, i18n, local, markup, page, res,
+               route, session, store, uri, util)
+from .exception import AyameError, ResourceError, _Redirect
 
 
 __all__ = ['Ayame', 'Request']
 
+_UNSET = object()
+# negotiated locales for each Accept-Language
+_locales = util.LRUCache(256)
+
 
 class Ayame(object):
 
@@ -47,17 +54,35 @@ class Ayame(object):
             self._root = os.getcwd()
         session_dir = os.path.join(self._root, 'session')
         self.config = {
+            'ayame.choice.cache': util.LRUCache(64),
+            'ayame.compress': True,
+            'ayame.compress.cache': util.LRUCache(64),
+            'ayame.compress.level': 6,
+            'ayame.compress.min_size': 1024,
             'ayame.converter.registry': converter.ConverterRegistry(),
+            'ayame.form.max_field_size': 1 << 20,
+            'ayame.form.max_parts': 1000,
+            'ayame.form.max_size': 1 << 24,
+            'ayame.form.spool_size': 1 << 20,
             'ayame.i18n.cache': util.LRUCache(64),
             'ayame.i18n.localizer': i18n.Localizer(),
             'ayame.markup.cache': util.LRUCache(64),
+            'ayame.markup.deterministic_id': False,
             'ayame.markup.encoding': 'utf-8',
             'ayame.markup.loader': markup.MarkupLoader,
             'ayame.markup.pretty': False,
             'ayame.markup.renderer': markup.MarkupRenderer,
             'ayame.markup.separator': '.',
             'ayame.max.redirect': 7,
+            'ayame.page.cache': cache.OutputCache(256),
+            'ayame.page.error': util.LRUCache(64),
+            'ayame.page.etag': False,
             'ayame.page.http': page.HTTPStatusPage,
+            'ayame.page.partial': util.LRUCache(256),
+            'ayame.page.prototype': util.LRUCache(64),
+            'ayame.page.static': util.LRUCache(64),
+            'ayame.page.store': store.PageStore(os.path.join(self._root, 'page')),
+            'ayame.panel.cache': cache.OutputCache(256),
             'ayame.request': Request,
             'ayame.resource.loader': res.ResourceLoader(),
             'ayame.route.map': route.Map(),
@@ -87,6 +112,10 @@ class Ayame(object):
     def session(self):
         return self.context.session
 
+    @property
+    def request_cache(self):
+        return self.context.request_cache
+
     @property
     def _router(self):
         return self.context._router
@@ -97,28 +126,26 @@ class Ayame(object):
             ctx._router = self.config['ayame.route.map'].bind(environ)
             # dispatch
             o, values = ctx._router.match()
-            ctx.request = self.config['ayame.request'](environ, values)
-            ctx.session = session.get(self, environ)
-            for _ in five.range(self.config['ayame.max.redirect']):
-                try:
-                    status, headers, content = self.handle_request(o)
-                except _Redirect as r:
-                    if r.args[3] == _Redirect.PERMANENT:
-                        raise http.MovedPermanently(uri.application_uri(environ) +
-                                                    self.uri_for(*r.args[:3], relative=True)[1:])
-                    elif r.args[3] != _Redirect.INTERNAL:
-                        raise http.Found(uri.application_uri(environ) +
-                                         self.uri_for(*r.args[:3], relative=True)[1:])
-                    o = r.args[0]
-                    ctx.request.path = None
-                    continue
-                break
+            key = self.cache_key_for(o, values)
+            if key is not None:
+                # cached response
+                def render():
+                    status, headers, content = self.dispatch(o, values)
+                    return status, tuple(headers), tuple(content)
+
+                rv = self.config['ayame.page.cache'].fetch(key, render, o.cache_policy.ttl, _cacheable)
+                status, headers, content = rv[0], list(rv[1]), list(rv[2])
+                etag = [v for n, v in headers if n.lower() == 'etag']
+                if (etag and
+                    etag[0] in http.parse_etags(environ.get('HTTP_IF_NONE_MATCH'))):
+                    status = http.NotModified.status
+                    headers = [(n, v) for n, v in headers
+                               if n.lower() not in ('content-type', 'content-length')]
+                    content = []
             else:
-                raise AyameError('reached to the maximum number of internal redirects')
+                status, headers, content = self.dispatch(o, values)
+            headers, content = self.compress(status, headers, content, key is not None or ctx._static)
             exc_info = None
-            set_cookie = session.save(self, ctx.session)
-            if set_cookie:
-                headers.append(set_cookie)
         except Exception as e:
             status, headers, exc_info, content = self.handle_error(e)
         finally:
@@ -127,27 +154,221 @@ class Ayame(object):
         start_response(status, headers, exc_info)
         return content
 
+    def compress(self, status, headers, content, cacheable=False):
+        if not (self.config['ayame.compress'] and
+                status == http.OK.status):
+            return headers, content
+        elif not isinstance(content, (list, tuple)):
+            # iterables are sent as is
+            return headers, content
+        names = {n.lower(): v for n, v in headers}
+        if 'content-encoding' in names:
+            return headers, content
+        body = b''.join(content)
+        if len(body) < self.config['ayame.compress.min_size']:
+            return headers, content
+
+        headers = [(n, v) for n, v in headers if n.lower() != 'vary']
+        vary = names.get('vary')
+        headers.append(('Vary', vary + ', Accept-Encoding' if vary else 'Accept-Encoding'))
+        coding = _negotiate_coding(self.environ.get('HTTP_ACCEPT_ENCODING'))
+        if coding is None:
+            return headers, content
+        # reuse compressed bytes for cacheable content
+        if (cacheable or
+            'etag' in names):
+            cache = self.config['ayame.compress.cache']
+            key = (coding, util.token_of(body))
+            data = cache.get(key)
+            if data is None:
+                data = cache[key] = _compress(coding, body, self.config['ayame.compress.level'])
+        else:
+            data = _compress(coding, body, self.config['ayame.compress.level'])
+        headers = [(n, v) for n, v in headers if n.lower() != 'content-length']
+        headers.append(('Content-Encoding', coding))
+        headers.append(('Content-Length', str(len(data))))
+        return headers, [data]
+
+    def dispatch(self, object, values):
+        ctx = self.context
+        environ = ctx.environ
+        ctx.request = self.config['ayame.request'](environ, values)
+        ctx.session = session.get(self, environ)
+        for _ in five.range(self.config['ayame.max.redirect']):
+            try:
+                status, headers, content = self.handle_request(object)
+            except _Redirect as r:
+                if r.args[3] == _Redirect.PERMANENT:
+                    raise http.MovedPermanently(uri.application_uri(environ) +
+                                                self.uri_for(*r.args[:3], relative=True)[1:])
+                elif r.args[3] != _Redirect.INTERNAL:
+                    raise http.Found(uri.application_uri(environ) +
+                                     self.uri_for(*r.args[:3], relative=True)[1:])
+                object = r.args[0]
+                ctx.request.path = None
+                continue
+            break
+        else:
+            raise AyameError('reached to the maximum number of internal redirects')
+        set_cookie = session.save(self, ctx.session)
+        if set_cookie:
+            headers.append(set_cookie)
+        return status, headers, content
+
+    def cache_key_for(self, object, values):
+        if not (isinstance(object, type) and
+                issubclass(object, core.Page) and
+                object.cache_policy is not None):
+            return
+        environ = self.environ
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return
+        elif session.exists(self, environ):
+            # response might depend on the session
+            return
+        query = uri.parse_qs(environ)
+        if (core.AYAME_PATH in query or
+            core.AYAME_PAGE in query or
+            core.AYAME_PARTIAL in query or
+            core.AYAME_VALIDATE in query):
+            # component will be fired, rendered partially or validated
+            return
+        policy = object.cache_policy
+        key = [object]
+        if policy.values:
+            key.append(tuple(sorted(five.items(values))))
+        key.append(tuple(tuple(query.get(k, ())) for k in policy.query))
+        if policy.locale:
+            key.append(_parse_locales(environ))
+        key.append(tuple(environ.get('HTTP_' + n.upper().replace('-', '_')) for n in policy.headers))
+        return tuple(key)
+
     def handle_request(self, object):
         if isinstance(object, type):
             if issubclass(object, core.Page):
-                object = object()
-            else:
-                # type is callable, so it might cause unexpected error
-                object = None
+                return self.handle_page(object)
+            # type is callable, so it might cause unexpected error
+            object = None
         if callable(object):
             return object()
         raise http.NotFound(uri.request_path(self.environ))
 
+    def handle_page(self, class_):
+        static = self.config['ayame.page.static']
+        # False: not checked yet, None: not static
+        entry = static.get(class_, False)
+        if (entry is not None and
+            (self.request.partial or
+             self.request.validate)):
+            # rendered partially or validated
+            entry = None
+        if entry:
+            rv = self._static_response(class_, entry)
+            if rv is not None:
+                self.context._static = True
+                return rv
+            # markup is modified
+            entry = False
+        page = self.new_page(class_)
+        rv = page()
+        if page.stateful:
+            # invisible components are not detached while rendering
+            for c, _ in page.walk():
+                c.on_detach()
+            self.config['ayame.page.store'].put(self.session.sid, page.page_id, page)
+        elif (entry is False and
+              rv[0] == http.OK.status):
+            static[class_] = entry = self._static_entry(page, rv)
+            self.context._static = entry is not None
+        return rv
+
+    def _static_entry(self, page, rv):
+        status, headers, content = rv
+        if (any(n.lower() not in ('content-type', 'content-length', 'etag') for n, _ in headers) or
+            not page.is_static()):
+            return
+        class_ = page.__class__
+        path = page._markup_path_of(class_)
+        mtime = self.config['ayame.resource.loader'].load(class_, path).mtime
+        return (mtime, path, status, tuple(headers), tuple(content))
+
+    def _static_response(self, class_, entry):
+        mtime, path, status, headers, content = entry
+        try:
+            if self.config['ayame.resource.loader'].load(class_, path).mtime != mtime:
+                return
+        except ResourceError:
+            return
+        etag = [v for n, v in headers if n.lower() == 'etag']
+        if (etag and
+            etag[0] in http.parse_etags(self.environ.get('HTTP_IF_NONE_MATCH'))):
+            return http.NotModified.status, [('ETag', etag[0])], []
+        return status, list(headers), list(content)
+
+    def new_page(self, class_):
+        if class_.stateful:
+            store = self.config['ayame.page.store']
+            page_id = self.request.page_id
+            if page_id:
+                page = store.get(self.session.sid, page_id)
+                if page.__class__ is class_:
+                    page.on_restore()
+                    return page
+            if self.session.new:
+                # session cookie is required to restore pages
+                self.session.modified = True
+        if class_.prototype:
+            cache = self.config['ayame.page.prototype']
+            page = cache.get(class_)
+            if page is None:
+                page = cache[class_] = class_()
+            page = page.clone()
+        else:
+            page = class_()
+        if class_.stateful:
+            page.page_id = store.new_id()
+        return page
+
     def handle_error(self, error):
         if isinstance(error, http.HTTPStatus):
-            page = self.config['ayame.page.http'](error)
-            status, headers, content = page()
+            status, headers, content = self.render_error(error)
             exc_info = None
         else:
             status, headers, content = http.InternalServerError.status, [], []
             exc_info = sys.exc_info()
         return status, headers, exc_info, content
 
+    def render_error(self, error):
+        class_ = self.config['ayame.page.http']
+        if self.config['ayame.markup.pretty']:
+            # MarkupPrettifier may reformat description
+            return class_(error)()
+
+        request = self.context.request
+        locale = request.locale if request is not None else _parse_locales(self.environ)
+        key = (class_, error.status, bool(error.description), locale)
+        cache = self.config['ayame.page.error']
+        entry = cache.get(key)
+        if entry is None:
+            # render with placeholder for description
+            marker = u'ayame-description-' + util.new_token()
+            e = error.__class__.__new__(error.__class__)
+            e.__dict__.update(error.__dict__)
+            e.args = error.args
+            e.description = marker if error.description else u''
+            e.headers = []
+            status, headers, content = class_(e)()
+            parts = b''.join(content).split(marker.encode('utf-8'))
+            if len(parts) != (2 if error.description else 1):
+                return class_(error)()
+            entry = cache[key] = (status, tuple((n, v) for n, v in headers if n.lower() != 'content-length'),
+                                  tuple(parts))
+        status, headers, parts = entry
+        body = util.to_bytes(error.description).join(parts)
+        headers = list(error.headers) + list(headers)
+        headers.append(('Content-Length', str(len(body))))
+        return status, headers, [body]
+
     def forward(self, object, values=None, anchor=None):
         raise _Redirect(object, values, anchor, _Redirect.INTERNAL)
 
@@ -160,38 +381,105 @@ class Ayame(object):
 
 class Request(object):
 
-    __slots__ = ('environ', 'method', 'uri', 'query', 'form_data', 'path',
-                 'locale')
+    __slots__ = ('environ', 'method', 'uri', '_query', '_form_data', '_parts',
+                 '_path', '_page_id', '_partial', '_validate', '_locale')
 
     def __init__(self, environ, values):
         self.environ = environ
         self.method = environ['REQUEST_METHOD']
         self.uri = values
-        self.query = uri.parse_qs(environ)
-        self.form_data = http.parse_form_data(environ)
-        # retrieve ayame:path
-        if self.method == 'GET':
-            self.path = self.query.get(core.AYAME_PATH)
-        elif self.method == 'POST':
-            self.path = self.form_data.get(core.AYAME_PATH)
-        else:
-            self.path = None
-        if self.path:
-            self.path = self.path[0]
-        self.locale = self._parse_locales(environ)
-
-    def _parse_locales(self, environ):
-        values = http.parse_accept(environ.get('HTTP_ACCEPT_LANGUAGE'))
-        if values:
-            v = values[0][0]
-            sep = '-'
-        else:
-            v = locale.getdefaultlocale()[0]
-            sep = '_'
-        if v:
-            v = v.split(sep, 1)
-            return (v[0].lower(), v[1].upper() if 1 < len(v) else None)
-        return (None,) * 2
+        # query, form data, ayame:* values and locale are parsed lazily
+        self._query = self._form_data = self._parts = None
+        self._path = self._page_id = self._partial = self._validate = _UNSET
+        self._locale = None
+
+    @property
+    def query(self):
+        if self._query is None:
+            self._query = uri.parse_qs(self.environ)
+        return self._query
+
+    @property
+    def form_data(self):
+        self._read_form()
+        return self._form_data
+
+    def path():
+        def fget(self):
+            if self._path is _UNSET:
+                if self.method == 'GET':
+                    v = self.query.get(core.AYAME_PATH)
+                elif self.method == 'POST':
+                    # read form data until ayame:path is found
+                    self._read_form(core.AYAME_PATH)
+                    v = self._form_data.get(core.AYAME_PATH)
+                else:
+                    v = None
+                self._path = v[0] if v else None
+            return self._path
+
+        def fset(self, path):
+            self._path = path
+
+        return locals()
+
+    path = property(**path())
+
+    @property
+    def page_id(self):
+        if self._page_id is _UNSET:
+            self._page_id = self._value_of(core.AYAME_PAGE)
+            if (self._page_id is None and
+                self.method == 'POST' and
+                self.path is not None):
+                # ayame:page precedes ayame:path in form
+                v = self._form_data.get(core.AYAME_PAGE)
+                self._page_id = v[0] if v else None
+        return self._page_id
+
+    @property
+    def partial(self):
+        if self._partial is _UNSET:
+            self._partial = self._value_of(core.AYAME_PARTIAL)
+        return self._partial
+
+    @property
+    def validate(self):
+        if self._validate is _UNSET:
+            self._validate = self._value_of(core.AYAME_VALIDATE) is not None
+        return self._validate
+
+    @property
+    def locale(self):
+        if self._locale is None:
+            self._locale = _parse_locales(self.environ)
+        return self._locale
+
+    def _value_of(self, name):
+        # retrieve ayame:page, ayame:partial and ayame:validate from query
+        if self.method not in ('GET', 'POST'):
+            return
+        v = self.query.get(name)
+        return v[0] if v else None
+
+    def _read_form(self, name=None):
+        # read form data until the specified field is found
+        if self._form_data is None:
+            self._form_data = {}
+            self._parts = http.iter_form_data(self.environ, **_form_limits())
+        elif (self._parts is None or
+              (name is not None and
+               name in self._form_data)):
+            return
+        form_data = self._form_data
+        for n, v in self._parts:
+            if n in form_data:
+                form_data[n].append(v)
+            else:
+                form_data[n] = [v]
+            if n == name:
+                return
+        self._parts = None
 
     @property
     def input(self):
@@ -200,3 +488,62 @@ class Request(object):
     @property
     def session(self):
         return local.context().session
+
+
+def _negotiate_coding(value):
+    q = {}
+    for v, qvalue in http.parse_accept(value):
+        q.setdefault(v.lower(), qvalue)
+    for coding in ('gzip', 'deflate'):
+        if q.get(coding, q.get('*', 0)) > 0:
+            return coding
+
+
+def _compress(coding, data, level):
+    if coding == 'gzip':
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=level, mtime=0) as fp:
+            fp.write(data)
+        return buf.getvalue()
+    return zlib.compress(data, level)
+
+
+def _cacheable(response):
+    return (response[0] == http.OK.status and
+            not any(n.lower() == 'set-cookie' for n, _ in response[1]) and
+            not local.context().session.loaded)
+
+
+def _form_limits():
+    try:
+        config = local.app().config
+    except AyameError:
+        return {}
+    return {'max_size': config['ayame.form.max_size'],
+            'max_parts': config['ayame.form.max_parts'],
+            'max_field_size': config['ayame.form.max_field_size'],
+            'spool_size': config['ayame.form.spool_size']}
+
+
+def _parse_locales(environ):
+    value = environ.get('HTTP_ACCEPT_LANGUAGE')
+    if value:
+        try:
+            return _locales[value]
+        except KeyError:
+            pass
+    values = http.parse_accept(value)
+    if values:
+        v = values[0][0]
+        sep = '-'
+    else:
+        v = locale.getdefaultlocale()[0]
+        sep = '_'
+    if v:
+        v = v.split(sep, 1)
+        rv = (v[0].lower(), v[1].upper() if 1 < len(v) else None)
+    else:
+        rv = (None,) * 2
+    if values:
+        _locales[value] = rv
+    return rv
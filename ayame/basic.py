@@ -27,12 +27,13 @@
 import collections
 
 from . import _compat as five
-from . import core, markup, uri
+from . import core, markup, uri, util
 from . import model as mm
 
 
-__all__ = ['Label', 'ListView', 'PropertyListView', 'ContextPathGenerator',
-           'ContextImage', 'ContextLink']
+__all__ = ['Label', 'ListView', 'PropertyListView', 'StreamingListView',
+           'LazyContainer', 'ContextPathGenerator', 'ContextImage',
+           'ContextLink']
 
 
 class Label(core.Component):
@@ -56,6 +57,13 @@ class ListView(core.MarkupContainer):
         self._populate_item = populate_item
 
     def on_before_render(self):
+        # remove items of the previous rendering
+        items = self.children[:]
+        del self.children[:]
+        self._ref.clear()
+        for c in items:
+            c.parent = None
+            self.on_remove(c)
         o = self.model_object
         if o is not None:
             for i in five.range(len(o)):
@@ -68,8 +76,9 @@ class ListView(core.MarkupContainer):
         skel = element.copy()
         skel.qname = markup.DIV
         del element[:]
+        template = _RowTemplate(skel, core._shares_markup(self))
         for c in self.children:
-            element.extend(c.on_render(skel.copy()))
+            element.extend(template.render(c))
         return element
 
     def populate_item(self, item):
@@ -94,6 +103,117 @@ class _ListItem(core.MarkupContainer):
         return self.__index
 
 
+class _RowTemplate(object):
+
+    STATIC = 0
+    SPINE = 1
+    SLOT = 2
+
+    def __init__(self, element, shared=False):
+        self.element = element
+        self.shared = shared
+        self.plan = self._compile(element)
+        if self.plan is not None:
+            kind, self.plan = self.plan
+            if kind == self.SLOT:
+                self.plan = None
+
+    def render(self, item):
+        if (self.plan is None or
+            not self._can_fill(item)):
+            return item.on_render(self.element.copy())
+
+        slots = []
+        root = self._copy(self.element, self.plan, slots)
+        # fill slots in document order
+        offsets = {}
+        for parent, i in slots:
+            i += offsets.get(parent, 0)
+            value = item.render_component(parent[i])[1]
+            if value is None:
+                # remove element
+                del parent[i]
+                offsets[parent] = offsets.get(parent, 0) - 1
+            elif util.iterable(value):
+                # replace element
+                parent[i:i + 1] = value
+                offsets[parent] = offsets.get(parent, 0) + len(value) - 1
+                for v in value:
+                    self._render_children(item, v)
+            else:
+                # replace element
+                parent[i] = value
+                self._render_children(item, value)
+        return root
+
+    def _compile(self, element):
+        # classify element into static parts and component slots
+        if element.qname.ns_uri == markup.AYAME_NS:
+            return
+        attrs = [a for a in element.attrib
+                 if getattr(a, 'ns_uri', None) == markup.AYAME_NS]
+        if attrs:
+            if (attrs == [markup.AYAME_ID] and
+                not self._has_ayame(element, False)):
+                return self.SLOT, None
+            return
+        plan = []
+        for i, node in enumerate(element):
+            if isinstance(node, markup.Element):
+                p = self._compile(node)
+                if p is None:
+                    return
+                elif p[0] != self.STATIC:
+                    plan.append((i,) + p)
+        return (self.SPINE, plan) if plan else (self.STATIC, None)
+
+    def _copy(self, element, plan, slots):
+        elem = element.__class__.__new__(element.__class__)
+        elem.qname = element.qname
+        elem.attrib = element.attrib.copy()
+        elem.type = element.type
+        elem.ns = element.ns.copy()
+        if self.shared:
+            # static elements are not modified while rendering
+            elem.children = list(element.children)
+        else:
+            elem.children = [n.copy() if isinstance(n, markup.Element) else n
+                             for n in element.children]
+        for i, kind, subplan in plan:
+            if kind == self.SLOT:
+                if self.shared:
+                    elem.children[i] = element.children[i].copy()
+                slots.append((elem, i))
+            else:
+                elem.children[i] = self._copy(element.children[i], subplan, slots)
+        return elem
+
+    def _can_fill(self, item):
+        class_ = item.__class__
+        return (not item.behaviors and
+                class_.on_render == core.MarkupContainer.on_render and
+                class_.on_render_element == core.MarkupContainer.on_render_element and
+                class_.on_render_attrib == core.MarkupContainer.on_render_attrib)
+
+    def _render_children(self, item, element):
+        if (isinstance(element, markup.Element) and
+            self._has_ayame(element, False)):
+            # render rest of ayame elements and attributes
+            body = markup.Element(markup.DIV)
+            body.children = element.children
+            core.MarkupContainer.on_render(item, body)
+
+    def _has_ayame(self, element, self_=True):
+        for elem, depth in element.walk():
+            if not (self_ or
+                    0 < depth):
+                continue
+            elif (elem.qname.ns_uri == markup.AYAME_NS or
+                  any(getattr(a, 'ns_uri', None) == markup.AYAME_NS for a in elem.attrib)):
+                return True
+        return False
+
+
 class _ListItemModel(mm.Model):
 
     def __init__(self, list_view, index):
@@ -118,6 +238,96 @@ class PropertyListView(ListView):
         return mm.CompoundModel(super(PropertyListView, self).new_model(index))
 
 
+class StreamingListView(core.MarkupContainer):
+
+    def __init__(self, id, model=None, populate_item=None):
+        if util.iterable(model):
+            model = mm.Model(model)
+        super(StreamingListView, self).__init__(id, model)
+        self._populate_item = populate_item
+
+    def on_render(self, element):
+        skel = element.copy()
+        skel.qname = markup.DIV
+        del element[:]
+        o = self.model_object
+        if o is not None:
+            page = core._page_of(self)
+            if page is not None:
+                # render items while the response body is being sent
+                element.append(page.new_stream(self._render_items(o, skel)))
+            else:
+                element.extend(self._render_items(o, skel))
+        return element
+
+    def _render_items(self, o, skel):
+        for i, object in enumerate(o):
+            # populate, render and release item one by one
+            li = self.new_item(i, object)
+            self.add(li)
+            try:
+                self.populate_item(li)
+                if li.visible:
+                    li.on_before_render()
+                    nodes = li.on_render(skel.copy())
+                    li.on_after_render()
+                    for node in nodes:
+                        yield node
+            finally:
+                del self.children[-1]
+                del self._ref[li.id]
+                li.parent = None
+
+    def populate_item(self, item):
+        if callable(self._populate_item):
+            return self._populate_item(item)
+
+    def new_item(self, index, object):
+        return _ListItem(index, self.new_model(index, object))
+
+    def new_model(self, index, object):
+        return mm.Model(object)
+
+
+class LazyContainer(core.MarkupContainer):
+
+    def __init__(self, id, model=None, populate=None):
+        self.__children = []
+        self.__populated = False
+        super(LazyContainer, self).__init__(id, model)
+        self._populate = populate
+
+    def children():
+        def fget(self):
+            # populate on first access while visible
+            if (not self.__populated and
+                self.visible):
+                self.__populated = True
+                self.populate()
+            return self.__children
+
+        def fset(self, children):
+            self.__children = children
+
+        return locals()
+
+    children = property(**children())
+
+    @property
+    def populated(self):
+        return self.__populated
+
+    def find(self, path):
+        if path:
+            # populate
+            self.children
+        return super(LazyContainer, self).find(path)
+
+    def populate(self):
+        if callable(self._populate):
+            return self._populate(self)
+
+
 class ContextPathGenerator(core.AttributeModifier):
 
     def __init__(self, attr, rel_path):
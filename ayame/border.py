@@ -25,7 +25,7 @@
 #
 
 from . import basic, core, form, markup
-from .exception import RenderingError
+from .exception import ComponentError, RenderingError
 
 
 __all__ = ['Border', 'FeedbackFieldBorder']
@@ -127,10 +127,22 @@ class FeedbackFieldBorder(Border):
         self.add_to_border(self._ClassModifier('class', self.__feedback.model))
 
     def on_configure(self):
-        for c, _ in self.walk():
-            if isinstance(c, form.FormComponent):
-                self.__feedback.model.object = c.error
-                self.__feedback.visible = bool(c.error)
+        try:
+            for f in self.iter_parent(form.Form):
+                pass
+            # components which failed in the last submission
+            components = f.errors
+        except ComponentError:
+            # not attached to Form
+            components = (c for c, _ in self.walk()
+                          if isinstance(c, form.FormComponent))
+        error = None
+        for c in components:
+            if (c.error and
+                any(p is self for p in c.iter_parent())):
+                error = c.error
+        self.__feedback.model.object = error
+        self.__feedback.visible = bool(error)
 
     class _ClassModifier(core.AttributeModifier):
 
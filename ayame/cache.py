@@ -0,0 +1,151 @@
+#
+# ayame.cache
+#
+#   Copyright (c) 2011-2014 Akinori Hattori <hattya@gmail.com>
+#
+#   Permission is hereby granted, free of charge, to any person
+#   obtaining a copy of this software and associated documentation files
+#   (the "Software"), to deal in the Software without restriction,
+#   including without limitation the rights to use, copy, modify, merge,
+#   publish, distribute, sublicense, and/or sell copies of the Software,
+#   and to permit persons to whom the Software is furnished to do so,
+#   subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be
+#   included in all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#   EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#   MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+#   NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+#   BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+#   ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+#   CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#   SOFTWARE.
+#
+
+
+import threading
+import time
+
+from . import util
+
+
+__all__ = ['CachePolicy', 'OutputCache']
+
+
+class CachePolicy(object):
+
+    def __init__(self, ttl=None, values=True, query=(), locale=False, headers=()):
+        self.ttl = ttl
+        self.values = values
+        self.query = tuple(query)
+        self.locale = locale
+        self.headers = tuple(headers)
+
+
+class OutputCache(object):
+
+    def __init__(self, cap=256, timeout=30):
+        self.timeout = timeout
+        self.__cache = util.LRUCache(cap)
+        self.__lock = threading.Lock()
+        self.__flights = {}
+        self.__hits = 0
+        self.__misses = 0
+
+    def cap():
+        def fget(self):
+            return self.__cache.cap
+
+        def fset(self, cap):
+            self.__cache.cap = cap
+
+        return locals()
+
+    cap = property(**cap())
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    def __len__(self):
+        return len(self.__cache)
+
+    def __contains__(self, key):
+        return key in self.__cache
+
+    def get(self, key, default=None):
+        value = self.peek(key)
+        with self.__lock:
+            if value is not None:
+                self.__hits += 1
+                return value
+            self.__misses += 1
+        return default
+
+    def peek(self, key, default=None):
+        try:
+            expires, value = self.__cache[key]
+        except KeyError:
+            return default
+        if (expires is None or
+            time.time() < expires):
+            return value
+        # expired
+        self.__cache.pop(key, None)
+        return default
+
+    def fetch(self, key, func, ttl=None, cacheable=None):
+        value = self.get(key)
+        if value is not None:
+            return value
+        if not self.begin(key):
+            # another thread has produced the value
+            value = self.peek(key)
+            if value is not None:
+                return value
+            # timed out or not cacheable
+            return func()
+        try:
+            value = func()
+            if (cacheable is None or
+                cacheable(value)):
+                self.put(key, value, ttl)
+            return value
+        finally:
+            self.end(key)
+
+    def begin(self, key):
+        # True if the caller should produce the value, otherwise wait for
+        # the thread which is producing it
+        with self.__lock:
+            flight = self.__flights.get(key)
+            if (flight is None or
+                flight[1] < time.time()):
+                # no flight or abandoned
+                self.__flights[key] = (threading.Event(), time.time() + self.timeout)
+                return True
+        flight[0].wait(self.timeout)
+        return False
+
+    def end(self, key):
+        with self.__lock:
+            flight = self.__flights.pop(key, None)
+        if flight is not None:
+            flight[0].set()
+
+    def put(self, key, value, ttl=None):
+        self.__cache[key] = (time.time() + ttl if ttl is not None else None, value)
+
+    def remove(self, key):
+        self.__cache.pop(key, None)
+
+    def clear(self):
+        self.__cache.clear()
+        with self.__lock:
+            self.__hits = self.__misses = 0
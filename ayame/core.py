@@ -24,21 +24,33 @@
 #   SOFTWARE.
 #
 
+import calendar
 import collections
+import copy
+import datetime
+import json
 import sys
+import types
 import wsgiref.headers
 
 from . import _compat as five
-from . import http, local, markup, util
+from . import http, local, markup, uri, util
 from . import model as mm
 from .exception import AyameError, ComponentError, RenderingError
 
 
-__all__ = ['AYAME_PATH', 'Component', 'MarkupContainer', 'Page', 'Behavior',
-           'AttributeModifier', 'nested']
+__all__ = ['AYAME_PATH', 'AYAME_PAGE', 'AYAME_PARTIAL', 'AYAME_VALIDATE',
+           'Component', 'MarkupContainer', 'Page',
+           'Behavior', 'AttributeModifier', 'nested']
 
 # marker for firing component
 AYAME_PATH = u'ayame:path'
+# marker for stored page
+AYAME_PAGE = u'ayame:page'
+# path of the component to be rendered partially
+AYAME_PARTIAL = u'ayame:partial'
+# validate the component without rendering
+AYAME_VALIDATE = u'ayame:validate'
 
 
 class Component(object):
@@ -131,6 +143,10 @@ class Component(object):
     def session(self):
         return self.app.session
 
+    @property
+    def request_cache(self):
+        return self.app.request_cache
+
     def add(self, *args):
         for o in args:
             if isinstance(o, Behavior):
@@ -141,6 +157,16 @@ class Component(object):
     def converter_for(self, value):
         return self.config['ayame.converter.registry'].converter_for(value)
 
+    def on_add(self, component):
+        # notify ancestors
+        if self.parent is not None:
+            self.parent.on_add(component)
+
+    def on_remove(self, component):
+        # notify ancestors
+        if self.parent is not None:
+            self.parent.on_remove(component)
+
     def element(self):
         # find MarkupContainer which has markup
         path = [self.id]
@@ -218,6 +244,10 @@ class Component(object):
     def on_fire(self):
         pass
 
+    def on_check(self):
+        # list of ValidationError, or None if not supported
+        pass
+
     def render(self, element):
         self.on_configure()
         if self.visible:
@@ -242,6 +272,14 @@ class Component(object):
     def on_after_render(self):
         for b in self.behaviors:
             b.on_after_render(self)
+        self.on_detach()
+
+    def on_detach(self):
+        # release objects loaded while rendering
+        if isinstance(self.__model, mm.LoadableDetachableModel):
+            self.__model.detach()
+        for b in self.behaviors:
+            b.on_detach(self)
 
     def tr(self, key, component=None):
         if component is None:
@@ -286,10 +324,20 @@ class MarkupContainer(Component):
                 self.children.append(o)
                 self._ref[o.id] = o
                 o.parent = self
+                self.on_add(o)
             else:
                 super(MarkupContainer, self).add(o)
         return self
 
+    def remove(self, *args):
+        for o in args:
+            if self._ref.get(o.id) is o:
+                self.children.remove(o)
+                del self._ref[o.id]
+                o.parent = None
+                self.on_remove(o)
+        return self
+
     def find(self, path):
         if not path:
             return self
@@ -330,6 +378,11 @@ class MarkupContainer(Component):
                 c.on_before_render()
 
     def on_render(self, element):
+        # notify behaviors
+        element = super(MarkupContainer, self).on_render(element)
+        return self._render_markup(element)
+
+    def _render_markup(self, element):
         def push(queue, node):
             if isinstance(node, markup.Element):
                 for i in five.range(len(node) - 1, -1, -1):
@@ -345,9 +398,6 @@ class MarkupContainer(Component):
                     break
                 yield q
 
-        # notify behaviors
-        element = super(MarkupContainer, self).on_render(element)
-
         queue = collections.deque()
         if isinstance(element, markup.Element):
             queue.append((None, -1, element))
@@ -434,7 +484,7 @@ class MarkupContainer(Component):
             return element.children if c.visible else None
         elif element.qname == markup.AYAME_MESSAGE:
             k = get(element, markup.AYAME_KEY, False)
-            mc = _MessageContainer(util.new_token()[:7], k)
+            mc = _MessageContainer(_new_id(self), k)
             self.add(mc)
             element.attrib[markup.AYAME_ID] = mc.id
             return element
@@ -448,7 +498,7 @@ class MarkupContainer(Component):
             if ayame_id is not None:
                 self.find(ayame_id).add(_AttributeLocalizer())
             else:
-                ayame_id = util.new_token()[:7]
+                ayame_id = _new_id(self)
                 self.add(_MessageContainer(ayame_id))
                 element.attrib[markup.AYAME_ID] = ayame_id
         # render component
@@ -490,24 +540,15 @@ class MarkupContainer(Component):
         def step(element, depth):
             return element.qname not in (markup.AYAME_CHILD, markup.AYAME_HEAD)
 
-        def path_of(class_):
-            markup_type = (self if self.__class__ is class_ else super(class_, self)).markup_type
-            if markup_type.scope:
-                return (sep.join(c.__name__
-                                 for c in markup_type.scope + (class_,)) +
-                        markup_type.extension)
-            return markup_type.extension
-
         res = self.config['ayame.resource.loader']
         loader = self.config['ayame.markup.loader']()
         enc = self.config['ayame.markup.encoding']
-        sep = self.config['ayame.markup.separator']
         cache = self.config['ayame.markup.cache']
         class_ = self.__class__
         extra_head = []
         ayame_child = None
         while True:
-            path = path_of(class_)
+            path = self._markup_path_of(class_)
             key = class_.__name__ + ':' + path
             try:
                 mtime, m = cache[key]
@@ -596,6 +637,15 @@ class MarkupContainer(Component):
                 raise RenderingError(class_, "'head' element is not found")
         return m
 
+    def _markup_path_of(self, class_):
+        markup_type = (self if self.__class__ is class_ else super(class_, self)).markup_type
+        if markup_type.scope:
+            sep = self.config['ayame.markup.separator']
+            return (sep.join(c.__name__
+                             for c in markup_type.scope + (class_,)) +
+                    markup_type.extension)
+        return markup_type.extension
+
     def find_head(self, root):
         if not (isinstance(root, markup.Element) and
                 root.qname == markup.HTML):
@@ -635,21 +685,120 @@ class _MessageContainer(MarkupContainer):
 
 class Page(MarkupContainer):
 
+    # build the component tree once and clone it for each request
+    prototype = False
+    # keep the instance in the page store between requests
+    stateful = False
+    # cache.CachePolicy for the rendered output
+    cache_policy = None
+
     def __init__(self):
         super(Page, self).__init__(None)
         self.has_markup = True
         self.status = http.OK.status
+        self.page_id = None
         self.__headers = []
         self.headers = wsgiref.headers.Headers(self.__headers)
 
     def __call__(self):
+        request = self.request
+        if (request is not None and
+            request.validate):
+            # validation only
+            content = self.validation_result(request.path)
+            self.headers['Content-Type'] = 'application/json; charset=UTF-8'
+            self.headers['Content-Length'] = str(len(content))
+            return self.status, self.__headers, [content]
         self.fire()
+        if (request is not None and
+            request.partial):
+            content = self.render_partial(request.partial)
+            return self.status, self.__headers, [content]
+        # check validators before rendering
+        etag, last_modified = self.validators()
+        if self.__not_modified(etag, last_modified):
+            return http.NotModified.status, self.__headers, []
         content = self.render()
+        if not isinstance(content, bytes):
+            # streamed
+            return self.status, self.__headers, content
+        if (etag is None and
+            self.status == http.OK.status and
+            self.config['ayame.page.etag']):
+            if self.__not_modified(u'"{}"'.format(util.token_of(content)), None):
+                del self.headers['Content-Type']
+                del self.headers['Content-Length']
+                return http.NotModified.status, self.__headers, []
         return self.status, self.__headers, [content]
 
+    def __not_modified(self, etag, last_modified):
+        if etag is not None:
+            self.headers['ETag'] = etag
+        if last_modified is not None:
+            if isinstance(last_modified, datetime.datetime):
+                last_modified = calendar.timegm(last_modified.utctimetuple())
+            self.headers['Last-Modified'] = http.format_date(last_modified)
+        request = self.request
+        if (request is None or
+            request.path or
+            request.method not in ('GET', 'HEAD')):
+            return False
+        if etag is not None:
+            v = self.environ.get('HTTP_IF_NONE_MATCH')
+            if v is not None:
+                etags = http.parse_etags(v)
+                return (u'*' in etags or
+                        (etag[2:] if etag.startswith('W/') else etag) in etags)
+        if last_modified is not None:
+            t = http.parse_date(self.environ.get('HTTP_IF_MODIFIED_SINCE'))
+            return (t is not None and
+                    int(last_modified) <= t)
+        return False
+
+    def validators(self):
+        # (ETag, Last-Modified)
+        return None, None
+
+    def is_static(self):
+        if (self.children or
+            self.behaviors):
+            return False
+        class_ = self.__class__
+        for name in _PAGE_HOOKS:
+            if getattr(class_, name) != getattr(Page, name):
+                return False
+        # markup has no ayame elements and attributes
+        m = self.load_markup()
+        if m.root is not None:
+            for elem, _ in m.root.walk():
+                if (elem.qname.ns_uri == markup.AYAME_NS or
+                    any(a.ns_uri == markup.AYAME_NS for a in elem.attrib)):
+                    return False
+        return True
+
+    def clone(self):
+        page = _clone(self, {})
+        page.on_clone()
+        return page
+
+    def on_clone(self):
+        pass
+
+    def on_restore(self):
+        self.status = http.OK.status
+        del self.__headers[:]
+        # remove components for ayame:message
+        for c, _ in self.walk():
+            c.behaviors[:] = [b for b in c.behaviors
+                              if not isinstance(b, _AttributeLocalizer)]
+            if isinstance(c, MarkupContainer):
+                c.remove(*[mc for mc in c.children
+                           if isinstance(mc, _MessageContainer)])
+
     def render(self):
         # load markup and render components
         m = self.load_markup()
+        self.__streamed = False
         if m.root is None:
             # markup is empty
             content = b''
@@ -664,13 +813,245 @@ class Page(MarkupContainer):
             # render markup
             renderer = self.config['ayame.markup.renderer']()
             pretty = self.config['ayame.markup.pretty']
-            content = renderer.render(self, m, pretty=pretty)
+            if self.__streamed:
+                # streams are rendered while the response body is being sent
+                content = local.bind(renderer.iter_render(self, m, pretty=pretty))
+            else:
+                content = renderer.render(self, m, pretty=pretty)
         # HTTP headers
         self.headers['Content-Type'] = '{}; charset=UTF-8'.format(self.markup_type.mime_type)
+        if isinstance(content, bytes):
+            self.headers['Content-Length'] = str(len(content))
+        return content
+
+    def new_stream(self, nodes):
+        # nodes are rendered after components
+        self.__streamed = True
+        return markup.Stream(nodes)
+
+    def validation_result(self, path):
+        if not path:
+            raise http.BadRequest()
+        c = self.find(path)
+        if c is None:
+            raise http.NotFound(uri.request_path(self.environ))
+        errors = c.on_check()
+        if errors is None:
+            raise http.BadRequest(u"component for '{}' cannot be validated".format(five.html_escape(path)))
+        return util.to_bytes(json.dumps({
+            'valid': not errors,
+            'errors': [{'path': e.component.path(),
+                        'name': e.component.relative_path(),
+                        'keys': e.keys,
+                        'message': five.str(e)} for e in errors]
+        }, sort_keys=True))
+
+    def render_partial(self, path):
+        ids = path.split(':')
+        if not all(ids):
+            raise http.BadRequest()
+        # configure components to update their visibility
+        self.on_configure()
+        c = self
+        prepared = None
+        for id in ids:
+            if not c.visible:
+                break
+            n = c.find(id) if isinstance(c, MarkupContainer) else None
+            if (n is None and
+                prepared is None and
+                isinstance(c, MarkupContainer)):
+                # children might be built before rendering
+                c.on_before_render()
+                prepared = c
+                n = c.find(id)
+            if n is None:
+                raise http.NotFound(uri.request_path(self.environ))
+            c = n
+        m = self.load_markup()
+        if m.root is None:
+            raise RenderingError(self, 'markup is empty')
+        self.head = self.find_head(m.root)
+        n = len(self.head)
+        if c.visible:
+            # find element of the component in the markup of its owner
+            ids = [c.id]
+            for owner in c.iter_parent():
+                if owner.has_markup:
+                    break
+                ids.append(owner.id)
+            ids.reverse()
+            root = owner.load_markup().root if owner is not self else m.root
+            if root is None:
+                raise http.NotFound(uri.request_path(self.environ))
+            cache = self.config['ayame.page.partial']
+            key = (owner.__class__, u':'.join(ids))
+            element = _element_at(root, cache.get(key), c.id)
+            if element is None:
+                index = _index_of(root, key[1])
+                if index is None:
+                    raise http.NotFound(uri.request_path(self.environ))
+                cache[key] = index
+                element = _element_at(root, index, c.id)
+            # render only the component and ayame:head contributions
+            if prepared is None:
+                c.on_before_render()
+            value = c.parent._render_markup(element)
+            (prepared or c).on_after_render()
+        else:
+            value = None
+        # envelope
+        ns = {pfx: ns_uri for pfx, ns_uri in five.items(m.root.ns)
+              if ns_uri != markup.AYAME_NS}
+        ns[u'ayame'] = markup.AYAME_NS
+        root = markup.Element(markup.AYAME_PARTIAL, type=markup.Element.OPEN, ns=ns)
+        head = markup.Element(markup.AYAME_HEAD, type=markup.Element.OPEN)
+        head[:] = self.head[n:]
+        fragment = markup.Element(markup.AYAME_FRAGMENT,
+                                  attrib={markup.AYAME_ID: path},
+                                  type=markup.Element.OPEN)
+        if isinstance(value, markup.Element):
+            fragment.append(value)
+        elif util.iterable(value):
+            fragment.extend(value)
+        root.extend((head, fragment))
+        env = markup.Markup()
+        env.xml_decl = m.xml_decl
+        env.lang = u'xml'
+        env.root = root
+        # render markup
+        renderer = self.config['ayame.markup.renderer']()
+        pretty = self.config['ayame.markup.pretty']
+        content = renderer.render(self, env, pretty=pretty)
+        # HTTP headers
+        self.headers['Content-Type'] = 'application/xml; charset=UTF-8'
         self.headers['Content-Length'] = str(len(content))
         return content
 
 
+# hooks which must not be overridden by static pages
+_PAGE_HOOKS = ('__init__', '__call__', 'fire', 'on_fire', 'render', 'on_configure',
+               'on_before_render', 'on_render', 'on_render_element',
+               'on_render_attrib', 'render_component', 'on_after_render',
+               'load_markup', 'find_head', 'validators')
+
+
+def _page_of(component):
+    # None if component is not attached to Page
+    try:
+        return component.page()
+    except ComponentError:
+        pass
+
+
+def _shares_markup(component):
+    # MarkupPrettifier modifies elements in place
+    try:
+        return not component.config['ayame.markup.pretty']
+    except AyameError:
+        return False
+
+
+def _deterministic_id(component):
+    try:
+        return component.config['ayame.markup.deterministic_id']
+    except AyameError:
+        return False
+
+
+def _new_id(component):
+    if _deterministic_id(component):
+        # stable across requests for the same markup
+        return util.token_of(u'{}#{}'.format(component.path(), len(component.children)))[:7]
+    return util.new_token()[:7]
+
+
+def _index_of(root, path):
+    # child indices from root to the element for path
+    index = []
+    element = root
+    ids = path.split(':')
+    for i, id in enumerate(ids):
+        queue = collections.deque(((element, ()),))
+        found = None
+        while (queue and
+               found is None):
+            elem, idx = queue.popleft()
+            for j, node in enumerate(elem):
+                if not isinstance(node, markup.Element):
+                    continue
+                v = node.attrib.get(markup.AYAME_ID)
+                if v == id:
+                    found = node
+                    index.extend(idx + (j,))
+                    break
+                elif v is None:
+                    # skip elements of other components
+                    queue.append((node, idx + (j,)))
+        if found is None:
+            if i == len(ids) - 1:
+                return
+            # component shares the element of its parent (e.g. items of
+            # ListView)
+            continue
+        element = found
+    return tuple(index)
+
+
+def _element_at(root, index, id):
+    if index is None:
+        return
+    element = root
+    for i in index:
+        if not (i < len(element) and
+                isinstance(element[i], markup.Element)):
+            return
+        element = element[i]
+    # markup might be reloaded
+    if element.attrib.get(markup.AYAME_ID) == id:
+        return element
+
+
+def _clone(o, memo):
+    i = id(o)
+    if i in memo:
+        return memo[i]
+    elif isinstance(o, (Component, Behavior, mm.Model, wsgiref.headers.Headers)):
+        # wsgiref.headers.Headers is an old-style class on Python 2
+        c = memo[i] = copy.copy(o)
+        d = c.__dict__
+        for k, v in five.items(o.__dict__):
+            d[k] = _clone(v, memo)
+        return c
+    elif o.__class__ is list:
+        c = memo[i] = []
+        c.extend(_clone(v, memo) for v in o)
+        return c
+    elif o.__class__ is dict:
+        c = memo[i] = {}
+        for k, v in five.items(o):
+            c[k] = _clone(v, memo)
+        return c
+    elif o.__class__ is tuple:
+        c = memo[i] = tuple(_clone(v, memo) for v in o)
+        return c
+    elif o.__class__ is set:
+        c = memo[i] = set(o)
+        return c
+    elif isinstance(o, (markup.Element, markup.Fragment)):
+        c = memo[i] = o.copy()
+        return c
+    elif isinstance(o, types.MethodType):
+        # rebind to the clone of its instance
+        s = _clone(o.__self__, memo)
+        if s is o.__self__:
+            return o
+        c = memo[i] = types.MethodType(o.__func__, s)
+        return c
+    # share everything else including model objects
+    return o
+
+
 class Behavior(object):
 
     def __init__(self):
@@ -696,6 +1077,10 @@ class Behavior(object):
     def session(self):
         return self.app.session
 
+    @property
+    def request_cache(self):
+        return self.app.request_cache
+
     def forward(self, *args, **kwargs):
         return self.app.forward(*args, **kwargs)
 
@@ -711,6 +1096,9 @@ class Behavior(object):
     def on_after_render(self, component):
         pass
 
+    def on_detach(self, component):
+        pass
+
     def redirect(self, *args, **kwargs):
         return self.app.redirect(*args, **kwargs)
 
@@ -739,6 +1127,10 @@ class AttributeModifier(Behavior):
     def new_value(self, value, new_value):
         return new_value
 
+    def on_detach(self, component):
+        if isinstance(self._model, mm.LoadableDetachableModel):
+            self._model.detach()
+
 
 class _AttributeLocalizer(Behavior):
 
@@ -29,8 +29,8 @@ import operator
 
 from . import _compat as five
 from . import core, markup, uri, util, validator
-from .exception import (ComponentError, ConversionError, RenderingError,
-                        ValidationError)
+from .exception import (AyameError, ComponentError, ConversionError,
+                        RenderingError, ValidationError)
 
 
 __all__ = ['Form', 'FormComponent', 'Button', 'FileUploadField', 'TextField',
@@ -68,6 +68,13 @@ class Form(core.MarkupContainer):
     def __init__(self, id, model=None):
         super(Form, self).__init__(id, model)
         self._method = None
+        self.__components = None
+        self.__errors = []
+
+    @property
+    def errors(self):
+        # FormComponents which have an error
+        return list(self.__errors)
 
     def on_fire(self):
         form = self.element()
@@ -93,6 +100,15 @@ class Form(core.MarkupContainer):
         # insert hidden field for marking
         div = markup.Element(markup.DIV)
         div.attrib[_CLASS] = u'ayame-hidden'
+        page = core._page_of(self)
+        if (page is not None and
+            page.page_id is not None):
+            # ayame:page is read with ayame:path
+            input = markup.Element(_INPUT, type=markup.Element.EMPTY)
+            input.attrib[_TYPE] = u'hidden'
+            input.attrib[_NAME] = core.AYAME_PAGE
+            input.attrib[_VALUE] = page.page_id
+            div.append(input)
         input = markup.Element(_INPUT, type=markup.Element.EMPTY)
         input.attrib[_TYPE] = u'hidden'
         input.attrib[_NAME] = core.AYAME_PATH
@@ -115,36 +131,17 @@ class Form(core.MarkupContainer):
             # unknown method
             return
 
-        queue = collections.deque((self,))
-        form = button = None
-        valid = True
-        while queue:
-            c = queue.pop()
-            if not c.visible:
-                # skip invisible component
-                continue
-            elif isinstance(c, Form):
-                # check nested form
-                if form is not None:
-                    raise ComponentError(self, "Form is nested")
-                form = c
-            elif isinstance(c, FormComponent):
-                # validate
-                name = c.relative_path()
-                if isinstance(c, Button):
-                    if (name in values and
-                        button is None):
-                        button = c
-                elif isinstance(c, Choice):
-                    c.validate(values[name] if name in values else [])
-                else:
-                    c.validate(values[name][0] if name in values else None)
-                if valid:
-                    valid = c.error is None
-            # push children
-            if isinstance(c, core.MarkupContainer):
-                queue.extend(reversed(c.children))
-        if not valid:
+        del self.__errors[:]
+        button = None
+        for c, name in self._visible_components():
+            if isinstance(c, Button):
+                if (name in values and
+                    button is None):
+                    button = c
+            else:
+                c.validate(_value_of(c, name, values))
+            self._set_error(c, c.error)
+        if self.__errors:
             if button is not None:
                 button.on_error()
             self.on_error()
@@ -153,6 +150,28 @@ class Form(core.MarkupContainer):
                 button.on_submit()
             self.on_submit()
 
+    def check(self, component=None):
+        # validate without updating models and firing events
+        if self.request.method == 'GET':
+            values = self.request.query
+        elif self.request.method == 'POST':
+            values = self.request.form_data
+        else:
+            values = {}
+
+        errors = []
+        for c, name in self._visible_components():
+            if (not isinstance(c, Button) and
+                (component is None or
+                 c is component)):
+                _, e = c.check(_value_of(c, name, values))
+                if e is not None:
+                    errors.append(e)
+        return errors
+
+    def on_check(self):
+        return self.check()
+
     def on_method_mismatch(self):
         return True  # continue
 
@@ -163,11 +182,52 @@ class Form(core.MarkupContainer):
         pass
 
     def has_error(self):
-        for c, _ in self.walk():
-            if (isinstance(c, FormComponent) and
-                c.error):
-                return True
-        return False
+        return bool(self.__errors)
+
+    def on_add(self, component):
+        # ancestors are not notified, components of Form are not theirs
+        if not isinstance(component, core._MessageContainer):
+            self.__components = None
+
+    def on_remove(self, component):
+        if not isinstance(component, core._MessageContainer):
+            self.__components = None
+
+    def _set_error(self, component, error):
+        if error is None:
+            if component in self.__errors:
+                self.__errors.remove(component)
+        elif component not in self.__errors:
+            self.__errors.append(component)
+
+    def _visible_components(self):
+        if not self.visible:
+            return
+        for c, name, path in self._components():
+            if all(p.visible for p in path):
+                if name is None:
+                    raise ComponentError(self, "Form is nested")
+                yield c, name
+
+    def _components(self):
+        # [(FormComponent or nested Form, relative path, path from Form)]
+        if self.__components is None:
+            components = []
+            queue = collections.deque((c, (c,)) for c in reversed(self.children))
+            while queue:
+                c, path = queue.pop()
+                if isinstance(c, Form):
+                    # components of nested Form are never submitted
+                    components.append((c, None, path))
+                    continue
+                elif isinstance(c, FormComponent):
+                    components.append((c, c.relative_path(), path))
+                # push children
+                if isinstance(c, core.MarkupContainer):
+                    queue.extend((child, path + (child,))
+                                 for child in reversed(c.children))
+            self.__components = components
+        return self.__components
 
 
 class FormComponent(core.MarkupContainer):
@@ -176,7 +236,25 @@ class FormComponent(core.MarkupContainer):
         super(FormComponent, self).__init__(id, model)
         self.required = False
         self.type = None
-        self.error = None
+        self.__error = None
+
+    def error():
+        def fget(self):
+            return self.__error
+
+        def fset(self, error):
+            self.__error = error
+            # update errors of Form
+            try:
+                for f in self.iter_parent(Form):
+                    pass
+            except ComponentError:
+                return
+            f._set_error(self, error)
+
+        return locals()
+
+    error = property(**error())
 
     def relative_path(self):
         lis = [self.id]
@@ -185,7 +263,8 @@ class FormComponent(core.MarkupContainer):
         del lis[-1]
         return u':'.join(reversed(lis))
 
-    def validate(self, value):
+    def check(self, value):
+        # (object, ValidationError)
         try:
             # check required
             if (self.required and
@@ -203,7 +282,21 @@ class FormComponent(core.MarkupContainer):
             e.vars.update(input=value,
                           name=self.id,
                           label=label if label is not None else self.id)
-            self.error = e
+            return None, e
+        return o, None
+
+    def on_check(self):
+        try:
+            for form in self.iter_parent(Form):
+                pass
+        except ComponentError:
+            # not attached to Form
+            return
+        return form.check(self)
+
+    def validate(self, value):
+        o, self.error = self.check(value)
+        if self.error is not None:
             self.on_invalid()
         else:
             if self.model is not None:
@@ -350,28 +443,30 @@ class Choice(FormComponent):
         self.prefix = markup.Fragment()
         self.suffix = markup.Fragment()
 
+    def check(self, value):
+        if self.choices:
+            return super(Choice, self).check(value)
+        return None, None
+
     def validate(self, value):
         if self.choices:
             super(Choice, self).validate(value)
 
     def convert(self, value):
+        index = self._options().value_index
         if self.multiple:
-            values = set(value)
-            selected = []
-            for i, choice in enumerate(self.choices):
-                v = self.renderer.value_of(i, choice)
-                if v in values:
-                    values.remove(v)
-                    selected.append(choice)
-            if values:
-                raise self.choice_error()
-            return selected
+            indices = []
+            for v in set(value):
+                i = index.get(v)
+                if i is None:
+                    raise self.choice_error()
+                indices.append(i)
+            return [self.choices[j] for j in sorted(indices)]
         elif value:
-            v = value[0]
-            for i, choice in enumerate(self.choices):
-                if self.renderer.value_of(i, choice) == v:
-                    return choice
-            raise self.choice_error()
+            i = index.get(value[0])
+            if i is None:
+                raise self.choice_error()
+            return self.choices[i]
 
     def choice_error(self):
         e = ValidationError()
@@ -380,11 +475,127 @@ class Choice(FormComponent):
 
     def _id_prefix_for(self, element):
         id = element.attrib.get(_ID)
-        return id if id else u'ayame-' + util.new_token()[:7]
+        if id:
+            return id
+        return u'ayame-' + (util.token_of(self.path()) if core._deterministic_id(self) else util.new_token())[:7]
 
     def render_element(self, element, index, choice):
         return element
 
+    def _options(self):
+        choices = self.choices
+        r = self.renderer
+        try:
+            cache = self.config['ayame.choice.cache']
+        except AyameError:
+            cache = None
+        if cache is None:
+            return _Options(self, choices)
+        # stateless renderers are shared by class
+        key = (id(choices), r.__class__, id(r) if getattr(r, '__dict__', None) else None)
+        o = cache.get(key)
+        if not (o is not None and
+                (o.choices is choices or
+                 o.choices == choices)):
+            o = cache[key] = _Options(self, choices)
+        return o
+
+    def _selected_indices(self, options, multiple):
+        selected = self.model_object
+        if selected is None:
+            return set()
+        index = options.choice_index
+        if index is not None:
+            try:
+                if not multiple:
+                    return set(index.get(selected, ()))
+                indices = set()
+                for o in selected:
+                    indices.update(index.get(o, ()))
+                return indices
+            except TypeError:
+                # unhashable
+                pass
+        is_selected = operator.contains if multiple else operator.eq
+        return set(i for i, choice in enumerate(self.choices)
+                   if is_selected(selected, choice))
+
+    def _render_inputs(self, element, type, options, indices):
+        name = self.relative_path()
+        pfx = self._id_prefix_for(element)
+        last = len(self.choices) - 1
+        for i, choice in enumerate(self.choices):
+            id = u'-'.join((pfx, five.str(i)))
+            # append prefix
+            element.extend(self.prefix.copy())
+            # input
+            input = markup.Element(_INPUT, type=markup.Element.EMPTY)
+            input.attrib[_ID] = id
+            input.attrib[_TYPE] = type
+            input.attrib[_NAME] = name
+            input.attrib[_VALUE] = options.values[i]
+            if i in indices:
+                input.attrib[_CHECKED] = u'checked'
+            input = self.render_element(input, i, choice)
+            element.append(input)
+            # label
+            label = markup.Element(_LABEL, type=markup.Element.EMPTY)
+            label.attrib[_FOR] = id
+            label.append(options.labels[i])
+            label = self.render_element(label, i, choice)
+            element.append(label)
+            # append suffix
+            if i < last:
+                element.extend(self.suffix.copy())
+
+    def _renders_options_only(self):
+        if (self.prefix or
+            self.suffix or
+            self.__class__.render_element != Choice.render_element):
+            return False
+        return core._shares_markup(self)
+
+
+class _Options(object):
+
+    __slots__ = ('choices', 'values', 'labels', 'value_index', 'choice_index',
+                 '_elements')
+
+    def __init__(self, component, choices):
+        self.choices = choices if isinstance(choices, tuple) else list(choices)
+        r = component.renderer
+        self.values = []
+        self.labels = []
+        self.value_index = {}
+        self.choice_index = {}
+        for i, choice in enumerate(self.choices):
+            v = r.value_of(i, choice)
+            s = r.label_for(choice)
+            if not isinstance(s, five.string_type):
+                s = component.converter_for(s).to_string(s)
+            self.values.append(v)
+            self.labels.append(five.html_escape(s))
+            self.value_index.setdefault(v, i)
+            if self.choice_index is not None:
+                try:
+                    self.choice_index.setdefault(choice, []).append(i)
+                except TypeError:
+                    # unhashable
+                    self.choice_index = None
+        self._elements = None
+
+    def options(self):
+        # shared option elements
+        if self._elements is None:
+            elements = []
+            for v, s in zip(self.values, self.labels):
+                option = markup.Element(_OPTION, type=markup.Element.OPEN)
+                option.attrib[_VALUE] = v
+                option.append(s)
+                elements.append(option)
+            self._elements = elements
+        return self._elements
+
 
 class ChoiceRenderer(object):
 
@@ -407,36 +618,8 @@ class RadioChoice(Choice):
         del element[:]
 
         if self.choices:
-            name = self.relative_path()
-            selected = self.model_object
-            pfx = self._id_prefix_for(element)
-            last = len(self.choices) - 1
-            for i, choice in enumerate(self.choices):
-                id = u'-'.join((pfx, five.str(i)))
-                # append prefix
-                element.extend(self.prefix.copy())
-                # radio button
-                input = markup.Element(_INPUT, type=markup.Element.EMPTY)
-                input.attrib[_ID] = id
-                input.attrib[_TYPE] = u'radio'
-                input.attrib[_NAME] = name
-                input.attrib[_VALUE] = self.renderer.value_of(i, choice)
-                if choice == selected:
-                    input.attrib[_CHECKED] = u'checked'
-                input = self.render_element(input, i, choice)
-                element.append(input)
-                # label
-                s = self.renderer.label_for(choice)
-                if not isinstance(s, five.string_type):
-                    s = self.converter_for(s).to_string(s)
-                label = markup.Element(_LABEL, type=markup.Element.EMPTY)
-                label.attrib[_FOR] = id
-                label.append(five.html_escape(s))
-                label = self.render_element(label, i, choice)
-                element.append(label)
-                # append suffix
-                if i < last:
-                    element.extend(self.suffix.copy())
+            o = self._options()
+            self._render_inputs(element, u'radio', o, self._selected_indices(o, False))
         # render radio choice
         return super(RadioChoice, self).on_render(element)
 
@@ -452,38 +635,8 @@ class CheckBoxChoice(Choice):
         del element[:]
 
         if self.choices:
-            name = self.relative_path()
-            selected = self.model_object
-            is_selected = operator.contains if self.multiple else operator.eq
-            pfx = self._id_prefix_for(element)
-            last = len(self.choices) - 1
-            for i, choice in enumerate(self.choices):
-                id = u'-'.join((pfx, five.str(i)))
-                # append prefix
-                element.extend(self.prefix.copy())
-                # checkbox
-                input = markup.Element(_INPUT, type=markup.Element.EMPTY)
-                input.attrib[_ID] = id
-                input.attrib[_TYPE] = u'checkbox'
-                input.attrib[_NAME] = name
-                input.attrib[_VALUE] = self.renderer.value_of(i, choice)
-                if (selected is not None and
-                    is_selected(selected, choice)):
-                    input.attrib[_CHECKED] = u'checked'
-                input = self.render_element(input, i, choice)
-                element.append(input)
-                # label
-                s = self.renderer.label_for(choice)
-                if not isinstance(s, five.string_type):
-                    s = self.converter_for(s).to_string(s)
-                label = markup.Element(_LABEL, type=markup.Element.EMPTY)
-                label.attrib[_FOR] = id
-                label.append(five.html_escape(s))
-                label = self.render_element(label, i, choice)
-                element.append(label)
-                # append suffix
-                if i < last:
-                    element.extend(self.suffix.copy())
+            o = self._options()
+            self._render_inputs(element, u'checkbox', o, self._selected_indices(o, self.multiple))
         # render checkbox choice
         return super(CheckBoxChoice, self).on_render(element)
 
@@ -506,28 +659,44 @@ class SelectChoice(Choice):
         # clear children
         del element[:]
 
-        if self.choices:
-            selected = self.model_object
-            is_selected = operator.contains if self.multiple else operator.eq
-            last = len(self.choices) - 1
-            for i, choice in enumerate(self.choices):
-                # append prefix
-                element.extend(self.prefix.copy())
-                # option
-                option = markup.Element(_OPTION, type=markup.Element.EMPTY)
-                option.attrib[_VALUE] = self.renderer.value_of(i, choice)
-                if (selected is not None and
-                    is_selected(selected, choice)):
-                    option.attrib[_SELECTED] = u'selected'
-                option = self.render_element(option, i, choice)
-                # label
-                s = self.renderer.label_for(choice)
-                if not isinstance(s, five.string_type):
-                    s = self.converter_for(s).to_string(s)
-                option.append(five.html_escape(s))
-                element.append(option)
-                # append suffix
-                if i < last:
-                    element.extend(self.suffix.copy())
+        if not self.choices:
+            # render select choice
+            return super(SelectChoice, self).on_render(element)
+
+        o = self._options()
+        indices = self._selected_indices(o, self.multiple)
+        if self._renders_options_only():
+            # render select choice, and then share cached options
+            element = super(SelectChoice, self).on_render(element)
+            options = list(o.options())
+            for i in indices:
+                option = options[i].copy()
+                option.attrib[_SELECTED] = u'selected'
+                options[i] = option
+            element.extend(options)
+            return element
+
+        last = len(self.choices) - 1
+        for i, choice in enumerate(self.choices):
+            # append prefix
+            element.extend(self.prefix.copy())
+            # option
+            option = markup.Element(_OPTION, type=markup.Element.EMPTY)
+            option.attrib[_VALUE] = o.values[i]
+            if i in indices:
+                option.attrib[_SELECTED] = u'selected'
+            option = self.render_element(option, i, choice)
+            # label
+            option.append(o.labels[i])
+            element.append(option)
+            # append suffix
+            if i < last:
+                element.extend(self.suffix.copy())
         # render select choice
         return super(SelectChoice, self).on_render(element)
+
+
+def _value_of(component, name, values):
+    if isinstance(component, Choice):
+        return values[name] if name in values else []
+    return values[name][0] if name in values else None
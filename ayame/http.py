@@ -24,18 +24,23 @@
 #   SOFTWARE.
 #
 
-import cgi
+import calendar
+import datetime
+import email.utils
 import re
+import tempfile
 
 from . import _compat as five
 from .exception import AyameError
 
 
-__all__ = ['parse_accept', 'parse_form_data', 'HTTPStatus', 'HTTPSuccessful',
+__all__ = ['parse_accept', 'parse_form_data', 'iter_form_data', 'FileUpload', 'parse_etags',
+           'parse_date', 'format_date', 'HTTPStatus', 'HTTPSuccessful',
            'OK', 'Created', 'Accepted', 'NoContent', 'HTTPRedirection',
            'MovedPermanently', 'Found', 'SeeOther', 'NotModified', 'HTTPError',
            'HTTPClientError', 'BadRequest', 'Unauthrized', 'Forbidden',
-           'NotFound', 'MethodNotAllowed', 'RequestTimeout', 'HTTPServerError',
+           'NotFound', 'MethodNotAllowed', 'RequestTimeout',
+           'RequestEntityTooLarge', 'HTTPServerError',
            'InternalServerError', 'NotImplemented']
 
 _accept_re = re.compile(r"""
@@ -58,38 +63,273 @@ def parse_accept(value):
     return tuple((v, -q) for q, i, v in sorted(qlist))
 
 
-def parse_form_data(environ):
-    ct = cgi.parse_header(environ.get('CONTENT_TYPE', ''))[0]
-    if ct not in ('application/x-www-form-urlencoded',
-                  'multipart/form-data'):
-        return {}
+def parse_form_data(environ, max_size=None, max_parts=None, max_field_size=None,
+                    spool_size=1 << 20):
+    form_data = {}
+    for name, value in iter_form_data(environ, max_size, max_parts, max_field_size, spool_size):
+        if name in form_data:
+            form_data[name].append(value)
+        else:
+            form_data[name] = [value]
+    return form_data
 
-    # isolate QUERY_STRING
-    fs_environ = environ.copy()
-    fs_environ['QUERY_STRING'] = ''
-    fs = cgi.FieldStorage(fp=environ['wsgi.input'],
-                          environ=fs_environ,
-                          keep_blank_values=True)
 
-    form_data = {}
-    for field in fs.list:
-        if (isinstance(field, cgi.FieldStorage) and
-            field.done == -1):
+def iter_form_data(environ, max_size=None, max_parts=None, max_field_size=None,
+                   spool_size=1 << 20):
+    if environ.get('REQUEST_METHOD') in ('GET', 'HEAD'):
+        # body is ignored
+        return
+    ct, options = _parse_header(environ.get('CONTENT_TYPE', ''))
+    if ct not in ('application/x-www-form-urlencoded',
+                  'multipart/form-data'):
+        return
+
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        raise BadRequest()
+    if length <= 0:
+        return
+    elif (max_size is not None and
+          max_size < length):
+        raise RequestEntityTooLarge()
+
+    fp = _Input(environ['wsgi.input'], length)
+    if ct == 'application/x-www-form-urlencoded':
+        qs = fp.read(length)
+        while fp.remaining:
+            qs += fp.read(fp.remaining)
+        form_data = five.urlparse_qs(qs if five.PY2 else qs.decode('utf-8', 'replace'),
+                                     keep_blank_values=True)
+        for values in form_data.values():
+            for v in values:
+                if (max_field_size is not None and
+                    max_field_size < len(v)):
+                    raise RequestEntityTooLarge()
+        if (max_parts is not None and
+            max_parts < sum(len(v) for v in form_data.values())):
+            raise RequestEntityTooLarge()
+        for name, values in five.items(form_data):
+            for v in values:
+                yield name, v
+    else:
+        boundary = options.get('boundary')
+        if not boundary:
+            raise BadRequest()
+        for name, value in _MultipartParser(fp, boundary.encode('ascii', 'replace'), max_parts, max_field_size,
+                                            spool_size):
+            yield name, value
+
+
+class FileUpload(object):
+
+    def __init__(self, name, filename, type, type_options, file):
+        self.name = name
+        self.filename = filename
+        self.type = type
+        self.type_options = type_options
+        self.file = file
+
+    @property
+    def value(self):
+        self.file.seek(0)
+        try:
+            return self.file.read()
+        finally:
+            self.file.seek(0)
+
+
+class _Input(object):
+
+    __slots__ = ('_fp', 'remaining')
+
+    def __init__(self, fp, length):
+        self._fp = fp
+        self.remaining = length
+
+    def read(self, size):
+        size = min(size, self.remaining)
+        if size <= 0:
+            return b''
+        data = self._fp.read(size)
+        if not data:
+            # client does not send the rest of the body
             raise RequestTimeout()
-        if five.PY2:
-            field.name = unicode(field.name, 'utf-8', 'replace')
-            if field.filename:
-                field.filename = unicode(field.filename, 'utf-8', 'replace')
-                value = field
+        self.remaining -= len(data)
+        return data
+
+
+class _MultipartParser(object):
+
+    chunk_size = 1 << 16
+    max_header_size = 1 << 14
+
+    def __init__(self, fp, boundary, max_parts, max_field_size, spool_size):
+        self._fp = fp
+        self._sep = b'\r\n--' + boundary
+        self._buf = b'\r\n'
+        self.max_parts = max_parts
+        self.max_field_size = max_field_size
+        self.spool_size = spool_size
+
+    def __iter__(self):
+        # skip preamble
+        if not self._skip():
+            return
+        parts = 0
+        while True:
+            # delimiter is followed by "--" or CRLF
+            if not self._fill(2):
+                raise BadRequest()
+            elif self._buf.startswith(b'--'):
+                break
+            headers = self._headers()
+            parts += 1
+            if (self.max_parts is not None and
+                self.max_parts < parts):
+                raise RequestEntityTooLarge()
+            name, filename, ct, options = self._disposition(headers)
+            if filename:
+                f = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+                self._body(f.write, None)
+                f.seek(0)
+                yield name, FileUpload(name, filename, ct, options, f)
             else:
-                value = unicode(field.value, 'utf-8', 'replace')
-        else:
-            value = field if field.filename else field.value
-        if field.name in form_data:
-            form_data[field.name].append(value)
-        else:
-            form_data[field.name] = [value]
-    return form_data
+                buf = []
+                self._body(buf.append, self.max_field_size)
+                yield name, b''.join(buf).decode('utf-8', 'replace')
+
+    def _fill(self, size):
+        while len(self._buf) < size:
+            data = self._fp.read(self.chunk_size)
+            if not data:
+                return False
+            self._buf += data
+        return True
+
+    def _skip(self):
+        keep = len(self._sep) - 1
+        while True:
+            i = self._buf.find(self._sep)
+            if 0 <= i:
+                self._buf = self._buf[i + len(self._sep):]
+                return True
+            self._buf = self._buf[-keep:]
+            data = self._fp.read(self.chunk_size)
+            if not data:
+                return False
+            self._buf += data
+
+    def _headers(self):
+        while True:
+            i = self._buf.find(b'\r\n\r\n')
+            if 0 <= i:
+                break
+            elif self.max_header_size < len(self._buf):
+                raise RequestEntityTooLarge()
+            data = self._fp.read(self.chunk_size)
+            if not data:
+                raise BadRequest()
+            self._buf += data
+        lines = self._buf[:i].decode('utf-8', 'replace').split(u'\r\n')
+        self._buf = self._buf[i + 4:]
+        headers = {}
+        # first line is the rest of the delimiter line
+        for l in lines[1:]:
+            if u':' in l:
+                n, v = l.split(u':', 1)
+                headers[n.strip().lower()] = v.strip()
+        return headers
+
+    def _disposition(self, headers):
+        _, options = _parse_header(headers.get(u'content-disposition', u''))
+        ct, ct_options = _parse_header(headers.get(u'content-type', u'text/plain'))
+        return options.get(u'name'), options.get(u'filename'), ct, ct_options
+
+    def _body(self, write, max_size):
+        sep = self._sep
+        keep = len(sep) - 1
+        size = 0
+        while True:
+            i = self._buf.find(sep)
+            if 0 <= i:
+                data = self._buf[:i]
+                self._buf = self._buf[i + len(sep):]
+            elif keep < len(self._buf):
+                data = self._buf[:-keep]
+                self._buf = self._buf[-keep:]
+            else:
+                data = b''
+            if data:
+                size += len(data)
+                if (max_size is not None and
+                    max_size < size):
+                    raise RequestEntityTooLarge()
+                write(data)
+            if 0 <= i:
+                return
+            data = self._fp.read(self.chunk_size)
+            if not data:
+                raise BadRequest()
+            self._buf += data
+
+
+def _parse_header(value):
+    # parse Content-Type like header value
+    params = _parse_params(u';' + value)
+    key = next(params).lower()
+    options = {}
+    for p in params:
+        i = p.find(u'=')
+        if 0 <= i:
+            n = p[:i].strip().lower()
+            v = p[i + 1:].strip()
+            if (2 <= len(v) and
+                v[0] == v[-1] == u'"'):
+                v = v[1:-1].replace(u'\\\\', u'\\').replace(u'\\"', u'"')
+            options[n] = v
+    return key, options
+
+
+def _parse_params(s):
+    while s[:1] == u';':
+        s = s[1:]
+        end = s.find(u';')
+        while (0 < end and
+               (s.count(u'"', 0, end) - s.count(u'\\"', 0, end)) % 2):
+            end = s.find(u';', end + 1)
+        if end < 0:
+            end = len(s)
+        yield s[:end].strip()
+        s = s[end:]
+
+
+def parse_etags(value):
+    if not value:
+        return ()
+
+    etags = []
+    for v in value.split(','):
+        v = v.strip()
+        if v.startswith('W/'):
+            # weak comparison
+            v = v[2:]
+        if v:
+            etags.append(v)
+    return tuple(etags)
+
+
+def parse_date(value):
+    if value:
+        t = email.utils.parsedate_tz(value.strip())
+        if t is not None:
+            return email.utils.mktime_tz(t)
+
+
+def format_date(t):
+    if isinstance(t, datetime.datetime):
+        t = calendar.timegm(t.utctimetuple())
+    return email.utils.formatdate(t, usegmt=True)
 
 
 class _HTTPStatusMetaclass(type):
@@ -250,6 +490,16 @@ class RequestTimeout(HTTPClientError):
                                              headers)
 
 
+class RequestEntityTooLarge(HTTPClientError):
+
+    code = 413
+
+    def __init__(self, headers=None):
+        super(RequestEntityTooLarge, self).__init__('The data value transmitted exceeds the '
+                                                    'capacity limit.',
+                                                    headers)
+
+
 class HTTPServerError(HTTPError):
     pass
 
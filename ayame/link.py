@@ -84,6 +84,10 @@ class ActionLink(Link):
     def new_uri(self, _):
         query = self.request.query.copy()
         query[core.AYAME_PATH] = [self.path()]
+        page = core._page_of(self)
+        if (page is not None and
+            page.page_id is not None):
+            query[core.AYAME_PAGE] = [page.page_id]
         environ = self.environ.copy()
         environ['QUERY_STRING'] = five.urlencode(query, doseq=True)
         return uri.request_uri(environ, True)
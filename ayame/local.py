@@ -24,12 +24,13 @@
 #   SOFTWARE.
 #
 
+import functools
 import threading
 
 from .exception import AyameError
 
 
-__all__ = ['push', 'pop', 'context', 'app']
+__all__ = ['push', 'pop', 'context', 'app', 'bind', 'memoize']
 
 _local = threading.local()
 
@@ -40,7 +41,9 @@ class _Context(object):
         self.app = app
         self.environ = environ
         self.request = None
+        self.request_cache = {}
         self._router = None
+        self._static = False
 
 
 def push(app, environ):
@@ -57,7 +60,9 @@ def pop():
     stack = getattr(_local, 'stack', None)
     if (stack is not None and
         0 < len(stack)):
-        return stack.pop()
+        ctx = stack.pop()
+        ctx.request_cache.clear()
+        return ctx
 
 
 def context():
@@ -69,3 +74,40 @@ def context():
 
 def app():
     return context().app
+
+
+def bind(iterable):
+    # iterate within the current context
+    return _bind(context(), iter(iterable))
+
+
+def _bind(ctx, it):
+    while True:
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            _local.stack = stack = []
+        stack.append(ctx)
+        try:
+            v = next(it)
+        except StopIteration:
+            return
+        finally:
+            stack.pop()
+        yield v
+
+
+def memoize(func):
+    @functools.wraps(func)
+    def memoize(*args, **kwargs):
+        try:
+            cache = context().request_cache
+            key = (func, args, frozenset(kwargs.items()))
+            return cache[key]
+        except (AyameError, TypeError):
+            # no request or unhashable arguments
+            return func(*args, **kwargs)
+        except KeyError:
+            v = cache[key] = func(*args, **kwargs)
+            return v
+
+    return memoize
@@ -25,6 +25,7 @@
 #
 
 import abc
+import codecs
 import collections
 import io
 import re
@@ -38,8 +39,8 @@ __all__ = ['XML_NS', 'XHTML_NS', 'AYAME_NS', 'XHTML1_STRICT', 'QName',
            'HTML', 'HEAD', 'DIV', 'AYAME_CONTAINER', 'AYAME_ENCLOSURE',
            'AYAME_EXTEND', 'AYAME_CHILD', 'AYAME_PANEL', 'AYAME_BORDER',
            'AYAME_BODY', 'AYAME_HEAD', 'AYAME_MESSAGE', 'AYAME_REMOVE',
-           'AYAME_ID', 'AYAME_KEY', 'MarkupType', 'Markup', 'Element',
-           'Fragment', 'MarkupLoader', 'MarkupRenderer', 'Space',
+           'AYAME_PARTIAL', 'AYAME_FRAGMENT', 'AYAME_ID', 'AYAME_KEY', 'MarkupType', 'Markup', 'Element',
+           'Fragment', 'Stream', 'MarkupLoader', 'MarkupRenderer', 'Space',
            'MarkupHandler', 'MarkupPrettifier', 'XMLHandler', 'XHTML1Handler']
 
 # namespace URI
@@ -152,6 +153,9 @@ AYAME_BODY = QName(AYAME_NS, u'body')
 AYAME_HEAD = QName(AYAME_NS, u'head')
 AYAME_MESSAGE = QName(AYAME_NS, u'message')
 AYAME_REMOVE = QName(AYAME_NS, u'remove')
+# partial rendering
+AYAME_PARTIAL = QName(AYAME_NS, u'partial')
+AYAME_FRAGMENT = QName(AYAME_NS, u'fragment')
 
 # ayame attributes
 AYAME_ID = QName(AYAME_NS, u'id')
@@ -232,7 +236,8 @@ class Element(object):
         return self.children.__delitem__(key)
 
     def __copy__(self):
-        elem = self.__class__(self.qname)
+        elem = self.__class__.__new__(self.__class__)
+        elem.qname = self.qname
         elem.attrib = self.attrib.copy()
         elem.type = self.type
         elem.ns = self.ns.copy()
@@ -271,6 +276,11 @@ class Element(object):
                 queue.extend((node, depth + 1) for node in reversed(element)
                              if isinstance(node, Element))
 
+    def expand(self):
+        # replace streams with generated nodes
+        for element, _ in self.walk():
+            _expand(element)
+
     def normalize(self):
         beg = end = 0
         children = []
@@ -310,6 +320,29 @@ class Fragment(list):
     copy = __copy__
 
 
+def _expand(element):
+    if any(isinstance(node, Stream) for node in element):
+        children = []
+        for node in element:
+            if isinstance(node, Stream):
+                children.extend(node)
+            else:
+                children.append(node)
+        element[:] = children
+
+
+class Stream(object):
+
+    __slots__ = ('_it',)
+
+    def __init__(self, iterable):
+        # nodes are generated while rendering
+        self._it = iter(iterable)
+
+    def __iter__(self):
+        return self._it
+
+
 _space_re = re.compile('\s{2,}')
 _newline_re = re.compile('[\n\r]+')
 
@@ -539,6 +572,9 @@ class MarkupRenderer(object):
         self._stack = collections.deque()
 
     def render(self, object, markup, encoding='utf-8', pretty=False):
+        return b''.join(self.iter_render(object, markup, encoding, pretty))
+
+    def iter_render(self, object, markup, encoding='utf-8', pretty=False, chunk_size=1 << 13):
         self._stack.clear()
 
         self.object = object
@@ -560,12 +596,24 @@ class MarkupRenderer(object):
         # render DOCTYPE
         h.doctype(markup.doctype)
         # render nodes
+        encoder = codecs.getincrementalencoder(encoding)()
         queue = collections.deque(((-1, markup.root),))
         while queue:
             index, node = queue.pop()
             if self._stack:
                 self.peek().pending -= 1
-            if isinstance(node, Element):
+            if isinstance(node, Stream):
+                # render generated nodes one by one
+                for n in node:
+                    self.peek().pending += 2
+                    queue.append((index, node))
+                    queue.append((index, n))
+                    break
+                if chunk_size <= self._buf.tell():
+                    yield encoder.encode(self._buf.getvalue())
+                    self._buf.seek(0)
+                    self._buf.truncate()
+            elif isinstance(node, Element):
                 # render start tag or empty tag
                 node.type = Element.OPEN if not h.is_empty(node) else Element.EMPTY
                 self.push(index, node)
@@ -589,7 +637,7 @@ class MarkupRenderer(object):
                 self.pop()
         self.writeln()
         try:
-            return self._buf.getvalue().encode(encoding)
+            yield encoder.encode(self._buf.getvalue(), True)
         finally:
             self._buf.close()
 
@@ -814,6 +862,7 @@ class MarkupPrettifier(MarkupHandler):
         h = self._handler
 
         curr = h.renderer.peek()
+        _expand(curr.element)
         curr.flags = h.compile(curr.element)
         curr.pending = len(curr.element)
 
@@ -26,10 +26,13 @@
 
 import abc
 
+from . import local
 from . import _compat as five
+from .exception import AyameError
 
 
-__all__ = ['Model', 'InheritableModel', 'WrapModel', 'CompoundModel']
+__all__ = ['Model', 'InheritableModel', 'WrapModel', 'CompoundModel',
+           'LoadableDetachableModel', 'BatchLoader']
 
 
 class Model(object):
@@ -48,6 +51,10 @@ class Model(object):
 
     object = property(**object())
 
+    @property
+    def request_cache(self):
+        return local.context().request_cache
+
 
 class InheritableModel(five.with_metaclass(abc.ABCMeta, Model)):
 
@@ -132,3 +139,108 @@ class CompoundModel(InheritableModel):
             object = property(**object())
 
         return CompoundWrapModel(self)
+
+
+class LoadableDetachableModel(five.with_metaclass(abc.ABCMeta, Model)):
+
+    def __init__(self):
+        super(LoadableDetachableModel, self).__init__(None)
+        self.__attached = False
+
+    @property
+    def attached(self):
+        return self.__attached
+
+    def object():
+        def fget(self):
+            if not self.__attached:
+                Model.object.fset(self, self.load())
+                self.__attached = True
+            return Model.object.fget(self)
+
+        def fset(self, object):
+            Model.object.fset(self, object)
+            self.__attached = True
+
+        return locals()
+
+    object = property(**object())
+
+    def detach(self):
+        Model.object.fset(self, None)
+        self.__attached = False
+
+    @abc.abstractmethod
+    def load(self):
+        pass
+
+
+class BatchLoader(object):
+
+    def __init__(self, load):
+        self._load = load
+        self._pending = []
+        self._keys = set()
+        self.__memo = {}
+
+    @property
+    def _memo(self):
+        # loaded objects are kept per request
+        try:
+            cache = local.context().request_cache
+        except AyameError:
+            return self.__memo
+        memo = cache.get((BatchLoader, self))
+        if memo is None:
+            memo = cache[(BatchLoader, self)] = {}
+        return memo
+
+    def __contains__(self, key):
+        return key in self._memo
+
+    def model(self, key):
+        self._register(key)
+        return _BatchModel(self, key)
+
+    def get(self, key):
+        memo = self._memo
+        if key not in memo:
+            self._register(key)
+            self.load()
+        return memo[key]
+
+    def load(self):
+        keys = self._pending
+        self._pending = []
+        self._keys.clear()
+        if keys:
+            values = self._load(keys)
+            memo = self._memo
+            for k in keys:
+                memo[k] = values.get(k)
+
+    def clear(self):
+        self._pending = []
+        self._keys.clear()
+        self._memo.clear()
+
+    def _register(self, key):
+        if not (key in self._memo or
+                key in self._keys):
+            self._pending.append(key)
+            self._keys.add(key)
+
+
+class _BatchModel(LoadableDetachableModel):
+
+    def __init__(self, loader, key):
+        super(_BatchModel, self).__init__()
+        self.__loader = loader
+        self.__key = key
+
+    @property
+    def key(self):
+        return self.__key
+
+    def load(self):
+        return self.__loader.get(self.__key)
@@ -45,3 +45,11 @@ class HTTPStatusPage(core.Page):
         label.escape_model_string = False
         label.visible = bool(label.model_object)
         self.add(label)
+
+    def fire(self):
+        # request may not be available
+        pass
+
+    def render_partial(self, path):
+        # error page is not rendered partially
+        return self.render()
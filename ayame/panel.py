@@ -25,12 +25,12 @@
 #
 
 from . import _compat as five
-from . import core, basic, form, markup
+from . import core, basic, form, markup, util
 from . import model as mm
 from .exception import RenderingError
 
 
-__all__ = ['Panel', 'FeedbackPanel']
+__all__ = ['Panel', 'CachedPanel', 'FeedbackPanel']
 
 
 class Panel(core.MarkupContainer):
@@ -69,6 +69,71 @@ class Panel(core.MarkupContainer):
         return super(Panel, self).on_render(element)
 
 
+class CachedPanel(Panel):
+
+    def __init__(self, id, model=None, key=None, ttl=None):
+        super(CachedPanel, self).__init__(id, model)
+        self.ttl = ttl
+        self._key = key
+        self.__populated = False
+        self.__cache_key = None
+        self.__hit = None
+
+    def cache_key(self):
+        return (util.fqon_of(self.__class__), self._key, self.request.locale)
+
+    def populate(self):
+        pass
+
+    def on_configure(self):
+        # build children only when the fragment is not cached
+        self.__cache_key = self.cache_key()
+        self.__hit = self.config['ayame.panel.cache'].get(self.__cache_key)
+        if (self.__hit is None and
+            not self.__populated):
+            self.__populated = True
+            self.populate()
+        super(CachedPanel, self).on_configure()
+
+    def on_render(self, element):
+        pc = self.config['ayame.panel.cache']
+        leader = False
+        if self.__hit is None:
+            leader = pc.begin(self.__cache_key)
+            if not leader:
+                # rendered by another thread
+                self.__hit = pc.peek(self.__cache_key)
+        if self.__hit is not None:
+            children, head = self.__hit
+            if head:
+                self.page().head.extend(head.copy())
+            element[:] = children.copy()
+            return element
+
+        try:
+            try:
+                head = self.page().head
+                n = len(head)
+            except RenderingError:
+                head = None
+            element = super(CachedPanel, self).on_render(element)
+            # cache rendered nodes instead of streams
+            element.expand()
+            # copy nodes, element is still rendered after this
+            pc.put(self.__cache_key,
+                   (markup.Fragment(element.children).copy(),
+                    markup.Fragment(head[n:]).copy() if head is not None else None),
+                   self.ttl)
+            return element
+        finally:
+            if leader:
+                pc.end(self.__cache_key)
+
+    def on_after_render(self):
+        super(CachedPanel, self).on_after_render()
+        self.__hit = None
+
+
 class FeedbackPanel(Panel):
 
     def __init__(self, id):
@@ -78,13 +143,12 @@ class FeedbackPanel(Panel):
         self.add(self._ListView('feedback', mm.Model(self.__errors)))
 
     def on_configure(self):
+        del self.__errors[:]
         if self.request.path:
             c = self.page().find(self.request.path)
             if isinstance(c, form.Form):
-                for c, _ in c.walk():
-                    if (isinstance(c, form.FormComponent) and
-                        c.error):
-                        self.__errors.append(five.str(c.error))
+                self.__errors.extend(five.str(fc.error) for fc in c.errors
+                                     if fc.error)
         self.visible = bool(self.__errors)
 
     class _ListView(basic.ListView):
@@ -24,28 +24,698 @@
 #   SOFTWARE.
 #
 
+import atexit
+import base64
+import collections
+import contextlib
+import hashlib
+import hmac
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+
 from werkzeug import http
 from werkzeug.contrib.sessions import FilesystemSessionStore as FileSystemSessionStore
+from werkzeug.contrib.sessions import Session, SessionStore
+from werkzeug.contrib.sessions import _fs_transaction_suffix
+from werkzeug.posixemulation import rename
+
+from . import _compat as five
+from . import util
+from .exception import AyameError
+
+
+__all__ = ['get', 'exists', 'save', 'SessionProxy', 'FileSystemSessionStore', 'ShardedSessionStore', 'LRUSessionStore',
+           'CookieSessionStore', 'CookieSession', 'SQLiteSessionStore']
 
+_logger = logging.getLogger(__name__)
 
-__all__ = ['get', 'save', 'FileSystemSessionStore']
+# stores which have unsaved sessions
+_stores = weakref.WeakSet()
 
 
 def get(app, environ):
-    store = app.config['ayame.session.store']
+    # session is loaded on first access
+    return SessionProxy(app, environ)
+
+
+def exists(app, environ):
+    # request has the session cookie
     c = http.parse_cookie(environ.get('HTTP_COOKIE', ''))
-    sid = c.get(app.config['ayame.session.name'])
-    return store.new() if sid is None else store.get(sid)
+    return app.config['ayame.session.name'] in c
 
 
 def save(app, sess):
+    if isinstance(sess, SessionProxy):
+        if not sess.loaded:
+            return
+        sess = sess.session
     if not sess.should_save:
         return
-    app.config['ayame.session.store'].save(sess)
-    return ('Set-Cookie', http.dump_cookie(app.config['ayame.session.name'], sess.sid,
+    store = app.config['ayame.session.store']
+    if hasattr(store, 'persist'):
+        # cookie value
+        value = store.persist(sess, app.config['ayame.session.max_age'])
+    else:
+        # werkzeug.contrib.sessions.SessionStore
+        store.save(sess)
+        value = sess.sid
+    return ('Set-Cookie', http.dump_cookie(app.config['ayame.session.name'], value,
                                            app.config['ayame.session.max_age'],
                                            app.config['ayame.session.expires'],
                                            app.config['ayame.session.path'],
                                            app.config['ayame.session.domain'],
                                            app.config['ayame.session.secure'],
                                            app.config['ayame.session.httponly']))
+
+
+def _load(app, environ):
+    store = app.config['ayame.session.store']
+    c = http.parse_cookie(environ.get('HTTP_COOKIE', ''))
+    # session id or serialized session
+    value = c.get(app.config['ayame.session.name'])
+    return store.new() if value is None else store.get(value)
+
+
+class SessionProxy(object):
+
+    __slots__ = ('_app', '_environ', '_session')
+
+    def __init__(self, app, environ):
+        object.__setattr__(self, '_app', app)
+        object.__setattr__(self, '_environ', environ)
+        object.__setattr__(self, '_session', None)
+
+    @property
+    def loaded(self):
+        return self._session is not None
+
+    @property
+    def session(self):
+        if self._session is None:
+            object.__setattr__(self, '_session', _load(self._app, self._environ))
+        return self._session
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.session, name, value)
+
+    def __delattr__(self, name):
+        delattr(self.session, name)
+
+    def __getitem__(self, key):
+        return self.session[key]
+
+    def __setitem__(self, key, value):
+        self.session[key] = value
+
+    def __delitem__(self, key):
+        del self.session[key]
+
+    def __contains__(self, key):
+        return key in self.session
+
+    def __iter__(self):
+        return iter(self.session)
+
+    def __len__(self):
+        return len(self.session)
+
+    def __eq__(self, other):
+        return self.session == other
+
+    def __ne__(self, other):
+        return self.session != other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.session) if self.loaded else '<{} (not loaded)>'.format(self.__class__.__name__)
+
+
+class ShardedSessionStore(FileSystemSessionStore):
+
+    def __init__(self, path=None, filename_template='werkzeug_%s.sess', session_class=None,
+                 renew_missing=False, mode=0o644, levels=2, sweep_interval=3600.0, sweep_rate=1000):
+        super(ShardedSessionStore, self).__init__(path, filename_template, session_class, renew_missing, mode)
+        self.levels = levels
+        self.sweep_interval = sweep_interval
+        # maximum number of files checked per second
+        self.sweep_rate = sweep_rate
+        self.__max_age = None
+        self.__sweeper = None
+        self.__stop = threading.Event()
+        self.__lock = threading.Lock()
+
+    def get_session_filename(self, sid):
+        path = super(ShardedSessionStore, self).get_session_filename(sid)
+        if not self.levels:
+            return path
+        h = hashlib.md5(util.to_bytes(sid)).hexdigest()
+        dirs = [h[i * 2:i * 2 + 2] for i in five.range(self.levels)]
+        return os.path.join(self.path, *dirs + [os.path.basename(path)])
+
+    def get(self, sid):
+        if (self.levels and
+            self.is_valid_key(sid)):
+            path = self.get_session_filename(sid)
+            flat = super(ShardedSessionStore, self).get_session_filename(sid)
+            if (not os.path.exists(path) and
+                os.path.exists(flat)):
+                # move session saved before sharding
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError:
+                    pass
+                try:
+                    rename(flat, path)
+                except OSError:
+                    pass
+        return super(ShardedSessionStore, self).get(sid)
+
+    def save(self, session):
+        self._dump(session.sid, dict(session))
+
+    def persist(self, session, max_age):
+        self.save(session)
+        self.start_sweeper(max_age)
+        return session.sid
+
+    def list(self):
+        before, after = self.filename_template.split('%s', 1)
+        return [name[len(before):len(name) - len(after)] for _, name in self._iter_files()]
+
+    def sweep(self, max_age, rate=None, stop=None):
+        # remove sessions which are not saved in max_age seconds
+        start = time.time()
+        expires = start - max_age
+        n = checked = 0
+        for root, name in self._iter_files():
+            if (stop is not None and
+                stop.is_set()):
+                break
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < expires:
+                    os.remove(path)
+                    n += 1
+            except OSError:
+                pass
+            checked += 1
+            if (rate and
+                checked % rate == 0):
+                # check up to rate files per second
+                delay = start + checked / float(rate) - time.time()
+                if 0 < delay:
+                    if stop is None:
+                        time.sleep(delay)
+                    else:
+                        stop.wait(delay)
+        return n
+
+    def start_sweeper(self, max_age):
+        if max_age is None:
+            return
+        with self.__lock:
+            self.__max_age = max_age
+            if self.__sweeper is None:
+                self.__stop.clear()
+                self.__sweeper = threading.Thread(target=self._sweep, name='ayame.session.sweeper')
+                self.__sweeper.daemon = True
+                self.__sweeper.start()
+
+    def close(self):
+        with self.__lock:
+            sweeper = self.__sweeper
+            self.__sweeper = None
+            self.__stop.set()
+        if sweeper is not None:
+            sweeper.join()
+
+    def _sweep(self):
+        while not self.__stop.wait(self.sweep_interval):
+            self.sweep(self.__max_age, self.sweep_rate, self.__stop)
+
+    def _iter_files(self):
+        # session files
+        before, after = self.filename_template.split('%s', 1)
+
+        def walk(path, depth):
+            try:
+                names = os.listdir(path)
+            except OSError:
+                return
+            for name in names:
+                if (depth < self.levels and
+                    len(name) == 2 and
+                    os.path.isdir(os.path.join(path, name))):
+                    for v in walk(os.path.join(path, name), depth + 1):
+                        yield v
+                elif (name.startswith(before) and
+                      name.endswith(after) and
+                      len(before) + len(after) < len(name) and
+                      not name.endswith(_fs_transaction_suffix)):
+                    yield path, name
+
+        return walk(self.path, 0)
+
+    def _dump(self, sid, data):
+        data = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        path = self.get_session_filename(sid)
+        dir = os.path.dirname(path)
+        if not os.path.isdir(dir):
+            try:
+                os.makedirs(dir)
+            except OSError:
+                # created by another thread
+                if not os.path.isdir(dir):
+                    raise
+        fd, tmp = tempfile.mkstemp(suffix=_fs_transaction_suffix, dir=dir)
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+            rename(tmp, path)
+            tmp = None
+            os.chmod(path, self.mode)
+        finally:
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+
+class LRUSessionStore(ShardedSessionStore):
+
+    def __init__(self, path=None, filename_template='werkzeug_%s.sess', session_class=None,
+                 renew_missing=False, mode=0o644, cap=1024, interval=1.0, batch_size=64, levels=0,
+                 sweep_interval=3600.0, sweep_rate=1000):
+        super(LRUSessionStore, self).__init__(path, filename_template, session_class, renew_missing, mode,
+                                              levels, sweep_interval, sweep_rate)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.__cache = _SessionCache(cap, self)
+        # sessions which are not written yet
+        self.__dirty = collections.OrderedDict()
+        self.__cond = threading.Condition()
+        self.__io_lock = threading.Lock()
+        self.__writer = None
+        self.__closed = False
+
+    def cap():
+        def fget(self):
+            return self.__cache.cap
+
+        def fset(self, cap):
+            self.__cache.cap = cap
+
+        return locals()
+
+    cap = property(**cap())
+
+    def __len__(self):
+        return len(self.__cache)
+
+    def __contains__(self, sid):
+        return sid in self.__cache
+
+    def get(self, sid):
+        if not self.is_valid_key(sid):
+            return self.new()
+        data = self.__cache.get(sid)
+        if data is None:
+            with self.__cond:
+                data = self.__dirty.get(sid)
+            if data is None:
+                # restore from disk
+                sess = super(LRUSessionStore, self).get(sid)
+                if (sess.sid == sid and
+                    sess):
+                    self.__cache[sid] = dict(sess)
+                return sess
+            self.__cache[sid] = data
+        return self.session_class(dict(data), sid, False)
+
+    def save(self, session):
+        data = dict(session)
+        self.__cache[session.sid] = data
+        with self.__cond:
+            self.__dirty.pop(session.sid, None)
+            self.__dirty[session.sid] = data
+            closed = self.__closed
+            if not closed:
+                self._start()
+                if self.batch_size <= len(self.__dirty):
+                    self.__cond.notify()
+        if closed:
+            self.flush()
+
+    def delete(self, session):
+        with self.__io_lock:
+            self.__cache.pop(session.sid, None)
+            with self.__cond:
+                self.__dirty.pop(session.sid, None)
+            super(LRUSessionStore, self).delete(session)
+
+    def list(self):
+        sids = set(super(LRUSessionStore, self).list())
+        with self.__cond:
+            sids.update(self.__dirty)
+        return list(sids)
+
+    def flush(self):
+        # write all dirty sessions
+        while self._write():
+            pass
+
+    def close(self):
+        # write all dirty sessions and stop the writer
+        with self.__cond:
+            self.__closed = True
+            writer = self.__writer
+            self.__cond.notify()
+        self.flush()
+        if writer is not None:
+            writer.join()
+        super(LRUSessionStore, self).close()
+
+    def _start(self):
+        if self.__writer is None:
+            _stores.add(self)
+            self.__writer = threading.Thread(target=self._run, name='ayame.session.writer')
+            self.__writer.daemon = True
+            self.__writer.start()
+
+    def _run(self):
+        try:
+            while True:
+                with self.__cond:
+                    if (len(self.__dirty) < self.batch_size and
+                        not self.__closed):
+                        # wait for sessions to be batched
+                        self.__cond.wait(self.interval)
+                    if not self.__dirty:
+                        # exit while idle
+                        self.__writer = None
+                        _stores.discard(self)
+                        return
+                self._write()
+        except Exception:
+            with self.__cond:
+                self.__writer = None
+            raise
+
+    def _write(self):
+        with self.__io_lock:
+            with self.__cond:
+                batch = []
+                for sid, data in self.__dirty.items():
+                    if len(batch) == self.batch_size:
+                        break
+                    batch.append((sid, data))
+            for sid, data in batch:
+                try:
+                    self._dump(sid, data)
+                except Exception:
+                    # session is discarded
+                    _logger.exception('cannot write session %s', sid)
+            with self.__cond:
+                for sid, data in batch:
+                    if self.__dirty.get(sid) is data:
+                        del self.__dirty[sid]
+        return bool(batch)
+
+    def _evicted(self, sid):
+        with self.__cond:
+            if sid in self.__dirty:
+                # flush evicted session immediately
+                self.__cond.notify()
+
+
+class CookieSessionStore(SessionStore):
+
+    # payload types
+    _RAW = b'r'
+    _ZLIB = b'z'
+    _REF = b's'
+
+    def __init__(self, secret_keys, fallback=None, compress=True, max_size=4000, max_age=None,
+                 session_class=None, digestmod=hashlib.sha256):
+        super(CookieSessionStore, self).__init__(session_class or CookieSession)
+        if isinstance(secret_keys, (five.string_type, bytes)):
+            secret_keys = (secret_keys,)
+        if not secret_keys:
+            raise AyameError('secret key is required')
+        # first key is used for signing, and others are for verification
+        self.secret_keys = tuple(util.to_bytes(k) for k in secret_keys)
+        self.fallback = fallback
+        self.compress = compress
+        self.max_size = max_size
+        self.max_age = max_age
+        self.digestmod = digestmod
+
+    def get(self, value):
+        payload = self._verify(value)
+        if payload is None:
+            return self.new()
+        type, payload = payload[:1], payload[1:]
+        try:
+            if type == self._ZLIB:
+                payload = zlib.decompress(payload)
+            if type == self._REF:
+                sid, issued = pickle.loads(payload)
+                data = None
+            else:
+                sid, issued, data = pickle.loads(payload)
+        except Exception:
+            return self.new()
+        if (self.max_age is not None and
+            issued + self.max_age < time.time()):
+            # expired
+            return self.new()
+        elif data is None:
+            # stored on server side
+            if self.fallback is None:
+                return self.new()
+            data = dict(self.fallback.get(sid))
+            sess = self.session_class(data, sid, False)
+            if isinstance(sess, CookieSession):
+                sess.stored = True
+            return sess
+        return self.session_class(data, sid, False)
+
+    def save(self, session):
+        self.dumps(session)
+
+    def persist(self, session, max_age):
+        return self.dumps(session)
+
+    def delete(self, session):
+        if self.fallback is not None:
+            self.fallback.delete(session)
+
+    def dumps(self, session):
+        issued = time.time()
+        payload = pickle.dumps((session.sid, issued, dict(session)), pickle.HIGHEST_PROTOCOL)
+        type = self._RAW
+        if self.compress:
+            data = zlib.compress(payload)
+            if len(data) < len(payload):
+                type = self._ZLIB
+                payload = data
+        value = self._sign(type + payload)
+        stored = not isinstance(session, CookieSession) or session.stored
+        if len(value) <= self.max_size:
+            if (self.fallback is not None and
+                stored):
+                # remove session stored on server side
+                self.fallback.delete(session)
+                if isinstance(session, CookieSession):
+                    session.stored = False
+            return value
+        elif self.fallback is None:
+            raise AyameError('session exceeds the cookie size limit')
+        # store on server side
+        self.fallback.save(session)
+        if isinstance(session, CookieSession):
+            session.stored = True
+        return self._sign(self._REF + pickle.dumps((session.sid, issued), pickle.HIGHEST_PROTOCOL))
+
+    def _sign(self, payload):
+        mac = hmac.new(self.secret_keys[0], payload, self.digestmod).digest()
+        return u'.'.join(_b64encode(v) for v in (payload, mac))
+
+    def _verify(self, value):
+        try:
+            payload, mac = (_b64decode(v) for v in value.split(u'.'))
+        except (TypeError, ValueError):
+            return
+        for key in self.secret_keys:
+            if hmac.compare_digest(hmac.new(key, payload, self.digestmod).digest(), mac):
+                return payload
+
+
+class CookieSession(Session):
+
+    __slots__ = ('stored',)
+
+    def __init__(self, data, sid, new=False):
+        super(CookieSession, self).__init__(data, sid, new)
+        # stored on server side
+        self.stored = False
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(s):
+    s = util.to_bytes(s, 'ascii')
+    return base64.urlsafe_b64decode(s + b'=' * (-len(s) % 4))
+
+
+class SQLiteSessionStore(SessionStore):
+
+    def __init__(self, path, session_class=None, renew_missing=False, max_age=None,
+                 pool_size=4, timeout=30.0, cache=0, cache_ttl=1.0, expire_interval=60.0,
+                 expire_batch=256):
+        super(SQLiteSessionStore, self).__init__(session_class)
+        # sessions are unpickled from the database, so it must not be shared
+        self.path = path
+        self.renew_missing = renew_missing
+        self.max_age = max_age
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.expire_interval = expire_interval
+        self.expire_batch = expire_batch
+        # read cache
+        self.__cache = util.LRUCache(cache) if 0 < cache else None
+        self.__pool = []
+        self.__pid = None
+        self.__lock = threading.Lock()
+        self.__expired = time.time()
+
+    def get(self, sid):
+        if not self.is_valid_key(sid):
+            return self.new()
+        now = time.time()
+        if self.__cache is not None:
+            e = self.__cache.get(sid)
+            if (e is not None and
+                now < e[0] + self.cache_ttl):
+                return self.session_class(dict(e[1]), sid, False)
+        with self._connect() as conn:
+            row = conn.execute('SELECT data, mtime FROM session WHERE sid = ?', (sid,)).fetchone()
+        if (row is not None and
+            not (self.max_age is not None and
+                 row[1] + self.max_age < now)):
+            try:
+                data = pickle.loads(bytes(row[0]))
+            except Exception:
+                data = {}
+        elif self.renew_missing:
+            return self.new()
+        else:
+            data = {}
+        if self.__cache is not None:
+            self.__cache[sid] = (now, data)
+        return self.session_class(dict(data), sid, False)
+
+    def save(self, session):
+        data = dict(session)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO session (sid, data, mtime) VALUES (?, ?, ?)',
+                         (session.sid, sqlite3.Binary(pickle.dumps(data, pickle.HIGHEST_PROTOCOL)), now))
+            if (self.max_age is not None and
+                self.__expired + self.expire_interval <= now):
+                self.__expired = now
+                self._expire(conn, now)
+        if self.__cache is not None:
+            self.__cache[session.sid] = (now, data)
+
+    def delete(self, session):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM session WHERE sid = ?', (session.sid,))
+        if self.__cache is not None:
+            self.__cache.pop(session.sid, None)
+
+    def list(self):
+        with self._connect() as conn:
+            return [sid for sid, in conn.execute('SELECT sid FROM session')]
+
+    def expire(self):
+        # delete all expired sessions
+        if self.max_age is None:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            while self._expire(conn, now) == self.expire_batch:
+                pass
+
+    def close(self):
+        with self.__lock:
+            pool, self.__pool = self.__pool, []
+            if self.__pid == os.getpid():
+                for conn in pool:
+                    conn.close()
+
+    def _expire(self, conn, now):
+        # delete expired sessions in batch
+        return conn.execute('DELETE FROM session WHERE sid IN '
+                            '(SELECT sid FROM session WHERE mtime < ? LIMIT ?)',
+                            (now - self.max_age, self.expire_batch)).rowcount
+
+    @contextlib.contextmanager
+    def _connect(self):
+        with self.__lock:
+            if self.__pid != os.getpid():
+                # connections are not shared with forked processes
+                self.__pool = []
+                self.__pid = os.getpid()
+            conn = self.__pool.pop() if self.__pool else None
+        if conn is None:
+            conn = sqlite3.connect(self.path, self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS session '
+                         '(sid TEXT PRIMARY KEY, data BLOB NOT NULL, mtime REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS session_mtime ON session (mtime)')
+        try:
+            yield conn
+        except Exception:
+            conn.close()
+            raise
+        with self.__lock:
+            if len(self.__pool) < self.pool_size:
+                self.__pool.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+
+class _SessionCache(util.LRUCache):
+
+    __slots__ = ('_store',)
+
+    def __init__(self, cap, store):
+        super(_SessionCache, self).__init__(cap)
+        self._store = store
+
+    def on_evicted(self, key, value):
+        self._store._evicted(key)
+
+
+@atexit.register
+def _flush():
+    for store in list(_stores):
+        store.flush()
@@ -0,0 +1,243 @@
+#
+# ayame.store
+#
+#   Copyright (c) 2011-2014 Akinori Hattori <hattya@gmail.com>
+#
+#   Permission is hereby granted, free of charge, to any person
+#   obtaining a copy of this software and associated documentation files
+#   (the "Software"), to deal in the Software without restriction,
+#   including without limitation the rights to use, copy, modify, merge,
+#   publish, distribute, sublicense, and/or sell copies of the Software,
+#   and to permit persons to whom the Software is furnished to do so,
+#   subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be
+#   included in all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#   EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#   MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+#   NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+#   BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+#   ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+#   CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#   SOFTWARE.
+#
+
+
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+import zlib
+
+from . import _compat as five
+from . import util
+
+
+__all__ = ['PageStore']
+
+_id_re = re.compile(r'\A[0-9A-Za-z_-]+\Z')
+
+
+class PageStore(object):
+
+    def __init__(self, path, cap=32, filename_template='ayame_%s.page', max_age=86400):
+        # pages are unpickled from path, so it must not be shared
+        self.path = path
+        self.filename_template = filename_template
+        self.max_age = max_age
+        self.__cache = _PageCache(cap, self)
+        self.__lock = threading.Lock()
+        self.__spilling = {}
+        self.__pending = []
+        self.__swept = time.time()
+
+    def cap():
+        def fget(self):
+            return self.__cache.cap
+
+        def fset(self, cap):
+            with self.__lock:
+                self.__cache.cap = cap
+            self._spill_pending()
+
+        return locals()
+
+    cap = property(**cap())
+
+    def __len__(self):
+        return len(self.__cache)
+
+    def __contains__(self, key):
+        return key in self.__cache
+
+    def new_id(self):
+        return util.new_token()[:16]
+
+    def put(self, sid, page_id, page):
+        if not (self.is_valid_id(sid) and
+                self.is_valid_id(page_id)):
+            return
+        with self.__lock:
+            key = (sid, page_id)
+            self.__spilling.pop(key, None)
+            self.__cache[key] = page
+        self._spill_pending()
+
+    def get(self, sid, page_id):
+        # the page is checked out until it is put back
+        if not (self.is_valid_id(sid) and
+                self.is_valid_id(page_id)):
+            return
+        with self.__lock:
+            key = (sid, page_id)
+            if key in self.__cache:
+                return self.__cache.pop(key)
+            elif key in self.__spilling:
+                return self.__spilling.pop(key)
+            path = self._checkout(key)
+        if path is not None:
+            return self._load(path)
+
+    def remove(self, sid, page_id):
+        if not (self.is_valid_id(sid) and
+                self.is_valid_id(page_id)):
+            return
+        with self.__lock:
+            key = (sid, page_id)
+            self.__cache.pop(key, None)
+            self.__spilling.pop(key, None)
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+    def sweep(self):
+        # remove spilled pages which are not accessed in max_age seconds
+        self.__swept = now = time.time()
+        if self.max_age is None:
+            return 0
+        before, after = self.filename_template.split('%s', 1)
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return 0
+        n = 0
+        for name in names:
+            if (name.startswith(before) and
+                name.endswith(after) and
+                len(before) + len(after) < len(name)):
+                path = os.path.join(self.path, name)
+                try:
+                    if os.path.getmtime(path) < now - self.max_age:
+                        os.remove(path)
+                        n += 1
+                except OSError:
+                    pass
+        return n
+
+    def is_valid_id(self, id):
+        return (isinstance(id, five.string_type) and
+                _id_re.match(id) is not None)
+
+    def path_for(self, key):
+        return os.path.join(self.path, self.filename_template % u'-'.join(key))
+
+    def _evicted(self, key, page):
+        # spilled after the lock is released
+        self.__spilling[key] = page
+        self.__pending.append(key)
+
+    def _spill_pending(self):
+        with self.__lock:
+            pending = self.__pending
+            self.__pending = []
+        for key in pending:
+            self._spill(key)
+        if (self.max_age is not None and
+            self.__swept + self.max_age / 2.0 <= time.time()):
+            self.sweep()
+
+    def _spill(self, key):
+        with self.__lock:
+            page = self.__spilling.get(key)
+        if page is None:
+            # checked out
+            return
+        try:
+            data = zlib.compress(pickle.dumps(page, pickle.HIGHEST_PROTOCOL))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # page is discarded
+            data = None
+        tmp = None
+        try:
+            if data is not None:
+                if not os.path.isdir(self.path):
+                    os.makedirs(self.path)
+                fd, tmp = tempfile.mkstemp(dir=self.path)
+                with os.fdopen(fd, 'wb') as fp:
+                    fp.write(data)
+            with self.__lock:
+                if self.__spilling.get(key) is page:
+                    del self.__spilling[key]
+                    if tmp is not None:
+                        os.rename(tmp, self.path_for(key))
+                        tmp = None
+        except (IOError, OSError):
+            with self.__lock:
+                if self.__spilling.get(key) is page:
+                    del self.__spilling[key]
+        finally:
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def _checkout(self, key):
+        # move the spilled page out of the way, and load it after the lock
+        # is released
+        path = self.path_for(key)
+        tmp = u'{}.{}'.format(path, util.new_token()[:8])
+        try:
+            os.rename(path, tmp)
+        except OSError:
+            return
+        return tmp
+
+    def _load(self, path):
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+        except (IOError, OSError):
+            return
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        try:
+            return pickle.loads(zlib.decompress(data))
+        except Exception:
+            pass
+
+
+class _PageCache(util.LRUCache):
+
+    __slots__ = ('_store',)
+
+    def __init__(self, cap, store):
+        super(_PageCache, self).__init__(cap)
+        self._store = store
+
+    def _sweep(self):
+        # evicted pages are spilled to disk
+        if 0 <= self._cap:
+            it = self._iter(reverse=True)
+            while self._cap < len(self._ref):
+                e = next(it)
+                self._evict(e)
+                self._store._evicted(e.key, e.value)
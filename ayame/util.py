@@ -33,7 +33,7 @@ import threading
 from . import _compat as five
 
 
-__all__ = ['fqon_of', 'to_bytes', 'to_list', 'new_token', 'FilterDict',
+__all__ = ['fqon_of', 'to_bytes', 'to_list', 'new_token', 'token_of', 'FilterDict',
            'RWLock', 'LRUCache', 'LFUCache']
 
 if five.PY2:
@@ -76,6 +76,12 @@ def new_token(algorithm='sha1'):
     return m.hexdigest()
 
 
+def token_of(value, algorithm='sha1'):
+    m = hashlib.new(algorithm)
+    m.update(to_bytes(value))
+    return m.hexdigest()
+
+
 def iterable(o):
     return (isinstance(o, collections.Iterable) and
             not isinstance(o, five.string_type))
@@ -108,7 +114,10 @@ class FilterDict(dict):
         return super(FilterDict, self).__contains__(self.__convert__(item))
 
     def __copy__(self):
-        return self.__class__(self)
+        # keys are already converted
+        d = self.__class__()
+        super(FilterDict, d).update(self)
+        return d
 
     copy = __copy__
 
@@ -0,0 +1,86 @@
+#
+# bench_list_view
+#
+#   Copyright (c) 2011-2014 Akinori Hattori <hattya@gmail.com>
+#
+#   Permission is hereby granted, free of charge, to any person
+#   obtaining a copy of this software and associated documentation files
+#   (the "Software"), to deal in the Software without restriction,
+#   including without limitation the rights to use, copy, modify, merge,
+#   publish, distribute, sublicense, and/or sell copies of the Software,
+#   and to permit persons to whom the Software is furnished to do so,
+#   subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be
+#   included in all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#   EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#   MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+#   NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+#   BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+#   ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+#   CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#   SOFTWARE.
+#
+
+# usage: PYTHONPATH=. python tests/bench_list_view.py [rows] [repeat]
+
+import sys
+import timeit
+
+import ayame
+from ayame import _compat as five
+from ayame import basic, local, markup
+
+
+class ListItem(basic._ListItem):
+
+    # disable the row template
+    def on_render_element(self, element):
+        return super(ListItem, self).on_render_element(element)
+
+
+class ListView(basic.ListView):
+
+    def new_item(self, index):
+        return ListItem(index, self.new_model(index))
+
+
+def populate_item(li):
+    li.add(basic.Label('name', li.model.object))
+    li.add(basic.Label('value', li.model.object))
+
+
+def new_root():
+    tr = markup.Element(markup.QName(markup.XHTML_NS, 'tr'),
+                        attrib={markup.AYAME_ID: 'rows'})
+    for id in ('name', 'value'):
+        td = markup.Element(markup.QName(markup.XHTML_NS, 'td'))
+        td.append(markup.Element(markup.QName(markup.XHTML_NS, 'span'),
+                                 attrib={markup.AYAME_ID: id}))
+        tr.append(td)
+    return tr
+
+
+def render(class_, values):
+    mc = ayame.MarkupContainer('table')
+    mc.add(class_('rows', values, populate_item))
+    return mc.render(new_root())
+
+
+def main(rows=10000, repeat=5):
+    app = ayame.Ayame(__name__)
+    values = [five.str(i) for i in five.range(rows)]
+    local.push(app, None)
+    try:
+        for name, class_ in (('row template', basic.ListView),
+                             ('on_render', ListView)):
+            t = min(timeit.repeat(lambda: render(class_, values), number=1, repeat=repeat))
+            print('{:<12}  {:>6} rows  {:.3f}s'.format(name, rows, t))
+    finally:
+        local.pop()
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -24,13 +24,18 @@
 #   SOFTWARE.
 #
 
+import gzip
+import io
 import locale
 import os
+import re
 import shutil
 import tempfile
+import zlib
 
 import ayame
-from ayame import basic, http, uri
+from ayame import _compat as five
+from ayame import basic, cache, http, link, model, panel, uri
 from base import AyameTestCase
 
 
@@ -200,6 +205,53 @@ class AppTestCase(AyameTestCase):
             request.session
         self.assert_equal(request.locale, ('en', 'US'))
 
+        self.assert_equal(ayame.app._locales['en-us, en'], ('en', 'US'))
+
+    def test_request_lazy(self):
+        query = '{path}=spam'
+        data = self.form_data(('{path}', 'eggs'),
+                              ('a', ('a.txt', 'spam' * 1024, 'text/plain')),
+                              ('x', 'ham'))
+        environ = self.new_environ(method='POST', query=query, form=data)
+        environ['HTTP_ACCEPT_LANGUAGE'] = 'ja'
+        chunk_size = http._MultipartParser.chunk_size
+        try:
+            http._MultipartParser.chunk_size = 128
+            request = ayame.Request(environ, {})
+            self.assert_equal(environ['wsgi.input'].tell(), 0)
+            self.assert_equal(request.path, 'eggs')
+            self.assert_less(environ['wsgi.input'].tell(), int(environ['CONTENT_LENGTH']))
+            self.assert_equal(request.form_data['x'], ['ham'])
+            self.assert_equal(environ['wsgi.input'].tell(), int(environ['CONTENT_LENGTH']))
+            self.assert_equal(request.form_data[ayame.AYAME_PATH], ['eggs'])
+            self.assert_equal(request.form_data['a'][0].value, b'spam' * 1024)
+            self.assert_is_none(request.page_id)
+            self.assert_is_none(request.partial)
+            self.assert_false(request.validate)
+            self.assert_equal(request.locale, ('ja', None))
+            self.assert_equal(ayame.app._locales['ja'], ('ja', None))
+
+            request.path = None
+            self.assert_is_none(request.path)
+        finally:
+            http._MultipartParser.chunk_size = chunk_size
+
+    def test_page_lazy(self):
+        data = self.form_data(('{path}', 'link'),
+                              ('a', ('a.txt', 'spam' * 1024, 'text/plain')))
+        environ = self.new_environ(method='POST', form=data)
+        chunk_size = http._MultipartParser.chunk_size
+        try:
+            http._MultipartParser.chunk_size = 128
+            with self.application(environ):
+                p = StatefulPage()
+                status, headers, content = p()
+            self.assert_equal(status, http.OK.status)
+            self.assert_equal(p.find('count').model_object, 1)
+            self.assert_less(environ['wsgi.input'].tell(), int(environ['CONTENT_LENGTH']))
+        finally:
+            http._MultipartParser.chunk_size = chunk_size
+
 
 class SimpleAppTestCase(AyameTestCase):
 
@@ -215,11 +267,18 @@ class SimpleAppTestCase(AyameTestCase):
         super(SimpleAppTestCase, self).setup()
         self.app = ayame.Ayame(__name__)
         self.app.config['ayame.session.store'].path = self.session_dir
+        self.app.config['ayame.page.store'].path = self.session_dir
         map = self.app.config['ayame.route.map']
         map.connect('/page', SimplePage)
         map.connect('/int', 0)
         map.connect('/class', object)
         map.connect('/redir', RedirectPage)
+        map.connect('/prototype', PrototypePage)
+        map.connect('/stateful', StatefulPage)
+        map.connect('/cached', CachedPage)
+        map.connect('/static', StaticPage)
+        map.connect('/partial', PartialPage)
+        map.connect('/streaming', StreamingPage)
 
     def new_environ(self, method='GET', path='', query=''):
         return super(SimpleAppTestCase, self).new_environ(method=method,
@@ -279,6 +338,29 @@ class SimpleAppTestCase(AyameTestCase):
         self.assert_is_none(exc_info)
         self.assert_true(content)
 
+    def test_get_not_found(self):
+        # GET /missing -> NotFound
+        environ = self.new_environ('GET', '/missing')
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        self.assert_equal(status, http.NotFound.status)
+        self.assert_equal(headers,
+                          [('Content-Type', 'text/html; charset=UTF-8'),
+                           ('Content-Length', str(len(content[0])))])
+        self.assert_is_none(exc_info)
+        self.assert_in(b'<code>/missing</code>', content[0])
+        self.assert_equal(len(self.app.config['ayame.page.error']), 1)
+
+        # GET /missing/again -> NotFound (cached)
+        environ = self.new_environ('GET', '/missing/again')
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        self.assert_equal(status, http.NotFound.status)
+        self.assert_equal(headers,
+                          [('Content-Type', 'text/html; charset=UTF-8'),
+                           ('Content-Length', str(len(content[0])))])
+        self.assert_is_none(exc_info)
+        self.assert_in(b'<code>/missing/again</code>', content[0])
+        self.assert_equal(len(self.app.config['ayame.page.error']), 1)
+
     def test_get_redir_http_500(self):
         # GET /redir -> InternalServerError
         environ = self.new_environ('GET', '/redir')
@@ -321,6 +403,453 @@ class SimpleAppTestCase(AyameTestCase):
         self.assert_is_none(exc_info)
         self.assert_equal(content, [html])
 
+    def test_get_prototype(self):
+        # GET /prototype -> OK
+        PrototypePage.instances = 0
+        for message in ('spam', 'eggs'):
+            environ = self.new_environ('GET', '/prototype', query='message=' + message)
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            html = self.format(SimplePage, message=message)
+            self.assert_equal(status, http.OK.status)
+            self.assert_equal(headers,
+                              [('Content-Type', 'text/html; charset=UTF-8'),
+                               ('Content-Length', str(len(html)))])
+            self.assert_is_none(exc_info)
+            self.assert_equal(content, [html])
+        self.assert_equal(PrototypePage.instances, 1)
+        # prototype is never rendered
+        p = self.app.config['ayame.page.prototype'][PrototypePage]
+        self.assert_is_none(p.find('message').model)
+        self.assert_equal(p.headers.items(), [])
+
+    def test_clone_page(self):
+        with self.application(self.new_environ('GET', '/prototype', query='message=ham')):
+            p = PrototypePage()
+            b = ayame.AttributeModifier('class', model.Model('spam'))
+            p.find('message').add(b)
+            p.headers['X-Spam'] = 'eggs'
+            c = p.clone()
+        self.assert_is_not(c, p)
+        self.assert_is_instance(c, PrototypePage)
+        self.assert_equal(c.headers.items(), [('X-Spam', 'eggs')])
+        c.headers['X-Eggs'] = 'ham'
+        self.assert_equal(p.headers.items(), [('X-Spam', 'eggs')])
+
+        label = c.find('message')
+        self.assert_is_not(label, p.find('message'))
+        self.assert_is(label.parent, c)
+        self.assert_equal(c.children, [label])
+        self.assert_equal(len(label.behaviors), 1)
+        self.assert_is_not(label.behaviors[0], b)
+        self.assert_is_not(label.behaviors[0]._model, b._model)
+        # model objects are shared
+        self.assert_equal(label.behaviors[0]._model.object, 'spam')
+
+    def test_clone_bound_method(self):
+        with self.application(self.new_environ('GET', '/prototype', query='message=ham')):
+            p = PrototypePage()
+            p.add(basic.ListView('items', [], p.populate_item))
+            c = p.clone()
+        lv = c.find('items')
+        self.assert_is(lv._populate_item.__self__, c)
+        self.assert_equal(lv._populate_item, c.populate_item)
+        self.assert_is(p.find('items')._populate_item.__self__, p)
+
+    def test_get_stateful(self):
+        # GET /stateful -> OK
+        StatefulPage.instances = 0
+        environ = self.new_environ('GET', '/stateful')
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        self.assert_equal(status, http.OK.status)
+        self.assert_is_none(exc_info)
+        self.assert_in(b'<p>0</p>', content[0])
+        cookie = [v for n, v in headers if n == 'Set-Cookie']
+        self.assert_equal(len(cookie), 1)
+        cookie = cookie[0].split(';', 1)[0]
+        page_id = re.search(br'ayame%3Apage=(\w+)', content[0]).group(1).decode('ascii')
+        self.assert_equal(len(self.app.config['ayame.page.store']), 1)
+
+        # GET /stateful?ayame:path=link&ayame:page={page_id} -> OK
+        for i in five.range(1, 3):
+            query = '{path}=link&ayame:page=' + page_id
+            environ = self.new_environ('GET', '/stateful', query=query)
+            environ['HTTP_COOKIE'] = cookie
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            self.assert_equal(status, http.OK.status)
+            self.assert_is_none(exc_info)
+            self.assert_in('<p>{}</p>'.format(i).encode('ascii'), content[0])
+            self.assert_equal(len([h for h in headers if h[0] == 'Content-Type']), 1)
+        self.assert_equal(StatefulPage.instances, 1)
+        # models are detached before the page is stored
+        ps = self.app.config['ayame.page.store']
+        p = list(ps._PageStore__cache.values())[0]
+        self.assert_false(p.find('total').model.attached)
+
+        # unknown page id
+        query = '{path}=link&ayame:page=spam'
+        environ = self.new_environ('GET', '/stateful', query=query)
+        environ['HTTP_COOKIE'] = cookie
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        self.assert_equal(status, http.OK.status)
+        self.assert_in(b'<p>1</p>', content[0])
+        self.assert_equal(StatefulPage.instances, 2)
+        self.assert_equal(len(self.app.config['ayame.page.store']), 2)
+
+    def test_get_cached(self):
+        # GET /cached -> OK
+        CachedPage.instances = 0
+        pc = self.app.config['ayame.page.cache']
+        pc.clear()
+        for message, i, hits, misses in (('spam', 1, 0, 1),
+                                         ('spam', 1, 1, 1),
+                                         ('eggs', 2, 1, 2),
+                                         ('spam', 2, 2, 2)):
+            environ = self.new_environ('GET', '/cached', query='message=' + message)
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            html = self.format(SimplePage, message=message)
+            self.assert_equal(status, http.OK.status)
+            self.assert_equal(headers,
+                              [('Content-Type', 'text/html; charset=UTF-8'),
+                               ('Content-Length', str(len(html)))])
+            self.assert_is_none(exc_info)
+            self.assert_equal(content, [html])
+            self.assert_equal(CachedPage.instances, i)
+            self.assert_equal((pc.hits, pc.misses), (hits, misses))
+
+        # POST /cached -> OK
+        environ = self.new_environ('POST', '/cached', query='message=spam')
+        self.wsgi_call(environ)
+        self.assert_equal(CachedPage.instances, 3)
+        # GET /cached?ayame:path= -> OK
+        environ = self.new_environ('GET', '/cached', query='message=spam&{path}=')
+        self.wsgi_call(environ)
+        self.assert_equal(CachedPage.instances, 4)
+
+    def test_get_cached_not_modified(self):
+        # GET /cached -> OK
+        pc = self.app.config['ayame.page.cache']
+        pc.clear()
+        self.app.config['ayame.page.etag'] = True
+        try:
+            environ = self.new_environ('GET', '/cached', query='message=spam')
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            self.assert_equal(status, http.OK.status)
+            etag = dict(headers)['ETag']
+            # GET /cached -> NotModified
+            for _ in five.range(2):
+                environ = self.new_environ('GET', '/cached', query='message=spam')
+                environ['HTTP_IF_NONE_MATCH'] = etag
+                status, headers, exc_info, content = self.wsgi_call(environ)
+                self.assert_equal(status, http.NotModified.status)
+                self.assert_equal(headers, [('ETag', etag)])
+                self.assert_equal(content, [])
+            self.assert_equal((pc.hits, pc.misses), (2, 1))
+        finally:
+            self.app.config['ayame.page.etag'] = False
+
+    def test_get_cached_set_cookie(self):
+        # GET /cached -> OK
+        CachedPage.instances = 0
+        pc = self.app.config['ayame.page.cache']
+        pc.clear()
+        for i in five.range(1, 3):
+            environ = self.new_environ('GET', '/cached', query='message=spam&session=1')
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            self.assert_equal(status, http.OK.status)
+            self.assert_true([v for n, v in headers if n == 'Set-Cookie'])
+            self.assert_equal(CachedPage.instances, i)
+        self.assert_equal(len(pc), 0)
+
+    def test_get_cached_session(self):
+        CachedPage.instances = 0
+        pc = self.app.config['ayame.page.cache']
+        pc.clear()
+        # GET /cached with session cookie -> OK
+        for i in five.range(1, 3):
+            environ = self.new_environ('GET', '/cached', query='message=spam')
+            environ['HTTP_COOKIE'] = '{}=sid'.format(self.app.config['ayame.session.name'])
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            self.assert_equal(status, http.OK.status)
+            self.assert_equal(CachedPage.instances, i)
+        self.assert_equal((pc.hits, pc.misses), (0, 0))
+        # GET /cached?read -> OK
+        for i in five.range(3, 5):
+            environ = self.new_environ('GET', '/cached', query='message=spam&read=1')
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            self.assert_equal(status, http.OK.status)
+            self.assert_false([v for n, v in headers if n == 'Set-Cookie'])
+            self.assert_equal(CachedPage.instances, i)
+        self.assert_equal(len(pc), 0)
+
+    def test_compress(self):
+        self.app.config['ayame.compress.min_size'] = 0
+        html = self.format(SimplePage)
+        for accept, coding in (('gzip', 'gzip'),
+                               ('deflate, gzip;q=0.5', 'gzip'),
+                               ('deflate', 'deflate'),
+                               ('gzip;q=0, deflate', 'deflate'),
+                               ('*', 'gzip'),
+                               ('gzip;q=0, *;q=0', None),
+                               ('identity', None),
+                               (None, None)):
+            environ = self.new_environ('GET', '/page')
+            if accept is not None:
+                environ['HTTP_ACCEPT_ENCODING'] = accept
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            self.assert_equal(status, http.OK.status)
+            self.assert_in(('Vary', 'Accept-Encoding'), headers)
+            self.assert_equal(len(content), 1)
+            self.assert_in(('Content-Length', str(len(content[0]))), headers)
+            if coding is None:
+                self.assert_not_in('Content-Encoding', dict(headers))
+                self.assert_equal(content, [html])
+            else:
+                self.assert_in(('Content-Encoding', coding), headers)
+                if coding == 'gzip':
+                    data = gzip.GzipFile(fileobj=io.BytesIO(content[0])).read()
+                else:
+                    data = zlib.decompress(content[0])
+                self.assert_equal(data, html)
+        self.assert_equal(len(self.app.config['ayame.compress.cache']), 0)
+
+        # too small
+        self.app.config['ayame.compress.min_size'] = len(html) + 1
+        environ = self.new_environ('GET', '/page')
+        environ['HTTP_ACCEPT_ENCODING'] = 'gzip'
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        self.assert_equal(headers,
+                          [('Content-Type', 'text/html; charset=UTF-8'),
+                           ('Content-Length', str(len(html)))])
+        self.assert_equal(content, [html])
+        # disabled
+        self.app.config['ayame.compress.min_size'] = 0
+        self.app.config['ayame.compress'] = False
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        self.assert_equal(content, [html])
+
+    def test_compress_cached(self):
+        self.app.config['ayame.compress.min_size'] = 0
+        cc = self.app.config['ayame.compress.cache']
+        contents = set()
+        for _ in five.range(3):
+            environ = self.new_environ('GET', '/cached', query='message=spam')
+            environ['HTTP_ACCEPT_ENCODING'] = 'gzip'
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            self.assert_in(('Content-Encoding', 'gzip'), headers)
+            contents.add(content[0])
+        self.assert_equal(len(contents), 1)
+        self.assert_equal(len(cc), 1)
+        self.assert_equal(gzip.GzipFile(fileobj=io.BytesIO(contents.pop())).read(),
+                          self.format(SimplePage, message='spam'))
+
+    def test_compress_etag(self):
+        self.app.config['ayame.compress.min_size'] = 0
+        cc = self.app.config['ayame.compress.cache']
+        environ = self.new_environ('GET', '/page')
+        environ['HTTP_ACCEPT_ENCODING'] = 'gzip'
+        with self.application(environ):
+            headers = [('Content-Type', 'text/html; charset=UTF-8'),
+                       ('ETag', '"etag"')]
+            for body in (b'spam', b'eggs', b'spam'):
+                _, content = self.app.compress(http.OK.status, headers, [body])
+                self.assert_equal(gzip.GzipFile(fileobj=io.BytesIO(content[0])).read(), body)
+        self.assert_equal(len(cc), 2)
+
+    def test_compress_iterable(self):
+        self.app.config['ayame.compress.min_size'] = 0
+        environ = self.new_environ('GET', '/page')
+        environ['HTTP_ACCEPT_ENCODING'] = 'gzip'
+        with self.application(environ):
+            headers = [('Content-Type', 'text/html; charset=UTF-8')]
+            content = (v for v in (b'spam', b'eggs'))
+            rv = self.app.compress(http.OK.status, headers, content)
+            self.assert_equal(rv, (headers, content))
+            self.assert_equal(list(content), [b'spam', b'eggs'])
+
+    def test_compress_static(self):
+        self.app.config['ayame.compress.min_size'] = 0
+        cc = self.app.config['ayame.compress.cache']
+        html = self.format(SimplePage)
+        for _ in five.range(3):
+            environ = self.new_environ('GET', '/static')
+            environ['HTTP_ACCEPT_ENCODING'] = 'gzip'
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            self.assert_in(('Content-Encoding', 'gzip'), headers)
+            self.assert_equal(gzip.GzipFile(fileobj=io.BytesIO(content[0])).read(), html)
+        self.assert_equal(len(cc), 1)
+        # not static
+        environ = self.new_environ('GET', '/page')
+        environ['HTTP_ACCEPT_ENCODING'] = 'gzip'
+        self.wsgi_call(environ)
+        self.assert_equal(len(cc), 1)
+
+    def test_get_static(self):
+        # GET /static -> OK
+        StaticPage.instances = 0
+        html = self.format(SimplePage)
+        static = self.app.config['ayame.page.static']
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_app', 'StaticPage.html')
+        st = os.stat(path)
+        try:
+            for i in (1, 1, 2, 2):
+                if i == 2:
+                    os.utime(path, (st.st_atime, st.st_mtime + 10))
+                environ = self.new_environ('GET', '/static')
+                status, headers, exc_info, content = self.wsgi_call(environ)
+                self.assert_equal(status, http.OK.status)
+                self.assert_equal(headers,
+                                  [('Content-Type', 'text/html; charset=UTF-8'),
+                                   ('Content-Length', str(len(html)))])
+                self.assert_is_none(exc_info)
+                self.assert_equal(content, [html])
+                self.assert_equal(StaticPage.instances, i)
+                self.assert_is_not_none(static[StaticPage])
+        finally:
+            os.utime(path, (st.st_atime, st.st_mtime))
+
+        # GET /page -> OK
+        self.wsgi_call(self.new_environ('GET', '/page'))
+        self.assert_is_none(static[SimplePage])
+        # GET /redir?message=... -> OK
+        self.wsgi_call(self.new_environ('GET', '/redir', query='message=spam'))
+        self.assert_not_in(RedirectPage, static)
+
+        class Page(StaticPage):
+            def __init__(self):
+                super(Page, self).__init__()
+
+        with self.application(self.new_environ('GET', '/static')):
+            self.assert_true(StaticPage().is_static())
+            self.assert_false(Page().is_static())
+
+    def test_get_static_not_modified(self):
+        # GET /static -> OK
+        StaticPage.instances = 0
+        self.app.config['ayame.page.etag'] = True
+        environ = self.new_environ('GET', '/static')
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        etag = dict(headers)['ETag']
+        # GET /static -> NotModified
+        environ = self.new_environ('GET', '/static')
+        environ['HTTP_IF_NONE_MATCH'] = etag
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        self.assert_equal(status, http.NotModified.status)
+        self.assert_equal(headers, [('ETag', etag)])
+        self.assert_equal(content, [])
+        self.assert_equal(StaticPage.instances, 1)
+
+    def test_get_streaming(self):
+        # GET /streaming -> OK
+        StreamingPage.events = []
+        environ = self.new_environ('GET', '/streaming')
+        environ['HTTP_ACCEPT_ENCODING'] = 'gzip'
+        wsgi = {}
+
+        def start_response(status, headers, exc_info=None):
+            wsgi.update(status=status, headers=headers, exc_info=exc_info)
+
+        content = self.app(environ, start_response)
+        self.assert_not_is_instance(content, (list, tuple))
+        self.assert_equal(wsgi['status'], http.OK.status)
+        self.assert_equal(wsgi['headers'],
+                          [('Content-Type', 'text/html; charset=UTF-8')])
+        self.assert_is_none(wsgi['exc_info'])
+        self.assert_equal(StreamingPage.events, [])
+        self.assert_equal(b''.join(content), self.format(StreamingPage))
+        self.assert_equal(StreamingPage.events, [0, 1, 2])
+
+    def test_get_partial(self):
+        # GET /partial?ayame:partial=box -> OK
+        environ = self.new_environ('GET', '/partial', query='ayame:partial=box')
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        xml = self.format(PartialPage,
+                          head=u"""<ayame:head>
+      <meta name="PartialPanel"/>
+    </ayame:head>""",
+                          fragment=(u'<ayame:fragment id="box">'
+                                    u'<div><p>Hello World!</p><span>1</span><ul><li>a</li><li>b</li></ul></div>'
+                                    u'</ayame:fragment>'))
+        self.assert_equal(status, http.OK.status)
+        self.assert_equal(headers,
+                          [('Content-Type', 'application/xml; charset=UTF-8'),
+                           ('Content-Length', str(len(xml)))])
+        self.assert_is_none(exc_info)
+        self.assert_equal(content, [xml])
+        self.assert_equal(len(self.app.config['ayame.page.partial']), 1)
+
+        # GET /partial?ayame:partial=box:message -> OK
+        environ = self.new_environ('GET', '/partial', query='ayame:partial=box:message')
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        xml = self.format(PartialPage,
+                          fragment=u'<ayame:fragment id="box:message"><p>Hello World!</p></ayame:fragment>')
+        self.assert_equal(status, http.OK.status)
+        self.assert_equal(headers,
+                          [('Content-Type', 'application/xml; charset=UTF-8'),
+                           ('Content-Length', str(len(xml)))])
+        self.assert_is_none(exc_info)
+        self.assert_equal(content, [xml])
+        self.assert_equal(len(self.app.config['ayame.page.partial']), 2)
+
+        # GET /partial?ayame:partial=box&hidden -> OK
+        environ = self.new_environ('GET', '/partial', query='ayame:partial=box&hidden')
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        xml = self.format(PartialPage,
+                          fragment=u'<ayame:fragment id="box"/>')
+        self.assert_equal(status, http.OK.status)
+        self.assert_equal(headers,
+                          [('Content-Type', 'application/xml; charset=UTF-8'),
+                           ('Content-Length', str(len(xml)))])
+        self.assert_is_none(exc_info)
+        self.assert_equal(content, [xml])
+
+        # GET /partial?ayame:partial=box:message&hidden -> OK
+        environ = self.new_environ('GET', '/partial', query='ayame:partial=box:message&hidden')
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        xml = self.format(PartialPage,
+                          fragment=u'<ayame:fragment id="box:message"/>')
+        self.assert_equal(status, http.OK.status)
+        self.assert_is_none(exc_info)
+        self.assert_equal(content, [xml])
+
+        # GET /partial?ayame:partial=box:panel:count -> OK
+        environ = self.new_environ('GET', '/partial', query='ayame:partial=box:panel:count')
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        xml = self.format(PartialPage,
+                          fragment=u'<ayame:fragment id="box:panel:count"><span>1</span></ayame:fragment>')
+        self.assert_equal(status, http.OK.status)
+        self.assert_is_none(exc_info)
+        self.assert_equal(content, [xml])
+
+        # GET /partial?ayame:partial=box:items:1:item -> OK
+        environ = self.new_environ('GET', '/partial', query='ayame:partial=box:items:1:item')
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        xml = self.format(PartialPage,
+                          fragment=u'<ayame:fragment id="box:items:1:item"><li>b</li></ayame:fragment>')
+        self.assert_equal(status, http.OK.status)
+        self.assert_is_none(exc_info)
+        self.assert_equal(content, [xml])
+
+        # GET /partial?ayame:partial=spam -> NotFound
+        for path in ('spam', 'box:spam', 'box:message:spam', 'box:items:9:item'):
+            environ = self.new_environ('GET', '/partial', query='ayame:partial=' + path)
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            self.assert_equal(status, http.NotFound.status)
+            self.assert_is_none(exc_info)
+
+        # GET /partial?ayame:partial=box: -> BadRequest
+        for path in ('box:', ':box', 'box::message'):
+            environ = self.new_environ('GET', '/partial', query='ayame:partial=' + path)
+            status, headers, exc_info, content = self.wsgi_call(environ)
+            self.assert_equal(status, http.BadRequest.status)
+            self.assert_is_none(exc_info)
+
+        # GET /partial -> OK
+        environ = self.new_environ('GET', '/partial')
+        status, headers, exc_info, content = self.wsgi_call(environ)
+        self.assert_equal(status, http.OK.status)
+        self.assert_equal(headers[0], ('Content-Type', 'text/html; charset=UTF-8'))
+        self.assert_in(b'<h1>PartialPage</h1>', content[0])
+
 
 class SimplePage(ayame.Page):
 
@@ -363,3 +892,140 @@ class RedirectPage(ayame.Page):
             self.redirect(RedirectPage, {'t': 1})
         else:
             self.forward(RedirectPage)
+
+
+class PrototypePage(ayame.Page):
+
+    prototype = True
+    instances = 0
+
+    def __init__(self):
+        super(PrototypePage, self).__init__()
+        PrototypePage.instances += 1
+        self.add(basic.Label('message'))
+
+    def on_clone(self):
+        self.find('message').model = model.Model(self.request.query['message'][0])
+
+    def populate_item(self, li):
+        pass
+
+
+class StatefulPage(ayame.Page):
+
+    stateful = True
+    instances = 0
+
+    def __init__(self):
+        super(StatefulPage, self).__init__()
+        StatefulPage.instances += 1
+        self.add(basic.Label('count', model.Model(0)))
+        self.add(self.CountLink('link'))
+        self.add(basic.Label('total', TotalModel()))
+        self.find('total').visible = False
+
+    class CountLink(link.ActionLink):
+
+        def on_click(self):
+            m = self.page().find('count').model
+            m.object += 1
+            self.page().find('total').model_object
+
+
+class TotalModel(model.LoadableDetachableModel):
+
+    def load(self):
+        return 0
+
+
+class CachedPage(ayame.Page):
+
+    cache_policy = cache.CachePolicy(60, query=('message',))
+    instances = 0
+
+    def __init__(self):
+        super(CachedPage, self).__init__()
+        CachedPage.instances += 1
+        if 'session' in self.request.query:
+            self.session['message'] = ''
+        elif 'read' in self.request.query:
+            self.session.get('message')
+        self.add(basic.Label('message', self.request.query['message'][0]))
+
+
+class StaticPage(ayame.Page):
+
+    instances = 0
+
+    def __new__(cls):
+        StaticPage.instances += 1
+        return super(StaticPage, cls).__new__(cls)
+
+
+class PartialPage(ayame.Page):
+
+    html_t = u"""\
+<?xml version="1.0"?>
+<ayame:partial xmlns="{xhtml}" xmlns:ayame="{ayame}">{head}{fragment}</ayame:partial>
+"""
+    kwargs = {
+        'head': u'<ayame:head/>'
+    }
+
+    def __init__(self):
+        super(PartialPage, self).__init__()
+        self.add(basic.Label('title', u'PartialPage'))
+        box = PartialBox('box')
+        box.add(basic.Label('message', u'Hello World!'))
+        box.add(PartialPanel('panel'))
+        box.add(basic.ListView('items', [u'a', u'b'],
+                               lambda li: li.add(basic.Label('item', li.model.object))))
+        self.add(box)
+
+
+class PartialBox(ayame.MarkupContainer):
+
+    def on_configure(self):
+        super(PartialBox, self).on_configure()
+        self.visible = 'hidden' not in self.request.query
+
+
+class StreamingPage(ayame.Page):
+
+    html_t = u"""\
+<?xml version="1.0"?>
+{doctype}
+<html xmlns="{xhtml}">
+  <head>
+    <title>StreamingPage</title>
+  </head>
+  <body>
+    <ul>{items}</ul>
+  </body>
+</html>
+"""
+    kwargs = {
+        'items': lambda v=3: u''.join(u'<li><span>{}</span></li>'.format(i) for i in five.range(v))
+    }
+
+    events = []
+
+    def __init__(self):
+        super(StreamingPage, self).__init__()
+
+        def iterate():
+            for i in five.range(3):
+                StreamingPage.events.append(i)
+                yield i
+
+        def populate_item(li):
+            li.add(basic.Label('item', li.model))
+
+        self.add(basic.StreamingListView('items', iterate(), populate_item))
+
+
+class PartialPanel(panel.Panel):
+
+    def __init__(self, id):
+        super(PartialPanel, self).__init__(id)
+        self.add(basic.Label('count', model.Model(1)))
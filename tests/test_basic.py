@@ -151,6 +151,31 @@ class BasicTestCase(AyameTestCase):
         self.assert_equal(lv.children[1].model.object, 11)
         self.assert_equal(lv.children[2].model.object, 12)
 
+    def test_list_view_rerender(self):
+        def populate_item(li):
+            li.add(basic.Label('c', li.model.object))
+
+        def new_root():
+            root = markup.Element(self.of('root'),
+                                  attrib={markup.AYAME_ID: 'b'})
+            root.append(markup.Element(self.of('label'),
+                                       attrib={markup.AYAME_ID: 'c'}))
+            return root
+
+        mc = ayame.MarkupContainer('a')
+        m = model.Model(['0', '1', '2'])
+        lv = basic.ListView('b', m, populate_item)
+        mc.add(lv)
+
+        self.assert_equal(len(mc.render(new_root())), 3)
+        items = list(lv.children)
+        m.object = ['0', '1']
+        root = mc.render(new_root())
+        self.assert_equal(len(root), 2)
+        self.assert_equal(len(lv.children), 2)
+        for li in items:
+            self.assert_is_none(li.parent)
+
     def test_list_view_render_body_only(self):
         def populate_item(li):
             li.add(basic.Label('c', li.model.object))
@@ -173,6 +198,131 @@ class BasicTestCase(AyameTestCase):
         root.normalize()
         self.assert_equal(root.children, ['[0][1][2]'])
 
+    def test_list_view_row_template(self):
+        def populate_item(li):
+            li.add(basic.Label('c', li.model.object))
+            li.add(basic.Label('d', li.model.object))
+            li.find('d').render_body_only = True
+            li.add(basic.Label('e', li.model.object))
+            li.find('e').visible = li.index % 2 == 0
+            li.add(ayame.MarkupContainer('f'))
+
+        def new_root():
+            root = markup.Element(self.of('root'),
+                                  attrib={markup.AYAME_ID: 'b'})
+            root.append('[')
+            p = markup.Element(self.of('p'))
+            p.append(markup.Element(self.of('br')))
+            p.append(markup.Element(self.of('label'),
+                                    attrib={markup.AYAME_ID: 'c'}))
+            p.append(markup.Element(self.of('label'),
+                                    attrib={markup.AYAME_ID: 'd'}))
+            p.append(markup.Element(self.of('label'),
+                                    attrib={markup.AYAME_ID: 'e'}))
+            p.append(markup.Element(self.of('br')))
+            root.append(p)
+            f = markup.Element(self.of('div'),
+                               attrib={markup.AYAME_ID: 'f'})
+            f.append(markup.Element(self.of('br')))
+            root.append(f)
+            root.append(']')
+            return root
+
+        def _copy(self, element, plan, slots):
+            if element.qname == markup.DIV:
+                copied.append(element)
+            return copy(self, element, plan, slots)
+
+        class ListItem(basic._ListItem):
+            def on_render_element(self, element):
+                return super(ListItem, self).on_render_element(element)
+
+        class ListView(basic.ListView):
+            def new_item(self, index):
+                return ListItem(index, self.new_model(index))
+
+        values = [str(i) for i in five.range(3)]
+        copy = basic._RowTemplate._copy
+        for shared in (False, True):
+            with self.application(self.new_environ()):
+                self.app.config['ayame.markup.pretty'] = not shared
+                copied = []
+                basic._RowTemplate._copy = _copy
+                try:
+                    mc = ayame.MarkupContainer('a')
+                    mc.add(basic.ListView('b', values, populate_item))
+                    a = mc.render(new_root())
+                    # rows are copied from the template
+                    self.assert_equal(len(copied), 3)
+                    mc = ayame.MarkupContainer('a')
+                    mc.add(ListView('b', values, populate_item))
+                    b = mc.render(new_root())
+                    # rows are rendered by ListItem
+                    self.assert_equal(len(copied), 3)
+                finally:
+                    basic._RowTemplate._copy = copy
+                    self.app.config['ayame.markup.pretty'] = False
+            self.assert_element_equal(a, b)
+            self.assert_equal(len(a), 3 * 4)
+            self.assert_equal(len(a[1]), 5)
+            self.assert_equal(len(a[5]), 4)
+            self.assert_equal(a[2].qname, self.of('div'))
+            self.assert_equal(len(a[2]), 1)
+
+    def test_list_view_batch_loader(self):
+        def load(keys):
+            loaded.append(sorted(keys))
+            return {k: k * 2 for k in keys}
+
+        def populate_item(li):
+            li.add(basic.Label('c', loader.model(li.model.object)))
+
+        loaded = []
+        loader = model.BatchLoader(load)
+        root = markup.Element(self.of('root'),
+                              attrib={markup.AYAME_ID: 'b'})
+        label = markup.Element(self.of('label'),
+                               attrib={markup.AYAME_ID: 'c'})
+        root.append(label)
+        mc = ayame.MarkupContainer('a')
+        mc.add(basic.ListView('b', [str(i) for i in five.range(3)], populate_item))
+
+        with self.application():
+            root = mc.render(root)
+        self.assert_equal(root.qname, self.of('root'))
+        self.assert_equal(root.attrib, {})
+        self.assert_equal(len(root), 3)
+        self.assert_equal([c.children for c in root],
+                          [['00'], ['11'], ['22']])
+        self.assert_equal(loaded, [['0', '1', '2']])
+
+    def test_row_template(self):
+        div = markup.Element(markup.DIV)
+        div.append(markup.Element(self.of('p')))
+        t = basic._RowTemplate(div)
+        self.assert_equal(t.plan, None)
+
+        label = markup.Element(self.of('label'),
+                               attrib={markup.AYAME_ID: 'c'})
+        div.append(label)
+        t = basic._RowTemplate(div)
+        self.assert_equal(t.plan, [(1, t.SLOT, None)])
+
+        label.append(markup.Element(self.of('label'),
+                                    attrib={markup.AYAME_ID: 'd'}))
+        t = basic._RowTemplate(div)
+        self.assert_is_none(t.plan)
+
+        del label[:]
+        label.attrib[markup.QName(markup.AYAME_NS, 'message')] = 'title:spam'
+        t = basic._RowTemplate(div)
+        self.assert_is_none(t.plan)
+
+        div[1] = markup.Element(markup.AYAME_CONTAINER,
+                                attrib={markup.AYAME_ID: 'c'})
+        t = basic._RowTemplate(div)
+        self.assert_is_none(t.plan)
+
     def test_property_list_view(self):
         def populate_item(li):
             li.add(basic.Label('c', li.model.object))
@@ -246,6 +396,163 @@ class BasicTestCase(AyameTestCase):
         root.normalize()
         self.assert_equal(root.children, ['[0][1][2]'])
 
+    def test_streaming_list_view_empty_model(self):
+        def populate_item(li):
+            li.add(basic.Label('c', li.model.object))
+
+        root = markup.Element(self.of('root'),
+                              attrib={markup.AYAME_ID: 'b'})
+        label = markup.Element(self.of('label'),
+                               attrib={markup.AYAME_ID: 'c'})
+        root.append(label)
+        mc = ayame.MarkupContainer('a')
+        m = model.Model(None)
+        mc.add(basic.StreamingListView('b', m, populate_item))
+
+        root = mc.render(root)
+        self.assert_equal(root.qname, self.of('root'))
+        self.assert_equal(root.attrib, {})
+        self.assert_equal(root.children, [])
+
+    def test_streaming_list_view(self):
+        def populate_item(li):
+            events.append(('populate', li.index))
+            li.add(Label('c', li.model.object))
+
+        def iterate():
+            for i in five.range(3):
+                events.append(('next', i))
+                yield str(i)
+
+        class Label(basic.Label):
+            def on_render(self, element):
+                events.append(('render', self.parent.index))
+                return super(Label, self).on_render(element)
+
+        events = []
+        root = markup.Element(self.of('root'),
+                              attrib={markup.AYAME_ID: 'b'})
+        label = markup.Element(self.of('label'),
+                               attrib={markup.AYAME_ID: 'c'})
+        root.append(label)
+        mc = ayame.MarkupContainer('a')
+        lv = basic.StreamingListView('b', iterate(), populate_item)
+        mc.add(lv)
+
+        root = mc.render(root)
+        self.assert_equal(root.qname, self.of('root'))
+        self.assert_equal(root.attrib, {})
+        self.assert_equal(len(root), 3)
+
+        for i in five.range(3):
+            label = root[i]
+            self.assert_equal(label.qname, self.of('label'))
+            self.assert_equal(label.attrib, {})
+            self.assert_equal(label.children, [str(i)])
+
+        self.assert_equal(events, [('next', 0), ('populate', 0), ('render', 0),
+                                   ('next', 1), ('populate', 1), ('render', 1),
+                                   ('next', 2), ('populate', 2), ('render', 2)])
+        self.assert_is_instance(lv.model, model.Model)
+        self.assert_equal(lv.children, [])
+
+    def test_streaming_list_view_error(self):
+        root = markup.Element(self.of('root'),
+                              attrib={markup.AYAME_ID: 'b'})
+        label = markup.Element(self.of('label'),
+                               attrib={markup.AYAME_ID: 'c'})
+        root.append(label)
+        mc = ayame.MarkupContainer('a')
+        lv = basic.StreamingListView('b', (str(i) for i in five.range(3)))
+        mc.add(lv)
+
+        with self.assert_raises_regex(ayame.ComponentError,
+                                      r"\bcomponent .* 'c' .* not found\b"):
+            mc.render(root)
+        self.assert_equal(lv.children, [])
+
+    def test_streaming_list_view_render_body_only(self):
+        def populate_item(li):
+            li.add(basic.Label('c', li.model.object))
+            li.find('c').render_body_only = True
+            li.visible = li.index != 1
+
+        root = markup.Element(self.of('root'),
+                              attrib={markup.AYAME_ID: 'b'})
+        root.append('[')
+        label = markup.Element(self.of('label'),
+                               attrib={markup.AYAME_ID: 'c'})
+        root.append(label)
+        root.append(']')
+        mc = ayame.MarkupContainer('a')
+        mc.add(basic.StreamingListView('b', iter(['0', '1', '2']), populate_item))
+
+        root = mc.render(root)
+        self.assert_equal(root.qname, self.of('root'))
+        self.assert_equal(root.attrib, {})
+        self.assert_equal(len(root), 6)
+        root.normalize()
+        self.assert_equal(root.children, ['[0][2]'])
+
+    def test_lazy_container(self):
+        def populate(c):
+            calls.append(c.id)
+            c.add(basic.Label('c', 'spam'))
+
+        calls = []
+        root = markup.Element(self.of('root'),
+                              attrib={markup.AYAME_ID: 'b'})
+        label = markup.Element(self.of('label'),
+                               attrib={markup.AYAME_ID: 'c'})
+        root.append(label)
+        mc = ayame.MarkupContainer('a')
+        lc = basic.LazyContainer('b', populate=populate)
+        mc.add(lc)
+        self.assert_false(lc.populated)
+        self.assert_equal(calls, [])
+
+        root = mc.render(root)
+        self.assert_true(lc.populated)
+        self.assert_equal(calls, ['b'])
+        self.assert_equal(root.qname, self.of('root'))
+        self.assert_equal(len(root), 1)
+        self.assert_equal(root[0].children, ['spam'])
+        # populated only once
+        self.assert_is_instance(mc.find('b:c'), basic.Label)
+        self.assert_equal(calls, ['b'])
+
+    def test_lazy_container_invisible(self):
+        class LazyContainer(basic.LazyContainer):
+            def on_configure(self):
+                self.visible = False
+                super(LazyContainer, self).on_configure()
+
+            def populate(self):
+                calls.append(self.id)
+
+        calls = []
+        root = markup.Element(self.of('root'),
+                              attrib={markup.AYAME_ID: 'b'})
+        root.append(markup.Element(self.of('label'),
+                                   attrib={markup.AYAME_ID: 'c'}))
+        mc = ayame.MarkupContainer('a')
+        lc = LazyContainer('b')
+        mc.add(lc)
+
+        mc.render(root)
+        self.assert_false(lc.populated)
+        self.assert_is_none(mc.find('b:c'))
+        self.assert_equal(lc.children, [])
+        self.assert_equal(calls, [])
+
+    def test_lazy_container_find(self):
+        lc = basic.LazyContainer('a',
+                                 populate=lambda c: c.add(basic.Label('b')))
+        self.assert_is(lc.find(''), lc)
+        self.assert_false(lc.populated)
+        self.assert_is_instance(lc.find('b'), basic.Label)
+        self.assert_true(lc.populated)
+
     def test_context_path_generator(self):
         def assert_a(path, value):
             a = markup.Element(self.html_of('a'))
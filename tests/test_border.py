@@ -591,6 +591,28 @@ class BorderTestCase(AyameTestCase):
                            ('Content-Length', str(len(html)))])
         self.assert_equal(content, [html])
 
+    def test_feedback_field_border_configure(self):
+        with self.application(self.new_environ()):
+            # nested in container
+            f = form.Form('form')
+            f.add(ayame.MarkupContainer('box'))
+            f.find('box').add(border.FeedbackFieldBorder('field'))
+            f.find('box:field').add(form.TextField('text'))
+            b = f.find('box:field')
+            b.on_configure()
+            self.assert_false(b.find('feedback').visible)
+            b.find('field_body:text').error = 'error'
+            b.on_configure()
+            self.assert_true(b.find('feedback').visible)
+            self.assert_equal(b.find('feedback').model_object, 'error')
+            # not attached to Form
+            b = border.FeedbackFieldBorder('field')
+            b.add(form.TextField('text'))
+            b.find('field_body:text').error = 'error'
+            b.on_configure()
+            self.assert_true(b.find('feedback').visible)
+            self.assert_equal(b.find('feedback').model_object, 'error')
+
     def test_render_ayame_message(self):
         with self.application(self.new_environ(accept='en')):
             p = TomatoPage()
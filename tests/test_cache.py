@@ -0,0 +1,152 @@
+#
+# test_cache
+#
+#   Copyright (c) 2011-2014 Akinori Hattori <hattya@gmail.com>
+#
+#   Permission is hereby granted, free of charge, to any person
+#   obtaining a copy of this software and associated documentation files
+#   (the "Software"), to deal in the Software without restriction,
+#   including without limitation the rights to use, copy, modify, merge,
+#   publish, distribute, sublicense, and/or sell copies of the Software,
+#   and to permit persons to whom the Software is furnished to do so,
+#   subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be
+#   included in all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#   EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#   MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+#   NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+#   BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+#   ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+#   CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#   SOFTWARE.
+#
+
+
+import threading
+import time
+
+from ayame import cache
+from base import AyameTestCase
+
+
+class CacheTestCase(AyameTestCase):
+
+    def test_cache_policy(self):
+        p = cache.CachePolicy()
+        self.assert_is_none(p.ttl)
+        self.assert_true(p.values)
+        self.assert_equal(p.query, ())
+        self.assert_false(p.locale)
+        self.assert_equal(p.headers, ())
+
+        p = cache.CachePolicy(60, False, ['q'], True, ['Accept'])
+        self.assert_equal(p.ttl, 60)
+        self.assert_false(p.values)
+        self.assert_equal(p.query, ('q',))
+        self.assert_true(p.locale)
+        self.assert_equal(p.headers, ('Accept',))
+
+    def test_output_cache(self):
+        c = cache.OutputCache(2)
+        self.assert_equal(c.cap, 2)
+        self.assert_equal(len(c), 0)
+        self.assert_is_none(c.get('a'))
+        self.assert_equal(c.get('a', 0), 0)
+        self.assert_equal((c.hits, c.misses), (0, 2))
+
+        c.put('a', 1)
+        c.put('b', 2, 60)
+        self.assert_equal(len(c), 2)
+        self.assert_in('a', c)
+        self.assert_equal(c.get('a'), 1)
+        self.assert_equal(c.get('b'), 2)
+        self.assert_equal((c.hits, c.misses), (2, 2))
+        # bounded
+        c.put('c', 3)
+        self.assert_equal(len(c), 2)
+        self.assert_not_in('a', c)
+
+        c.remove('b')
+        c.remove('b')
+        self.assert_not_in('b', c)
+
+        c.clear()
+        self.assert_equal(len(c), 0)
+        self.assert_equal((c.hits, c.misses), (0, 0))
+
+        c.cap = 1
+        self.assert_equal(c.cap, 1)
+
+    def test_output_cache_expired(self):
+        c = cache.OutputCache()
+        c.put('a', 1, -1)
+        self.assert_in('a', c)
+        self.assert_is_none(c.get('a'))
+        self.assert_not_in('a', c)
+        self.assert_equal((c.hits, c.misses), (0, 1))
+
+    def test_fetch(self):
+        def func():
+            calls.append(1)
+            return len(calls)
+
+        calls = []
+        c = cache.OutputCache()
+        self.assert_equal(c.fetch('a', func), 1)
+        self.assert_equal(c.fetch('a', func), 1)
+        self.assert_equal(calls, [1])
+        # not cacheable
+        self.assert_equal(c.fetch('b', func, cacheable=lambda v: False), 2)
+        self.assert_equal(c.fetch('b', func, cacheable=lambda v: False), 3)
+        self.assert_not_in('b', c)
+        # error
+        with self.assert_raises(ZeroDivisionError):
+            c.fetch('c', lambda: 1 // 0)
+        self.assert_equal(c.fetch('c', func), 4)
+
+    def test_fetch_single_flight(self):
+        def leader():
+            started.set()
+            release.wait()
+            calls.append('leader')
+            return 'spam'
+
+        def follower():
+            calls.append('follower')
+            return 'eggs'
+
+        def run(func):
+            results.append(c.fetch('a', func))
+
+        c = cache.OutputCache(timeout=10)
+        calls = []
+        results = []
+        started = threading.Event()
+        release = threading.Event()
+        threads = [threading.Thread(target=run, args=(leader,))]
+        threads[0].start()
+        started.wait()
+        for _ in range(3):
+            t = threading.Thread(target=run, args=(follower,))
+            t.start()
+            threads.append(t)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assert_equal(calls, ['leader'])
+        self.assert_equal(results, ['spam'] * 4)
+
+    def test_fetch_timeout(self):
+        c = cache.OutputCache(timeout=0.01)
+        self.assert_true(c.begin('a'))
+        self.assert_equal(c.fetch('a', lambda: 'spam'), 'spam')
+        # abandoned flight is taken over
+        self.assert_true(c.begin('b'))
+        time.sleep(0.02)
+        self.assert_true(c.begin('b'))
+        c.end('b')
+        c.end('b')
+        c.end('a')
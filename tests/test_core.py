@@ -24,9 +24,12 @@
 #   SOFTWARE.
 #
 
+import datetime
+import hashlib
+
 import ayame
 from ayame import _compat as five
-from ayame import basic, http, markup, model
+from ayame import basic, core, http, markup, model
 from base import AyameTestCase
 
 
@@ -54,6 +57,8 @@ class CoreTestCase(AyameTestCase):
             c.request
         with self.assert_raises(ayame.AyameError):
             c.session
+        with self.assert_raises(ayame.AyameError):
+            c.request_cache
         with self.assert_raises(ayame.AyameError):
             c.forward(c)
         with self.assert_raises(ayame.AyameError):
@@ -204,6 +209,22 @@ class CoreTestCase(AyameTestCase):
         mc.visible = False
         self.assert_is_none(mc.render(''))
 
+    def test_render_detach(self):
+        class LoadableDetachableModel(model.LoadableDetachableModel):
+            def load(self):
+                return 'value'
+
+        root = markup.Element(self.of('root'))
+        c = ayame.Component('a', LoadableDetachableModel())
+        c.add(ayame.AttributeModifier('class', LoadableDetachableModel()))
+        self.assert_equal(c.model_object, 'value')
+        self.assert_true(c.model.attached)
+        root = c.render(root)
+        self.assert_equal(root.attrib, {self.of('class'): 'value'})
+        # released after rendering
+        self.assert_false(c.model.attached)
+        self.assert_false(c.behaviors[0]._model.attached)
+
     def test_render_no_child_component(self):
         root = markup.Element(self.of('root'))
         mc = ayame.MarkupContainer('a')
@@ -1259,6 +1280,126 @@ class CoreTestCase(AyameTestCase):
         self.assert_equal(p.path(), '')
         self.assert_equal(p.find('message').path(), 'message')
 
+    def test_page_etag(self):
+        class SpamPage(ayame.Page):
+            html_t = """\
+<?xml version="1.0"?>
+{doctype}
+<html xmlns="{xhtml}">
+  <head>
+    <title>SpamPage</title>
+  </head>
+  <body>
+    <p>Hello World!</p>
+  </body>
+</html>
+"""
+
+            def __init__(self):
+                super(SpamPage, self).__init__()
+                self.add(basic.Label('message', 'Hello World!'))
+
+        html = self.format(SpamPage)
+        etag = '"{}"'.format(hashlib.sha1(html).hexdigest())
+        self.app.config['ayame.page.etag'] = True
+        try:
+            with self.application(self.new_environ()):
+                p = SpamPage()
+                status, headers, content = p()
+            self.assert_equal(status, http.OK.status)
+            self.assert_equal(headers,
+                              [('Content-Type', 'text/html; charset=UTF-8'),
+                               ('Content-Length', str(len(html))),
+                               ('ETag', etag)])
+            self.assert_equal(content, [html])
+
+            for v in (etag, 'W/' + etag, '"spam", ' + etag, '*'):
+                environ = self.new_environ()
+                environ['HTTP_IF_NONE_MATCH'] = v
+                with self.application(environ):
+                    p = SpamPage()
+                    status, headers, content = p()
+                self.assert_equal(status, http.NotModified.status)
+                self.assert_equal(headers, [('ETag', etag)])
+                self.assert_equal(content, [])
+
+            # mismatch
+            environ = self.new_environ()
+            environ['HTTP_IF_NONE_MATCH'] = '"spam"'
+            with self.application(environ):
+                p = SpamPage()
+                status, headers, content = p()
+            self.assert_equal(status, http.OK.status)
+            self.assert_equal(content, [html])
+            # fire component
+            environ = self.new_environ(query='{path}=message')
+            environ['HTTP_IF_NONE_MATCH'] = etag
+            with self.application(environ):
+                p = SpamPage()
+                status, headers, content = p()
+            self.assert_equal(status, http.OK.status)
+            self.assert_equal(content, [html])
+        finally:
+            self.app.config['ayame.page.etag'] = False
+
+    def test_page_validators(self):
+        class SpamPage(ayame.Page):
+            def __init__(self):
+                super(SpamPage, self).__init__()
+                self.add(basic.Label('message', 'Hello World!'))
+
+            def validators(self):
+                calls.append(1)
+                return '"spam"', datetime.datetime(2014, 1, 1, 12, 0, 0)
+
+        calls = []
+        lm = 'Wed, 01 Jan 2014 12:00:00 GMT'
+        with self.application(self.new_environ()):
+            p = SpamPage()
+            status, headers, content = p()
+        self.assert_equal(status, http.OK.status)
+        self.assert_equal(headers[:2],
+                          [('ETag', '"spam"'),
+                           ('Last-Modified', lm)])
+        self.assert_true(content)
+
+        for n, v, status in (('IF_NONE_MATCH', '"spam"', http.NotModified.status),
+                             ('IF_NONE_MATCH', '"eggs"', http.OK.status),
+                             ('IF_MODIFIED_SINCE', lm, http.NotModified.status),
+                             ('IF_MODIFIED_SINCE', 'Wed, 01 Jan 2014 13:00:00 GMT', http.NotModified.status),
+                             ('IF_MODIFIED_SINCE', 'Wed, 01 Jan 2014 11:00:00 GMT', http.OK.status),
+                             ('IF_MODIFIED_SINCE', 'spam', http.OK.status)):
+            environ = self.new_environ()
+            environ['HTTP_' + n] = v
+            with self.application(environ):
+                p = SpamPage()
+                self.assert_equal(p()[0], status)
+        # POST
+        environ = self.new_environ(method='POST', data='')
+        environ['HTTP_IF_NONE_MATCH'] = '"spam"'
+        with self.application(environ):
+            p = SpamPage()
+            self.assert_equal(p()[0], http.OK.status)
+        self.assert_equal(len(calls), 8)
+
+    def test_deterministic_id(self):
+        def new_ids():
+            mc = ayame.MarkupContainer('a')
+            mc.add(ayame.MarkupContainer('b'))
+            return [core._new_id(mc), core._new_id(mc.find('b'))]
+
+        self.assert_not_equal(new_ids(), new_ids())
+        with self.application():
+            self.assert_not_equal(new_ids(), new_ids())
+            self.app.config['ayame.markup.deterministic_id'] = True
+            try:
+                ids = new_ids()
+                self.assert_equal(ids, new_ids())
+                self.assert_not_equal(ids[0], ids[1])
+                self.assert_equal(len(ids[0]), 7)
+            finally:
+                self.app.config['ayame.markup.deterministic_id'] = False
+
     def test_behavior(self):
         b = ayame.Behavior()
         with self.assert_raises(ayame.AyameError):
@@ -1271,6 +1412,8 @@ class CoreTestCase(AyameTestCase):
             b.request
         with self.assert_raises(ayame.AyameError):
             b.session
+        with self.assert_raises(ayame.AyameError):
+            b.request_cache
         with self.assert_raises(ayame.AyameError):
             b.forward(b)
         with self.assert_raises(ayame.AyameError):
@@ -1278,6 +1421,20 @@ class CoreTestCase(AyameTestCase):
         with self.assert_raises(ayame.AyameError):
             b.uri_for(b)
 
+    def test_request_cache(self):
+        c = ayame.Component('a')
+        b = ayame.Behavior()
+        c.add(b)
+        m = model.Model(None)
+        with self.application():
+            cache = self.app.context.request_cache
+            self.assert_is(self.app.request_cache, cache)
+            self.assert_is(c.request_cache, cache)
+            self.assert_is(b.request_cache, cache)
+            self.assert_is(m.request_cache, cache)
+            cache['a'] = 1
+        self.assert_equal(cache, {})
+
     def test_behavior_render(self):
         class Behavior(ayame.Behavior):
             def on_before_render(self, component):
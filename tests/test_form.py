@@ -25,6 +25,7 @@
 #
 
 import datetime
+import json
 
 import ayame
 from ayame import _compat as five
@@ -127,6 +128,72 @@ class FormTestCase(AyameTestCase):
                                           '^b1$'):
                 f.submit()
 
+    def test_form_components(self):
+        query = ('{path}=form&'
+                 'text=text')
+        with self.application(self.new_environ(query=query)):
+            f = Form('form')
+            f.add(form.TextField('text'))
+            f._method = 'GET'
+            components = f._components()
+            self.assert_equal([(c.id, name) for c, name, _ in components],
+                              [('text', 'text')])
+            self.assert_is(f._components(), components)
+
+            mc = ayame.MarkupContainer('mc')
+            f.add(mc)
+            self.assert_is_not(f._components(), components)
+            components = f._components()
+            fc = form.TextField('field')
+            fc.required = True
+            mc.add(fc)
+            self.assert_is_not(f._components(), components)
+            self.assert_equal([(c.id, name) for c, name, _ in f._components()],
+                              [('text', 'text'),
+                               ('field', 'mc:field')])
+            with self.assert_raises_regex(Invalid,
+                                          '^form$'):
+                f.submit()
+            self.assert_true(f.has_error())
+            self.assert_equal(f.errors, [fc])
+
+            mc.remove(fc)
+            self.assert_is_none(fc.parent)
+            self.assert_equal([(c.id, name) for c, name, _ in f._components()],
+                              [('text', 'text')])
+            with self.assert_raises_regex(Valid,
+                                          '^form$'):
+                f.submit()
+            self.assert_false(f.has_error())
+            self.assert_equal(f.errors, [])
+
+            # components of nested Form
+            mc.add(Form('nested'))
+            components = f._components()
+            mc.find('nested').add(form.TextField('text'))
+            self.assert_is(f._components(), components)
+            self.assert_equal([(c.id, name) for c, name, _ in components],
+                              [('text', 'text'),
+                               ('nested', None)])
+
+    def test_form_error(self):
+        with self.application(self.new_environ()):
+            f = Form('form')
+            f.add(ayame.MarkupContainer('mc'))
+            f.find('mc').add(form.TextField('text'))
+            self.assert_false(f.has_error())
+            # set directly
+            f.find('mc:text').error = 'error'
+            self.assert_true(f.has_error())
+            self.assert_equal(f.errors, [f.find('mc:text')])
+            f.find('mc:text').error = None
+            self.assert_false(f.has_error())
+            self.assert_equal(f.errors, [])
+            # not attached to Form
+            fc = form.TextField('text')
+            fc.error = 'error'
+            self.assert_equal(fc.error, 'error')
+
     def test_form(self):
         with self.application(self.new_environ()):
             p = SpamPage()
@@ -310,6 +377,100 @@ class FormTestCase(AyameTestCase):
                                                'button': 'submitted'})
             self.assert_false(f.has_error())
 
+    def test_form_validate(self):
+        query = ('{path}=form&'
+                 'ayame:validate&'
+                 'text=text&'
+                 'area=area&'
+                 'button')
+        with self.application(self.new_environ(query=query)):
+            p = SpamPage()
+            p.find('form:password').required = True
+            p.find('form:hidden').required = True
+            status, headers, content = p()
+            f = p.find('form')
+            self.assert_equal(f.model_object, {'text': '',
+                                               'password': '',
+                                               'hidden': '',
+                                               'area': 'Hello World!\n',
+                                               'checkbox': True,
+                                               'file': None})
+            self.assert_false(f.has_error())
+        self.assert_equal(status, http.OK.status)
+        self.assert_equal(headers,
+                          [('Content-Type', 'application/json; charset=UTF-8'),
+                           ('Content-Length', str(len(content[0])))])
+        self.assert_equal(json.loads(content[0].decode('utf-8')),
+                          {'valid': False,
+                           'errors': [{'path': 'form:password',
+                                       'name': 'password',
+                                       'keys': ['Required'],
+                                       'message': "'password' is required"},
+                                      {'path': 'form:hidden',
+                                       'name': 'hidden',
+                                       'keys': ['Required'],
+                                       'message': "'hidden' is required"}]})
+
+        query = ('{path}=form:text&'
+                 'ayame:validate&'
+                 'text=text')
+        with self.application(self.new_environ(query=query)):
+            p = SpamPage()
+            p.find('form:text').required = True
+            p.find('form:password').required = True
+            status, headers, content = p()
+            self.assert_equal(p.find('form:text').model_object, '')
+        self.assert_equal(status, http.OK.status)
+        self.assert_equal(json.loads(content[0].decode('utf-8')),
+                          {'valid': True,
+                           'errors': []})
+
+        query = ('{path}=form:legend&'
+                 'ayame:validate')
+        with self.application(self.new_environ(query=query)):
+            p = SpamPage()
+            with self.assert_raises(http.BadRequest) as cm:
+                p()
+        self.assert_regex(cm.exception.description, r"'form:legend' cannot be validated")
+
+        query = ('{path}=form:spam&'
+                 'ayame:validate')
+        with self.application(self.new_environ(query=query)):
+            p = SpamPage()
+            with self.assert_raises(http.NotFound):
+                p()
+
+        with self.application(self.new_environ(query='ayame:validate')):
+            p = SpamPage()
+            with self.assert_raises(http.BadRequest):
+                p()
+
+    def test_form_component_on_check(self):
+        with self.application(self.new_environ(query='text=')):
+            f = form.Form('form')
+            f.add(ayame.MarkupContainer('box'))
+            f.find('box').add(form.TextField('text', model.Model(u'')))
+            f.find('box:text').required = True
+            errors = f.find('box:text').on_check()
+            self.assert_equal([e.keys for e in errors], [['Required']])
+            # not attached to Form
+            self.assert_is_none(form.TextField('text').on_check())
+
+    def test_form_component_check(self):
+        with self.application(self.new_environ()):
+            fc = form.FormComponent('a', model.Model(u''))
+            fc.required = True
+            fc.type = int
+
+            o, e = fc.check(None)
+            self.assert_is_none(o)
+            self.assert_equal(e.keys, ['Required'])
+            o, e = fc.check('1')
+            self.assert_equal(o, 1)
+            self.assert_is_none(e)
+            self.assert_is_none(fc.error)
+            self.assert_equal(fc.model_object, u'')
+
     def test_form_component_relative_path(self):
         f = form.Form('a')
         f.add(form.FormComponent('b1'))
@@ -628,6 +789,16 @@ class FormTestCase(AyameTestCase):
         self.assert_true(s)
         self.assert_false(s[0].isdigit())
 
+        with self.application():
+            self.app.config['ayame.markup.deterministic_id'] = True
+            try:
+                s = fc._id_prefix_for(markup.Element(markup.DIV))
+                self.assert_equal(fc._id_prefix_for(markup.Element(markup.DIV)), s)
+                self.assert_true(s.startswith('ayame-'))
+                self.assert_not_equal(form.Choice('b')._id_prefix_for(markup.Element(markup.DIV)), s)
+            finally:
+                self.app.config['ayame.markup.deterministic_id'] = False
+
     def test_radio_choice(self):
         with self.application(self.new_environ()):
             p = EggsPage()
@@ -938,6 +1109,61 @@ class FormTestCase(AyameTestCase):
             f = p.find('form')
             self.assert_equal(f.model_object, {'select': p.choices[:2]})
 
+    def test_select_choice_options(self):
+        class SelectChoice(form.SelectChoice):
+            def render_element(self, element, index, choice):
+                return element
+
+        def render(fc):
+            element = markup.Element(form._SELECT)
+            return fc.on_render(element).children
+
+        def html(options):
+            renderer = markup.MarkupRenderer()
+            m = markup.Markup()
+            m.lang = 'xml'
+            m.root = markup.Element(form._SELECT, ns={'': markup.XHTML_NS})
+            m.root.extend(options)
+            return renderer.render(None, m)
+
+        choices = ['a', 'b', '<c>']
+        with self.application(self.new_environ()):
+            self.app.config['ayame.markup.pretty'] = False
+            try:
+                f = form.Form('form')
+                f.add(form.SelectChoice('fast', model.Model('b'), choices))
+                f.add(SelectChoice('slow', model.Model('b'), choices))
+                fast = f.find('fast')
+                slow = f.find('slow')
+
+                options = render(fast)
+                self.assert_equal([o.attrib[form._VALUE] for o in options],
+                                  ['0', '1', '2'])
+                self.assert_equal([form._SELECTED in o.attrib for o in options],
+                                  [False, True, False])
+                self.assert_equal(options[2].children, ['&lt;c&gt;'])
+                self.assert_equal(html(options), html(render(slow)))
+                # shared options
+                fast.model_object = slow.model_object = 'a'
+                self.assert_is(render(fast)[2], options[2])
+                self.assert_is_not(render(fast)[1], options[1])
+                # modified in place
+                choices[0] = 'z'
+                options = render(fast)
+                self.assert_equal(options[0].children, ['z'])
+                self.assert_not_in(form._SELECTED, options[0].attrib)
+                choices.append('d')
+                self.assert_equal(len(render(fast)), 4)
+                self.assert_equal(html(render(fast)), html(render(slow)))
+                # value lookup
+                self.assert_equal(fast.convert(['3']), 'd')
+                fast.multiple = True
+                self.assert_equal(fast.convert(['3', '0']), ['z', 'd'])
+                with self.assert_raises(ayame.ValidationError):
+                    fast.convert(['0', '4'])
+            finally:
+                self.app.config['ayame.markup.pretty'] = True
+
     def test_select_choice_single(self):
         for class_ in (ToastPage, BeansPage):
             with self.application(self.new_environ()):
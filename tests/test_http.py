@@ -24,6 +24,8 @@
 #   SOFTWARE.
 #
 
+import datetime
+
 import ayame
 from ayame import http
 from base import AyameTestCase
@@ -62,6 +64,22 @@ class HTTPTestCase(AyameTestCase):
         self.assert_equal(http.parse_accept('ja, en, q=0.7'),
                           (('ja', 1.0), ('en', 1.0), ('q=0.7', 1.0)))
 
+    def test_parse_etags(self):
+        self.assert_equal(http.parse_etags(None), ())
+        self.assert_equal(http.parse_etags(''), ())
+        self.assert_equal(http.parse_etags('"spam"'), ('"spam"',))
+        self.assert_equal(http.parse_etags('"spam", W/"eggs" ,'), ('"spam"', '"eggs"'))
+        self.assert_equal(http.parse_etags('*'), ('*',))
+
+    def test_date(self):
+        self.assert_is_none(http.parse_date(None))
+        self.assert_is_none(http.parse_date('spam'))
+        self.assert_equal(http.parse_date('Thu, 01 Jan 1970 00:00:00 GMT'), 0)
+        self.assert_equal(http.parse_date('Wed, 01 Jan 2014 12:00:00 GMT'), 1388577600)
+        self.assert_equal(http.format_date(1388577600), 'Wed, 01 Jan 2014 12:00:00 GMT')
+        self.assert_equal(http.format_date(datetime.datetime(2014, 1, 1, 12)),
+                          'Wed, 01 Jan 2014 12:00:00 GMT')
+
     def test_parse_form_data_empty(self):
         self.assert_equal(http.parse_form_data(self.new_environ()), {})
         self.assert_equal(http.parse_form_data(self.new_environ(data='')), {})
@@ -140,6 +158,75 @@ class HTTPTestCase(AyameTestCase):
         with self.assert_raises(http.RequestTimeout):
             http.parse_form_data(environ)
 
+    def test_parse_form_data_chunked(self):
+        data = self.form_data(('x', '-1'),
+                              ('y', u'\u767e'),
+                              ('a', ('a.txt', 'spam\r\neggs\r\n--ham\r\n', 'text/plain; charset=utf-8')),
+                              ('z', ''))
+        chunk_size = http._MultipartParser.chunk_size
+        try:
+            for n in (1, 3, 7, 64):
+                http._MultipartParser.chunk_size = n
+                form_data = http.parse_form_data(self.new_environ(form=data))
+                self.assert_equal(sorted(form_data), ['a', 'x', 'y', 'z'])
+                self.assert_equal(form_data['x'], ['-1'])
+                self.assert_equal(form_data['y'], [u'\u767e'])
+                self.assert_equal(form_data['z'], [''])
+                a = form_data['a'][0]
+                self.assert_is_instance(a, http.FileUpload)
+                self.assert_equal(a.type, 'text/plain')
+                self.assert_equal(a.type_options, {'charset': 'utf-8'})
+                self.assert_equal(a.value, b'spam\r\neggs\r\n--ham\r\n')
+                self.assert_equal(a.file.read(), b'spam\r\neggs\r\n--ham\r\n')
+        finally:
+            http._MultipartParser.chunk_size = chunk_size
+
+    def test_parse_form_data_spool(self):
+        data = self.form_data(('a', ('a.txt', 'spam', 'text/plain')),
+                              ('b', ('b.txt', 'spam\neggs\nham\n', 'text/plain')))
+        form_data = http.parse_form_data(self.new_environ(form=data), spool_size=8)
+        self.assert_false(form_data['a'][0].file._rolled)
+        self.assert_true(form_data['b'][0].file._rolled)
+        self.assert_equal(form_data['b'][0].value, b'spam\neggs\nham\n')
+
+    def test_parse_form_data_filename(self):
+        data = self.form_data(('a', ('a;b\\"c".txt', '', 'text/plain')))
+        data = data.replace('\\"c"', '\\\\\\"c\\"')
+        form_data = http.parse_form_data(self.new_environ(form=data))
+        self.assert_equal(form_data['a'][0].filename, 'a;b\\"c".txt')
+
+    def test_parse_form_data_http_413(self):
+        data = 'x=-1&y=-1&y=-2'
+        environ = self.new_environ(data=data)
+        with self.assert_raises(http.RequestEntityTooLarge):
+            http.parse_form_data(environ, max_size=len(data) - 1)
+        environ = self.new_environ(data=data)
+        with self.assert_raises(http.RequestEntityTooLarge):
+            http.parse_form_data(environ, max_parts=2)
+        environ = self.new_environ(data=data)
+        with self.assert_raises(http.RequestEntityTooLarge):
+            http.parse_form_data(environ, max_field_size=1)
+        environ = self.new_environ(data=data)
+        self.assert_equal(http.parse_form_data(environ, max_size=len(data), max_parts=3, max_field_size=2),
+                          {'x': ['-1'],
+                           'y': ['-1', '-2']})
+
+        data = self.form_data(('x', '-1'),
+                              ('y', '-1'),
+                              ('a', ('a.txt', 'spam', 'text/plain')))
+        environ = self.new_environ(form=data)
+        with self.assert_raises(http.RequestEntityTooLarge):
+            http.parse_form_data(environ, max_size=len(data) - 1)
+        environ = self.new_environ(form=data)
+        with self.assert_raises(http.RequestEntityTooLarge):
+            http.parse_form_data(environ, max_parts=2)
+        environ = self.new_environ(form=data)
+        with self.assert_raises(http.RequestEntityTooLarge):
+            http.parse_form_data(environ, max_field_size=1)
+        environ = self.new_environ(form=data)
+        form_data = http.parse_form_data(environ, max_size=len(data), max_parts=3, max_field_size=2)
+        self.assert_equal(form_data['a'][0].value, b'spam')
+
     def test_http_status(self):
         args = (0, '', ayame.AyameError)
         self.assert_status_class(http.HTTPStatus, *args)
@@ -357,6 +444,21 @@ class HTTPTestCase(AyameTestCase):
         assert_4xx(http.RequestTimeout(headers), headers)
         self.assert_equal(headers, [])
 
+    def test_http_413(self):
+        args = (413, 'Request Entity Too Large', http.HTTPClientError)
+        self.assert_status_class(http.RequestEntityTooLarge, *args)
+
+        def assert_4xx(st, headers):
+            self.assert_status_class(st, *args[:-1])
+            self.assert_equal(st.headers, headers)
+            self.assert_is_not(st.headers, headers)
+            self.assert_true(st.description)
+
+        headers = []
+        assert_4xx(http.RequestEntityTooLarge(), headers)
+        assert_4xx(http.RequestEntityTooLarge(headers), headers)
+        self.assert_equal(headers, [])
+
     def test_http_500(self):
         args = (500, 'Internal Server Error', http.HTTPServerError)
         self.assert_status_class(http.InternalServerError, *args)
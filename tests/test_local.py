@@ -56,3 +56,39 @@ class LocalTestCase(AyameTestCase):
             local.context()
         with self.assert_raises(ayame.AyameError):
             local.app()
+
+    def test_request_cache(self):
+        ctx = local.push(0, 1)
+        self.assert_equal(ctx.request_cache, {})
+        ctx.request_cache['a'] = 1
+
+        self.assert_is(local.pop(), ctx)
+        self.assert_equal(ctx.request_cache, {})
+
+    def test_memoize(self):
+        calls = []
+
+        @local.memoize
+        def f(*args, **kwargs):
+            calls.append((args, kwargs))
+            return len(calls)
+
+        self.assert_equal(f.__name__, 'f')
+        # no context
+        self.assert_equal(f(1), 1)
+        self.assert_equal(f(1), 2)
+
+        ctx = local.push(0, 1)
+        self.assert_equal(f(1), 3)
+        self.assert_equal(f(1), 3)
+        self.assert_equal(f(1, a=2), 4)
+        self.assert_equal(f(1, a=2), 4)
+        # unhashable
+        self.assert_equal(f([]), 5)
+        self.assert_equal(f([]), 6)
+        self.assert_equal(len(ctx.request_cache), 2)
+        local.pop()
+
+        local.push(0, 1)
+        self.assert_equal(f(1), 7)
+        local.pop()
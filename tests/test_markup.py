@@ -709,6 +709,54 @@ class MarkupRendererTestCase(AyameTestCase):
         m.root.append(u'\n')
         self.assert_equal(renderer.render(self, m), xml)
 
+    def test_render_stream(self):
+        def iterate():
+            for i in five.range(3):
+                events.append(i)
+                eggs = markup.Element(markup.QName(u'spam', u'eggs'),
+                                      type=markup.Element.OPEN)
+                eggs.append(five.str(i))
+                yield eggs
+
+        renderer = markup.MarkupRenderer()
+        xml = (b'<?xml version="1.0"?>\n'
+               b'<spam xmlns="spam"><eggs>0</eggs><eggs>1</eggs><eggs>2</eggs></spam>\n')
+
+        def new_markup():
+            m = markup.Markup()
+            m.xml_decl = {'version': u'1.0'}
+            m.lang = 'xml'
+            m.root = markup.Element(markup.QName(u'spam', u'spam'),
+                                    type=markup.Element.OPEN,
+                                    ns={u'': u'spam'})
+            m.root.append(markup.Stream(iterate()))
+            return m
+
+        # nodes are generated while rendering
+        events = []
+        it = renderer.iter_render(self, new_markup(), chunk_size=16)
+        self.assert_equal(events, [])
+        chunks = []
+        for chunk in it:
+            chunks.append(chunk)
+            if len(chunks) == 1:
+                self.assert_less(len(events), 3)
+        self.assert_equal(events, [0, 1, 2])
+        self.assert_greater(len(chunks), 1)
+        self.assert_equal(b''.join(chunks), xml)
+
+        events = []
+        self.assert_equal(renderer.render(self, new_markup()), xml)
+        self.assert_equal(events, [0, 1, 2])
+
+        # expand
+        m = new_markup()
+        m.root.expand()
+        self.assert_equal(len(m.root), 3)
+        self.assert_equal([eggs.children for eggs in m.root],
+                          [[u'0'], [u'1'], [u'2']])
+        self.assert_equal(renderer.render(self, m), xml)
+
     def test_render_xhtml1(self):
         renderer = markup.MarkupRenderer()
         html = self.format(u"""\
@@ -25,6 +25,7 @@
 #
 
 import ayame
+from ayame import _compat as five
 from ayame import model
 from base import AyameTestCase
 
@@ -189,3 +190,92 @@ class ModelTestCase(AyameTestCase):
                                       '^c$'):
             setattr(mc.find('b:c').model, 'object', '')
         self.assert_equal(mc.render(''), '')
+
+    def test_loadable_detachable_model(self):
+        class LoadableDetachableModel(model.LoadableDetachableModel):
+            def load(self):
+                loaded.append(True)
+                return 'value'
+
+        with self.assert_raises(TypeError):
+            model.LoadableDetachableModel()
+
+        loaded = []
+        m = LoadableDetachableModel()
+        self.assert_false(m.attached)
+        self.assert_equal(loaded, [])
+
+        self.assert_equal(m.object, 'value')
+        self.assert_true(m.attached)
+        self.assert_equal(m.object, 'value')
+        self.assert_equal(loaded, [True])
+
+        m.detach()
+        self.assert_false(m.attached)
+        self.assert_equal(m.object, 'value')
+        self.assert_equal(loaded, [True, True])
+
+        m.detach()
+        m.object = 'new_value'
+        self.assert_true(m.attached)
+        self.assert_equal(m.object, 'new_value')
+        self.assert_equal(loaded, [True, True])
+
+    def test_batch_loader(self):
+        def load(keys):
+            loaded.append(sorted(keys))
+            return {k: k.upper() for k in keys if k != 'x'}
+
+        loaded = []
+        loader = model.BatchLoader(load)
+        a = loader.model('a')
+        b = loader.model('b')
+        x = loader.model('x')
+        a2 = loader.model('a')
+        self.assert_is_instance(a, model.LoadableDetachableModel)
+        self.assert_equal(a.key, 'a')
+        self.assert_equal(loaded, [])
+        self.assert_not_in('a', loader)
+
+        self.assert_equal(b.object, 'B')
+        self.assert_equal(a.object, 'A')
+        self.assert_equal(a2.object, 'A')
+        self.assert_is_none(x.object)
+        self.assert_equal(loaded, [['a', 'b', 'x']])
+        self.assert_in('a', loader)
+        self.assert_in('x', loader)
+
+        # memoized
+        self.assert_equal(loader.model('b').object, 'B')
+        self.assert_equal(loader.get('a'), 'A')
+        self.assert_equal(loaded, [['a', 'b', 'x']])
+
+        c = loader.model('c')
+        self.assert_equal(loader.get('d'), 'D')
+        self.assert_equal(c.object, 'C')
+        self.assert_equal(loaded, [['a', 'b', 'x'], ['c', 'd']])
+
+        loader.load()
+        self.assert_equal(len(loaded), 2)
+
+        loader.clear()
+        self.assert_not_in('a', loader)
+        self.assert_equal(loader.get('a'), 'A')
+        self.assert_equal(loaded, [['a', 'b', 'x'], ['c', 'd'], ['a']])
+
+    def test_batch_loader_per_request(self):
+        def load(keys):
+            loaded.append(sorted(keys))
+            return {k: k.upper() for k in keys}
+
+        loaded = []
+        loader = model.BatchLoader(load)
+        a = loader.model('a')
+        for i in five.range(2):
+            with self.application(self.new_environ()):
+                self.assert_not_in('a', loader)
+                self.assert_equal(a.object, 'A')
+                self.assert_equal(loader.get('a'), 'A')
+                self.assert_in('a', loader)
+            self.assert_equal(len(loaded), i + 1)
+        self.assert_not_in('a', loader)
@@ -53,3 +53,20 @@ class PageTestCase(AyameTestCase):
                            ('Content-Length', '852')])
         self.assert_true(content)
         self.assert_not_in(b'<p>', content[0])
+
+    def test_render_error(self):
+        errors = [http.Found('http://localhost/'),
+                  http.NotModified(),
+                  http.NotFound('/a'),
+                  http.NotFound('/b'),
+                  http.MethodNotAllowed('PUT', '/a', ['GET', 'POST'])]
+        with self.application(self.new_environ()):
+            cache = self.app.config['ayame.page.error']
+            for e in errors:
+                self.assert_equal(self.app.render_error(e),
+                                  page.HTTPStatusPage(e)())
+            self.assert_equal(len(cache), 4)
+            for e in errors:
+                self.assert_equal(self.app.render_error(e),
+                                  page.HTTPStatusPage(e)())
+            self.assert_equal(len(cache), 4)
@@ -551,6 +551,54 @@ class PanelTestCase(AyameTestCase):
                            ('Content-Length', str(len(html)))])
         self.assert_equal(content, [html])
 
+    def test_cached_panel(self):
+        CheesePanel.count = 0
+        self.app.config['ayame.panel.cache'].clear()
+        for accept, count in (('en', 1),
+                              ('en', 1),
+                              ('ja', 2),
+                              ('en', 1)):
+            with self.application(self.new_environ(accept=accept)):
+                p = CheesePage()
+                status, headers, content = p()
+            html = self.format(CheesePage, count=count)
+            self.assert_equal(status, http.OK.status)
+            self.assert_equal(content, [html])
+        self.assert_equal(CheesePanel.count, 2)
+        pc = self.app.config['ayame.panel.cache']
+        self.assert_equal(len(pc), 2)
+        self.assert_equal((pc.hits, pc.misses), (2, 2))
+        # children are not built
+        self.assert_equal(p.find('panel').children, [])
+
+    def test_cached_panel_flight(self):
+        CheesePanel.count = 0
+        pc = self.app.config['ayame.panel.cache']
+        pc.clear()
+        timeout = pc.timeout
+        pc.timeout = 0.01
+        try:
+            # invisible
+            with self.application(self.new_environ(accept='en')):
+                p = BriePage()
+                status, headers, content = p()
+                key = p.find('box:panel').cache_key()
+            self.assert_equal(status, http.OK.status)
+            self.assert_true(pc.begin(key))
+            pc.end(key)
+            # render error
+            CheesePanel.error = True
+            with self.application(self.new_environ(accept='en')):
+                p = CheesePage()
+                with self.assert_raises(ZeroDivisionError):
+                    p()
+            self.assert_true(pc.begin(key))
+            pc.end(key)
+            self.assert_equal(len(pc), 0)
+        finally:
+            CheesePanel.error = False
+            pc.timeout = timeout
+
 
 class MarkupContainer(ayame.MarkupContainer):
 
@@ -632,3 +680,51 @@ class ShallotsPage(ayame.Page):
         self.find('form').add(form.TextField('text'))
         self.find('form:text').required = True
         self.add(panel.FeedbackPanel('panel'))
+
+
+class CheesePage(ayame.Page):
+
+    html_t = u"""\
+<?xml version="1.0"?>
+{doctype}
+<html xmlns="{xhtml}">
+  <head>
+    <title>CheesePage</title>
+    <meta name="CheesePanel" />
+  </head>
+  <body>
+    <p>{count}</p>
+  </body>
+</html>
+"""
+
+    def __init__(self):
+        super(CheesePage, self).__init__()
+        self.add(CheesePanel('panel'))
+
+
+class BriePage(ayame.Page):
+
+    def __init__(self):
+        super(BriePage, self).__init__()
+        self.add(ayame.MarkupContainer('box'))
+        self.find('box').add(CheesePanel('panel'))
+        self.find('box').visible = False
+
+
+class CheesePanel(panel.CachedPanel):
+
+    count = 0
+    error = False
+
+    def populate(self):
+        CheesePanel.count += 1
+        self.add(CheeseLabel('count', str(CheesePanel.count)))
+
+
+class CheeseLabel(basic.Label):
+
+    def on_render(self, element):
+        if CheesePanel.error:
+            raise ZeroDivisionError
+        return super(CheeseLabel, self).on_render(element)
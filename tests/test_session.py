@@ -0,0 +1,587 @@
+#
+# test_session
+#
+#   Copyright (c) 2015 Akinori Hattori <hattya@gmail.com>
+#
+#   Permission is hereby granted, free of charge, to any person
+#   obtaining a copy of this software and associated documentation files
+#   (the "Software"), to deal in the Software without restriction,
+#   including without limitation the rights to use, copy, modify, merge,
+#   publish, distribute, sublicense, and/or sell copies of the Software,
+#   and to permit persons to whom the Software is furnished to do so,
+#   subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be
+#   included in all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#   EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#   MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+#   NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+#   BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+#   ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+#   CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#   SOFTWARE.
+#
+
+
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+
+import ayame
+from ayame import session
+from base import AyameTestCase
+
+
+class SessionTestCase(AyameTestCase):
+
+    def setup(self):
+        super(SessionTestCase, self).setup()
+        self.path = tempfile.mkdtemp()
+        self.app = ayame.Ayame(__name__)
+        self.app.config['ayame.session.store'] = self.Store(self.path, 'ayame_%s.sess')
+
+    def teardown(self):
+        super(SessionTestCase, self).teardown()
+        shutil.rmtree(self.path)
+
+    def new_environ(self, sid=None):
+        environ = super(SessionTestCase, self).new_environ()
+        if sid is not None:
+            environ['HTTP_COOKIE'] = 'session_id=' + sid
+        return environ
+
+    def test_session(self):
+        # not loaded
+        sess = session.get(self.app, self.new_environ())
+        self.assert_is_instance(sess, session.SessionProxy)
+        self.assert_false(sess.loaded)
+        self.assert_is_none(session.save(self.app, sess))
+        self.assert_equal(self.app.config['ayame.session.store'].loads, 0)
+        self.assert_equal(os.listdir(self.path), [])
+        # not modified
+        sess = session.get(self.app, self.new_environ())
+        self.assert_not_in('a', sess)
+        self.assert_true(sess.loaded)
+        self.assert_true(sess.new)
+        self.assert_false(sess.modified)
+        self.assert_is_none(session.save(self.app, sess))
+        self.assert_equal(os.listdir(self.path), [])
+        # modified
+        sess = session.get(self.app, self.new_environ())
+        sess['a'] = 1
+        self.assert_true(sess.modified)
+        name, value = session.save(self.app, sess)
+        self.assert_equal(name, 'Set-Cookie')
+        self.assert_true(value.startswith('session_id=' + sess.sid + ';'))
+        self.assert_equal(os.listdir(self.path), ['ayame_{}.sess'.format(sess.sid)])
+        sid = sess.sid
+        # restore
+        sess = session.get(self.app, self.new_environ(sid))
+        self.assert_false(sess.loaded)
+        self.assert_equal(dict(sess), {'a': 1})
+        self.assert_equal(sess.sid, sid)
+        self.assert_false(sess.new)
+        self.assert_is_none(session.save(self.app, sess))
+        # force to save
+        sess = session.get(self.app, self.new_environ(sid))
+        sess.modified = True
+        self.assert_true(sess.session.modified)
+        self.assert_is_not_none(session.save(self.app, sess))
+
+    def test_exists(self):
+        self.assert_false(session.exists(self.app, self.new_environ()))
+        self.assert_true(session.exists(self.app, self.new_environ('sid')))
+        environ = self.new_environ()
+        environ['HTTP_COOKIE'] = 'spam=eggs'
+        self.assert_false(session.exists(self.app, environ))
+
+    def test_persist(self):
+        class Store(self.Store):
+            def persist(self, session, max_age):
+                persisted.append((dict(session), max_age))
+                return 'spam'
+
+        persisted = []
+        self.app.config['ayame.session.store'] = Store(self.path, 'ayame_%s.sess')
+        self.app.config['ayame.session.max_age'] = 60
+        sess = session.get(self.app, self.new_environ())
+        sess['a'] = 1
+        name, value = session.save(self.app, sess)
+        self.assert_equal(name, 'Set-Cookie')
+        self.assert_true(value.startswith('session_id=spam;'))
+        self.assert_equal(persisted, [({'a': 1}, 60)])
+        self.assert_equal(os.listdir(self.path), [])
+
+    def test_session_proxy(self):
+        sess = session.get(self.app, self.new_environ())
+        self.assert_equal(repr(sess), '<SessionProxy (not loaded)>')
+        sess['a'] = 1
+        self.assert_equal(sess['a'], 1)
+        self.assert_equal(sess.get('a'), 1)
+        self.assert_equal(len(sess), 1)
+        self.assert_equal(list(sess), ['a'])
+        self.assert_equal(sess, {'a': 1})
+        self.assert_not_equal(sess, {})
+        self.assert_equal(repr(sess), repr(sess.session))
+        del sess['a']
+        self.assert_not_in('a', sess)
+        with self.assert_raises(TypeError):
+            hash(sess)
+
+    def test_sharded_session_store(self):
+        st = session.ShardedSessionStore(self.path, 'ayame_%s.sess')
+        sess = st.new()
+        sess['a'] = 1
+        st.save(sess)
+        path = st.get_session_filename(sess.sid)
+        self.assert_true(os.path.exists(path))
+        dirs = os.path.relpath(path, self.path).split(os.sep)[:-1]
+        self.assert_equal(len(dirs), 2)
+        self.assert_true(all(len(d) == 2 for d in dirs))
+        self.assert_equal(st.list(), [sess.sid])
+        self.assert_equal(st.get(sess.sid), {'a': 1})
+        st.delete(sess)
+        self.assert_false(os.path.exists(path))
+        self.assert_equal(st.list(), [])
+        # flat
+        st.levels = 0
+        self.assert_equal(os.path.dirname(st.get_session_filename(sess.sid)), self.path)
+        st.save(sess)
+        self.assert_equal(st.list(), [sess.sid])
+        # saved before sharding
+        flat = st.get_session_filename(sess.sid)
+        st.levels = 2
+        self.assert_equal(st.list(), [sess.sid])
+        self.assert_equal(st.get(sess.sid), {'a': 1})
+        self.assert_false(os.path.exists(flat))
+        self.assert_true(os.path.exists(path))
+        self.assert_equal(st.list(), [sess.sid])
+        # unpicklable
+        sess['b'] = lambda: 0
+        with self.assert_raises((pickle.PicklingError, TypeError, AttributeError)):
+            st.save(sess)
+        self.assert_equal(st.get(sess.sid), {'a': 1})
+        # not writable
+        st.delete(sess)
+        del sess['b']
+        os.rmdir(os.path.dirname(path))
+        with open(os.path.dirname(path), 'w'):
+            pass
+        with self.assert_raises((IOError, OSError)):
+            st.save(sess)
+        self.assert_equal(st.list(), [])
+
+    def test_sharded_session_store_sweep(self):
+        st = session.ShardedSessionStore(self.path, 'ayame_%s.sess')
+        now = time.time()
+        sids = []
+        for i in range(4):
+            sess = st.new()
+            st.save(sess)
+            sids.append(sess.sid)
+            if i % 2:
+                os.utime(st.get_session_filename(sess.sid), (now - 120,) * 2)
+        # not session file
+        page = os.path.join(self.path, 'ayame_spam.page')
+        with open(page, 'w'):
+            pass
+        os.utime(page, (now - 120,) * 2)
+
+        sleep = time.sleep
+        delays = []
+        try:
+            time.sleep = delays.append
+            self.assert_equal(st.sweep(60, rate=1), 2)
+        finally:
+            time.sleep = sleep
+        self.assert_equal(len(delays), 4)
+        self.assert_true(all(0 < d <= 4 for d in delays))
+        self.assert_equal(sorted(st.list()), sorted(sids[::2]))
+        self.assert_true(os.path.exists(page))
+        # stopped
+        stop = threading.Event()
+        stop.set()
+        self.assert_equal(st.sweep(0, stop=stop), 0)
+        self.assert_equal(len(st.list()), 2)
+
+    def test_sharded_session_store_sweeper(self):
+        st = session.ShardedSessionStore(self.path, 'ayame_%s.sess', sweep_interval=0.01)
+        self.app.config['ayame.session.store'] = st
+        try:
+            sess = session.get(self.app, self.new_environ())
+            sess['a'] = 1
+            session.save(self.app, sess)
+            self.assert_equal(threading.active_count(), 1)
+            # sweep
+            self.app.config['ayame.session.max_age'] = 60
+            sess = session.get(self.app, self.new_environ())
+            sess['a'] = 1
+            session.save(self.app, sess)
+            self.assert_equal(threading.active_count(), 2)
+            old = st.list()
+            now = time.time()
+            for sid in old:
+                if sid != sess.sid:
+                    os.utime(st.get_session_filename(sid), (now - 120,) * 2)
+            for _ in range(100):
+                if st.list() == [sess.sid]:
+                    break
+                time.sleep(0.01)
+            self.assert_equal(st.list(), [sess.sid])
+        finally:
+            st.close()
+        self.assert_equal(threading.active_count(), 1)
+
+    def test_lru_session_store(self):
+        st = session.LRUSessionStore(self.path, 'ayame_%s.sess', cap=2, interval=60)
+        self.assert_equal(st.cap, 2)
+        path_of = st.get_session_filename
+        try:
+            a = st.new()
+            a['a'] = 1
+            st.save(a)
+            self.assert_equal(len(st), 1)
+            self.assert_in(a.sid, st)
+            self.assert_false(os.path.exists(path_of(a.sid)))
+            self.assert_equal(st.list(), [a.sid])
+            # copy of cached session
+            sess = st.get(a.sid)
+            self.assert_equal(sess, {'a': 1})
+            self.assert_false(sess.new)
+            self.assert_false(sess.modified)
+            sess['a'] = 2
+            self.assert_equal(st.get(a.sid), {'a': 1})
+            # flush
+            st.flush()
+            self.assert_true(os.path.exists(path_of(a.sid)))
+            # evict
+            b = st.new()
+            b['b'] = 2
+            st.save(b)
+            c = st.new()
+            st.save(c)
+            self.assert_equal(len(st), 2)
+            self.assert_not_in(a.sid, st)
+            self.assert_equal(sorted(st.list()), sorted([a.sid, b.sid, c.sid]))
+            # restore
+            self.assert_equal(st.get(a.sid), {'a': 1})
+            self.assert_in(a.sid, st)
+            self.assert_not_in(b.sid, st)
+            # evicted dirty session
+            self.assert_equal(st.get(b.sid), {'b': 2})
+            # missing
+            sid = st.generate_key()
+            self.assert_equal(st.get(sid), {})
+            self.assert_not_in(sid, st)
+            # invalid
+            self.assert_not_equal(st.get('spam').sid, 'spam')
+            # delete
+            st.delete(a)
+            self.assert_not_in(a.sid, st)
+            self.assert_false(os.path.exists(path_of(a.sid)))
+            self.assert_equal(st.get(a.sid), {})
+        finally:
+            st.close()
+        self.assert_true(os.path.exists(path_of(b.sid)))
+        self.assert_true(os.path.exists(path_of(c.sid)))
+        # closed
+        d = st.new()
+        d['d'] = 4
+        st.save(d)
+        self.assert_true(os.path.exists(path_of(d.sid)))
+
+        st = session.LRUSessionStore(self.path, 'ayame_%s.sess')
+        self.assert_equal(st.get(d.sid), {'d': 4})
+
+    def test_lru_session_store_writer(self):
+        st = session.LRUSessionStore(self.path, 'ayame_%s.sess', interval=60, batch_size=2)
+        path_of = st.get_session_filename
+        handler = logging.NullHandler()
+        logger = logging.getLogger('ayame.session')
+        logger.addHandler(handler)
+        try:
+            a = st.new()
+            st.save(a)
+            b = st.new()
+            b['b'] = lambda: 0
+            st.save(b)
+            c = st.new()
+            st.save(c)
+            for _ in range(100):
+                if sorted(st.list()) == sorted([a.sid, c.sid]):
+                    break
+                time.sleep(0.01)
+            # unpicklable session is discarded
+            self.assert_equal(sorted(st.list()), sorted([a.sid, c.sid]))
+            self.assert_true(os.path.exists(path_of(a.sid)))
+            self.assert_false(os.path.exists(path_of(b.sid)))
+            self.assert_false(os.path.exists(path_of(c.sid)))
+        finally:
+            st.close()
+            logger.removeHandler(handler)
+        self.assert_true(os.path.exists(path_of(c.sid)))
+        self.assert_equal(threading.active_count(), 1)
+
+    def test_lru_session_store_write_error(self):
+        class LRUSessionStore(session.LRUSessionStore):
+            def _dump(self, sid, data):
+                if 'error' in data:
+                    raise IOError(sid)
+                super(LRUSessionStore, self)._dump(sid, data)
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                records.append(record)
+
+        records = []
+        handler = Handler()
+        logger = logging.getLogger('ayame.session')
+        logger.addHandler(handler)
+        st = LRUSessionStore(self.path, 'ayame_%s.sess', interval=60)
+        try:
+            a = st.new()
+            a['error'] = True
+            st.save(a)
+            b = st.new()
+            st.save(b)
+            st.flush()
+            self.assert_equal(st.list(), [b.sid])
+            # dropped session is logged
+            self.assert_equal(len(records), 1)
+            self.assert_in(a.sid, records[0].getMessage())
+            self.assert_is(records[0].exc_info[0], IOError)
+        finally:
+            st.close()
+            logger.removeHandler(handler)
+        self.assert_equal(threading.active_count(), 1)
+
+    def cookie_of(self, set_cookie):
+        self.assert_equal(set_cookie[0], 'Set-Cookie')
+        return set_cookie[1].split(';', 1)[0].split('=', 1)[1]
+
+    def test_cookie_session_store(self):
+        st = session.CookieSessionStore('secret')
+        self.app.config['ayame.session.store'] = st
+        # new
+        sess = session.get(self.app, self.new_environ())
+        self.assert_true(sess.new)
+        sess['a'] = 1
+        value = self.cookie_of(session.save(self.app, sess))
+        self.assert_equal(os.listdir(self.path), [])
+        # restore
+        sid = sess.sid
+        sess = session.get(self.app, self.new_environ(value))
+        self.assert_equal(sess, {'a': 1})
+        self.assert_equal(sess.sid, sid)
+        self.assert_false(sess.new)
+        self.assert_false(sess.session.stored)
+        self.assert_is_none(session.save(self.app, sess))
+        # tampered
+        payload, mac = value.split('.')
+        for v in ('', 'spam', payload, '.' + mac, payload[:-1] + '.' + mac, value + 'A', value + '.' + mac):
+            sess = st.get(v)
+            self.assert_true(sess.new)
+            self.assert_not_equal(sess.sid, sid)
+        # compressed
+        sess = st.new()
+        sess['a'] = 'a' * 1000
+        self.assert_less(len(st.dumps(sess)), 1000)
+        self.assert_equal(st.get(st.dumps(sess)), {'a': 'a' * 1000})
+        st.compress = False
+        self.assert_greater(len(st.dumps(sess)), 1000)
+        self.assert_equal(st.get(st.dumps(sess)), {'a': 'a' * 1000})
+        # too large
+        st.max_size = 100
+        with self.assert_raises(ayame.AyameError):
+            st.dumps(sess)
+        # expired
+        st.max_size = 4000
+        st.max_age = 60
+        sess = st.new()
+        value = st.dumps(sess)
+        self.assert_equal(st.get(value).sid, sess.sid)
+        time_ = time.time
+        try:
+            time.time = lambda: time_() + 61
+            self.assert_not_equal(st.get(value).sid, sess.sid)
+        finally:
+            time.time = time_
+
+        with self.assert_raises(ayame.AyameError):
+            session.CookieSessionStore(())
+
+    def test_cookie_session_store_rotation(self):
+        old = session.CookieSessionStore('old')
+        sess = old.new()
+        sess['a'] = 1
+        value = old.dumps(sess)
+
+        st = session.CookieSessionStore(['new', 'old'])
+        self.assert_equal(st.get(value), {'a': 1})
+        self.assert_equal(st.get(value).sid, sess.sid)
+        # signed by new key
+        self.assert_equal(st.get(st.dumps(sess)).sid, sess.sid)
+        self.assert_not_equal(old.get(st.dumps(sess)).sid, sess.sid)
+
+        st = session.CookieSessionStore(['new'])
+        self.assert_not_equal(st.get(value).sid, sess.sid)
+
+    def test_cookie_session_store_fallback(self):
+        fallback = session.FileSystemSessionStore(self.path, 'ayame_%s.sess')
+        st = session.CookieSessionStore(b'secret', fallback=fallback, max_size=200)
+        path = fallback.get_session_filename
+        # small
+        sess = st.new()
+        sess['a'] = 1
+        value = st.dumps(sess)
+        self.assert_false(sess.stored)
+        self.assert_false(os.path.exists(path(sess.sid)))
+        # large
+        sess['b'] = os.urandom(256)
+        value = st.dumps(sess)
+        self.assert_less_equal(len(value), 200)
+        self.assert_true(sess.stored)
+        self.assert_true(os.path.exists(path(sess.sid)))
+        restored = st.get(value)
+        self.assert_equal(restored, dict(sess))
+        self.assert_equal(restored.sid, sess.sid)
+        self.assert_true(restored.stored)
+        # small again
+        del restored['b']
+        value = st.dumps(restored)
+        self.assert_false(restored.stored)
+        self.assert_false(os.path.exists(path(sess.sid)))
+        self.assert_equal(st.get(value), {'a': 1})
+        # delete
+        sess = st.get(st.dumps(sess))
+        st.delete(sess)
+        self.assert_false(os.path.exists(path(sess.sid)))
+
+    def test_sqlite_session_store(self):
+        # no default database in the shared temporary directory
+        with self.assert_raises(TypeError):
+            session.SQLiteSessionStore()
+
+        path = os.path.join(self.path, 'session.db')
+        st = session.SQLiteSessionStore(path)
+        other = session.SQLiteSessionStore(path)
+        try:
+            sess = st.new()
+            sess['a'] = 1
+            st.save(sess)
+            self.assert_equal(st.list(), [sess.sid])
+            # shared with other processes
+            restored = other.get(sess.sid)
+            self.assert_equal(restored, {'a': 1})
+            self.assert_equal(restored.sid, sess.sid)
+            self.assert_false(restored.new)
+            restored['b'] = 2
+            other.save(restored)
+            self.assert_equal(st.get(sess.sid), {'a': 1, 'b': 2})
+            # WAL mode
+            with st._connect() as conn:
+                self.assert_equal(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            # missing
+            sid = st.generate_key()
+            self.assert_equal(st.get(sid), {})
+            self.assert_equal(st.get(sid).sid, sid)
+            st.renew_missing = True
+            self.assert_not_equal(st.get(sid).sid, sid)
+            # invalid
+            self.assert_not_equal(st.get('spam').sid, 'spam')
+            # delete
+            st.delete(sess)
+            self.assert_equal(st.list(), [])
+            self.assert_equal(other.get(sess.sid), {})
+        finally:
+            st.close()
+            other.close()
+
+    def test_sqlite_session_store_pool(self):
+        st = session.SQLiteSessionStore(os.path.join(self.path, 'session.db'), pool_size=1)
+        try:
+            with st._connect() as a:
+                with st._connect() as b:
+                    self.assert_is_not(a, b)
+            with st._connect() as c:
+                self.assert_is(c, b)
+            with st._connect() as c:
+                self.assert_is(c, b)
+            # discarded on error
+            with self.assert_raises(ValueError):
+                with st._connect() as c:
+                    raise ValueError()
+            with st._connect() as c:
+                self.assert_is_not(c, b)
+        finally:
+            st.close()
+
+    def test_sqlite_session_store_expire(self):
+        st = session.SQLiteSessionStore(os.path.join(self.path, 'session.db'), max_age=60, expire_batch=2)
+        time_ = time.time
+        try:
+            now = time.time()
+            time.time = lambda: now
+            sids = []
+            for _ in range(5):
+                sess = st.new()
+                st.save(sess)
+                sids.append(sess.sid)
+            self.assert_equal(sorted(st.list()), sorted(sids))
+            time.time = lambda: now + 61
+            self.assert_equal(st.get(sids[0]), {})
+            self.assert_equal(len(st.list()), 5)
+            # one batch per save
+            sess = st.new()
+            st.save(sess)
+            self.assert_equal(len(st.list()), 4)
+            st.save(sess)
+            self.assert_equal(len(st.list()), 4)
+            # all
+            st.expire()
+            self.assert_equal(st.list(), [sess.sid])
+        finally:
+            time.time = time_
+            st.close()
+
+    def test_sqlite_session_store_cache(self):
+        path = os.path.join(self.path, 'session.db')
+        st = session.SQLiteSessionStore(path, cache=2, cache_ttl=60)
+        other = session.SQLiteSessionStore(path)
+        try:
+            sess = st.new()
+            sess['a'] = 1
+            st.save(sess)
+            restored = other.get(sess.sid)
+            restored['a'] = 2
+            other.save(restored)
+            # cached
+            self.assert_equal(st.get(sess.sid), {'a': 1})
+            st.get(sess.sid)['a'] = 3
+            self.assert_equal(st.get(sess.sid), {'a': 1})
+            st.cache_ttl = 0
+            self.assert_equal(st.get(sess.sid), {'a': 2})
+            st.delete(sess)
+            st.cache_ttl = 60
+            self.assert_equal(st.get(sess.sid), {})
+        finally:
+            st.close()
+            other.close()
+
+    class Store(session.FileSystemSessionStore):
+
+        loads = 0
+
+        def new(self):
+            self.loads += 1
+            return super(SessionTestCase.Store, self).new()
+
+        def get(self, sid):
+            self.loads += 1
+            return super(SessionTestCase.Store, self).get(sid)
@@ -0,0 +1,166 @@
+#
+# test_store
+#
+#   Copyright (c) 2011-2014 Akinori Hattori <hattya@gmail.com>
+#
+#   Permission is hereby granted, free of charge, to any person
+#   obtaining a copy of this software and associated documentation files
+#   (the "Software"), to deal in the Software without restriction,
+#   including without limitation the rights to use, copy, modify, merge,
+#   publish, distribute, sublicense, and/or sell copies of the Software,
+#   and to permit persons to whom the Software is furnished to do so,
+#   subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be
+#   included in all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+#   EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+#   MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+#   NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+#   BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+#   ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+#   CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#   SOFTWARE.
+#
+
+
+import os
+import shutil
+import tempfile
+
+from ayame import store
+from base import AyameTestCase
+
+
+class StoreTestCase(AyameTestCase):
+
+    def setup(self):
+        super(StoreTestCase, self).setup()
+        self.path = tempfile.mkdtemp()
+
+    def teardown(self):
+        super(StoreTestCase, self).teardown()
+        shutil.rmtree(self.path)
+
+    def test_page_store(self):
+        # no default directory in the shared temporary directory
+        with self.assert_raises(TypeError):
+            store.PageStore()
+
+        ps = store.PageStore(self.path, 2)
+        self.assert_equal(ps.cap, 2)
+        self.assert_equal(len(ps), 0)
+        page_id = ps.new_id()
+        self.assert_true(ps.is_valid_id(page_id))
+
+        ps.put('sid', page_id, {'a': 1})
+        self.assert_equal(len(ps), 1)
+        self.assert_in(('sid', page_id), ps)
+        # checkout
+        self.assert_equal(ps.get('sid', page_id), {'a': 1})
+        self.assert_is_none(ps.get('sid', page_id))
+        self.assert_equal(len(ps), 0)
+
+    def test_page_store_spill(self):
+        ps = store.PageStore(self.path, 1)
+        ps.put('sid', 'a', {'a': 1})
+        ps.put('sid', 'b', {'b': 2})
+        self.assert_equal(len(ps), 1)
+        self.assert_not_in(('sid', 'a'), ps)
+        self.assert_true(os.path.exists(ps.path_for(('sid', 'a'))))
+
+        self.assert_equal(ps.get('sid', 'a'), {'a': 1})
+        self.assert_false(os.path.exists(ps.path_for(('sid', 'a'))))
+        self.assert_is_none(ps.get('sid', 'a'))
+        self.assert_equal(ps.get('sid', 'b'), {'b': 2})
+
+        ps.put('sid', 'a', {'a': 1})
+        ps.cap = 0
+        self.assert_equal(len(ps), 0)
+        self.assert_true(os.path.exists(ps.path_for(('sid', 'a'))))
+        ps.remove('sid', 'a')
+        self.assert_false(os.path.exists(ps.path_for(('sid', 'a'))))
+        self.assert_is_none(ps.get('sid', 'a'))
+
+    def test_page_store_spill_unlocked(self):
+        class Page(object):
+            def __getstate__(self):
+                # pickled without holding the lock
+                events.append(ps.get('sid', 'a') is self)
+                return {}
+
+        events = []
+        ps = store.PageStore(self.path, 1)
+        ps.put('sid', 'a', Page())
+        ps.put('sid', 'b', {'b': 2})
+        self.assert_equal(events, [True])
+        # checked out while spilling
+        self.assert_false(os.path.exists(ps.path_for(('sid', 'a'))))
+        self.assert_is_none(ps.get('sid', 'a'))
+        self.assert_equal(os.listdir(self.path), [])
+
+    def test_page_store_load_unlocked(self):
+        ps = LockPage.store = store.PageStore(self.path, 1)
+        ps.put('sid', 'a', LockPage())
+        ps.put('sid', 'b', {'b': 2})
+        self.assert_true(os.path.exists(ps.path_for(('sid', 'a'))))
+
+        p = ps.get('sid', 'a')
+        self.assert_is_instance(p, LockPage)
+        # unpickled without holding the lock
+        self.assert_false(p.locked)
+        self.assert_equal(os.listdir(self.path), [])
+
+    def test_page_store_sweep(self):
+        ps = store.PageStore(self.path, 1, max_age=60)
+        ps.put('sid', 'a', {'a': 1})
+        ps.put('sid', 'b', {'b': 2})
+        ps.put('sid', 'c', {'c': 3})
+        path = ps.path_for(('sid', 'a'))
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime - 61))
+        other = os.path.join(self.path, 'spam')
+        with open(other, 'w'):
+            pass
+        os.utime(other, (st.st_atime, st.st_mtime - 61))
+
+        self.assert_equal(ps.sweep(), 1)
+        self.assert_false(os.path.exists(path))
+        self.assert_true(os.path.exists(ps.path_for(('sid', 'b'))))
+        self.assert_true(os.path.exists(other))
+        self.assert_is_none(ps.get('sid', 'a'))
+        self.assert_equal(ps.get('sid', 'b'), {'b': 2})
+
+        ps.max_age = None
+        self.assert_equal(ps.sweep(), 0)
+
+    def test_page_store_unpicklable(self):
+        ps = store.PageStore(self.path, 1)
+        ps.put('sid', 'a', {'a': lambda: None})
+        ps.put('sid', 'b', {'b': 2})
+        self.assert_false(os.path.exists(ps.path_for(('sid', 'a'))))
+        self.assert_is_none(ps.get('sid', 'a'))
+        self.assert_equal(os.listdir(self.path), [])
+
+    def test_page_store_invalid_id(self):
+        ps = store.PageStore(self.path)
+        for sid, page_id in (('sid', '../a'),
+                             ('../sid', 'a'),
+                             ('sid', ''),
+                             (None, 'a')):
+            ps.put(sid, page_id, {})
+            self.assert_is_none(ps.get(sid, page_id))
+            ps.remove(sid, page_id)
+        self.assert_equal(len(ps), 0)
+
+
+class LockPage(object):
+
+    store = None
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.locked = LockPage.store._PageStore__lock.locked()
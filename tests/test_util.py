@@ -132,6 +132,13 @@ class UtilTestCase(AyameTestCase):
         b = util.new_token()
         self.assert_not_equal(a, b)
 
+    def test_token_of(self):
+        a = util.token_of('a')
+        self.assert_equal(a, util.token_of(u'a'))
+        self.assert_equal(len(a), 40)
+        self.assert_not_equal(a, util.token_of('b'))
+        self.assert_equal(len(util.token_of('a', 'md5')), 32)
+
     def test_iterable(self):
         self.assert_true(util.iterable(()))
         self.assert_true(util.iterable([]))